@@ -0,0 +1,157 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+from time import perf_counter
+from typing import Awaitable, Callable
+from ariadne import QueryType, make_executable_schema
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.requests import Request
+from backend.src.platform.api.blocking import BlockingExecutor
+from backend.src.platform.isolationEngine.async_session import (
+    AsyncSessionManager,
+    async_url,
+)
+from backend.src.platform.isolationEngine.routing import RouteCache
+from backend.src.platform.isolationEngine.types import InitEnvRequest
+from backend.src.services.linear.api.graphql_linear import GraphQLWithSession
+from .common import (
+    build_core,
+    create_platform,
+    create_template,
+    drop_schemas,
+    engine_from_env,
+    summary,
+)
+from .routing import QUERY
+
+# the Linear GraphQL request path (token -> route -> resolver query -> commit
+# -> close) through GraphQLWithSession.handle_request, with the environment
+# lookup on sync sessions through BlockingExecutor or awaited on AsyncSession,
+# per number of concurrent clients
+
+query = QueryType()
+
+
+@query.field("messages")
+def resolve_messages(_, info) -> int:
+    return len(info.context["session"].execute(QUERY).all())
+
+
+SCHEMA = make_executable_schema("type Query { messages: Int! }", query)
+BODY = json.dumps({"query": "{ messages }"}).encode()
+
+
+async def graphql_request(app: GraphQLWithSession, token: str) -> None:
+    async def receive():
+        return {"type": "http.request", "body": BODY, "more_body": False}
+
+    request = Request(
+        {
+            "type": "http",
+            "method": "POST",
+            "path": "/graphql",
+            "query_string": b"",
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"authorization", token.encode()),
+            ],
+        },
+        receive,
+    )
+    response = await app.handle_request(request)
+    result = json.loads(bytes(response.body))
+    if response.status_code != 200 or "errors" in result:
+        raise RuntimeError(f"request failed: {result}")
+
+
+async def drive(
+    request: Callable[[str], Awaitable[None]],
+    tokens: list[str],
+    clients: int,
+    requests: int,
+) -> tuple[list[float], float]:
+    timings: list[float] = []
+
+    async def client(n: int) -> None:
+        for i in range(requests // clients):
+            started = perf_counter()
+            await request(tokens[(n + i) % len(tokens)])
+            timings.append(perf_counter() - started)
+
+    started = perf_counter()
+    await asyncio.gather(*(client(n) for n in range(clients)))
+    return timings, perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", default="16,64,256")
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--environments", type=int, default=50)
+    parser.add_argument("--pool-size", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+
+    engine = engine_from_env(pool_size=args.pool_size, max_overflow=0)
+    create_platform(engine)
+    drop_schemas(engine, "bench_")
+    drop_schemas(engine, "state_")
+    core = build_core(engine, routes=RouteCache(ttl_seconds=60))
+    template = "bench_tpl"
+    create_template(engine, template, 10000)
+    tokens = [
+        core.init_env_and_issue_token(
+            InitEnvRequest(environment_schema=template, user_id="bench")
+        ).token
+        for _ in range(args.environments)
+    ]
+
+    for clients in [int(n) for n in args.clients.split(",")]:
+        for mode in ("sync", "async"):
+
+            async def run() -> tuple[list[float], float]:
+                async_sessions = (
+                    AsyncSessionManager(
+                        create_async_engine(
+                            async_url(engine.url.render_as_string(hide_password=False)),
+                            pool_size=args.pool_size,
+                            max_overflow=0,
+                        ),
+                        core.sessions,
+                    )
+                    if mode == "async"
+                    else None
+                )
+                app = GraphQLWithSession(
+                    SCHEMA,
+                    core,
+                    executor=BlockingExecutor(
+                        max_workers=args.workers, max_queue=clients
+                    ),
+                    async_sessions=async_sessions,
+                )
+                try:
+                    return await drive(
+                        lambda token: graphql_request(app, token),
+                        tokens,
+                        clients,
+                        args.requests,
+                    )
+                finally:
+                    app.executor.shutdown()
+                    app.finish_executor.shutdown()
+                    if async_sessions is not None:
+                        await async_sessions.dispose()
+
+            timings, seconds = asyncio.run(run())
+            print(
+                f"{clients:>4} clients  {mode:<5}  {summary(timings)}  "
+                f"{len(timings) / seconds:6.0f} req/s"
+            )
+    drop_schemas(engine, "state_")
+    drop_schemas(engine, "bench_")
+
+
+if __name__ == "__main__":
+    main()
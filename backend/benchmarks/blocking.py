@@ -0,0 +1,72 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import random
+from time import perf_counter
+from sqlalchemy import Engine, text
+from backend.src.platform.api.auth import hash_secret, verify_secret
+from backend.src.platform.api.blocking import BlockingExecutor
+from .common import engine_from_env, summary
+
+# latency of cheap DB requests while some concurrent requests verify API
+# keys (PBKDF2), with the blocking work run inline on the event loop against
+# the bounded BlockingExecutor
+
+
+async def run_load(
+    mode: str, engine: Engine, concurrency: int, requests: int, slow_share: float
+) -> tuple[list[float], list[float]]:
+    executor = BlockingExecutor(max_workers=concurrency)
+    stored_hash, stored_salt = hash_secret("secret")
+    picks = random.Random(0)
+    fast: list[float] = []
+    slow: list[float] = []
+
+    def lookup() -> None:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1")).scalar()
+
+    def verify() -> None:
+        verify_secret("secret", stored_hash, stored_salt)
+
+    async def call(fn) -> None:
+        if mode == "executor":
+            await executor.run(fn)
+        else:
+            fn()
+            await asyncio.sleep(0)
+
+    async def client(n: int) -> None:
+        for _ in range(n):
+            is_slow = picks.random() < slow_share
+            started = perf_counter()
+            await call(verify if is_slow else lookup)
+            (slow if is_slow else fast).append(perf_counter() - started)
+
+    per_client = requests // concurrency
+    await asyncio.gather(*(client(per_client) for _ in range(concurrency)))
+    executor.shutdown()
+    return fast, slow
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--slow-share", type=float, default=0.1)
+    args = parser.parse_args()
+
+    engine = engine_from_env(pool_size=args.concurrency)
+    for mode in ("inline", "executor"):
+        started = perf_counter()
+        fast, slow = asyncio.run(
+            run_load(mode, engine, args.concurrency, args.requests, args.slow_share)
+        )
+        seconds = perf_counter() - started
+        print(f"{mode:<8} lookups     {summary(fast)}")
+        print(f"{mode:<8} key checks  {summary(slow)}")
+        print(f"{mode:<8} throughput  {(len(fast) + len(slow)) / seconds:.0f} req/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# run from the repository root with DATABASE_URL and SECRET_KEY set, e.g.
+#   python -m backend.benchmarks.isolation --sizes 1000,100000
+from __future__ import annotations
+import os
+import statistics
+from time import perf_counter
+from typing import Callable
+
+from sqlalchemy import Engine, create_engine, make_url, text
+from backend.src.platform.db.schema import PlatformBase
+from backend.src.platform.isolationEngine.auth import TokenHandler
+from backend.src.platform.isolationEngine.core import Core
+from backend.src.platform.isolationEngine.environment import EnvironmentHandler
+from backend.src.platform.isolationEngine.session import SessionManager
+
+# Slack-shaped template: messages reference users and channels, so seeding
+# has two FK levels like the real services
+TEMPLATE_DDL = """
+CREATE TABLE "{schema}".users (
+    id serial PRIMARY KEY, name varchar(255) NOT NULL
+);
+CREATE TABLE "{schema}".channels (
+    id serial PRIMARY KEY, name varchar(255) NOT NULL
+);
+CREATE TABLE "{schema}".messages (
+    id serial PRIMARY KEY,
+    channel_id integer NOT NULL REFERENCES "{schema}".channels (id),
+    user_id integer NOT NULL REFERENCES "{schema}".users (id),
+    body text NOT NULL,
+    created_at timestamp NOT NULL DEFAULT now()
+);
+INSERT INTO "{schema}".users (name)
+    SELECT 'user ' || g FROM generate_series(1, {users}) g;
+INSERT INTO "{schema}".channels (name)
+    SELECT 'channel ' || g FROM generate_series(1, {channels}) g;
+INSERT INTO "{schema}".messages (channel_id, user_id, body)
+    SELECT 1 + g % {channels}, 1 + g % {users}, md5(g::text)
+    FROM generate_series(1, {rows}) g
+"""
+
+
+def engine_from_env(database: str | None = None, **kw) -> Engine:
+    url = make_url(os.environ["DATABASE_URL"])
+    if database is not None:
+        url = url.set(database=database)
+    return create_engine(url, pool_pre_ping=True, **kw)
+
+
+def create_platform(engine: Engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(text("CREATE SCHEMA IF NOT EXISTS meta"))
+    PlatformBase.metadata.create_all(engine)
+
+
+def create_template(engine: Engine, schema: str, rows: int) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE'))
+        conn.execute(text(f'CREATE SCHEMA "{schema}"'))
+        conn.execute(
+            text(
+                TEMPLATE_DDL.format(
+                    schema=schema,
+                    rows=rows,
+                    users=max(1, rows // 100),
+                    channels=max(1, rows // 1000),
+                )
+            )
+        )
+
+
+def drop_schemas(engine: Engine, prefix: str) -> None:
+    with engine.connect() as conn:
+        schemas = (
+            conn.execute(
+                text("SELECT nspname FROM pg_namespace WHERE nspname LIKE :p"),
+                {"p": prefix + "%"},
+            )
+            .scalars()
+            .all()
+        )
+    # one transaction per schema keeps clear of max_locks_per_transaction
+    for schema in schemas:
+        with engine.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA "{schema}" CASCADE'))
+
+
+def build_core(engine: Engine, **session_options) -> Core:
+    token = TokenHandler(secret=os.environ["SECRET_KEY"])
+    sessions = SessionManager(engine, token, **session_options)
+    handler = EnvironmentHandler(token_handler=token, session_manager=sessions)
+    return Core(token=token, sessions=sessions, environment_handler=handler)
+
+
+def measure(fn: Callable[[], object], repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        started = perf_counter()
+        fn()
+        timings.append(perf_counter() - started)
+    return timings
+
+
+def summary(timings: list[float]) -> str:
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return (
+        f"median {statistics.median(ordered) * 1000:9.2f} ms  "
+        f"p95 {p95 * 1000:9.2f} ms  n={len(ordered)}"
+    )
@@ -0,0 +1,97 @@
+from __future__ import annotations
+import argparse
+from sqlalchemy import text
+from backend.src.platform.evalutionEngine.diff import DiffEngine, DiffStats
+from .common import (
+    build_core,
+    create_platform,
+    create_template,
+    drop_schemas,
+    engine_from_env,
+    measure,
+    summary,
+)
+
+# bucketed row-hash diff of a large environment with a handful of edits,
+# against a naive full EXCEPT in both directions over every table
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--changes", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--bucket-rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = engine_from_env()
+    create_platform(engine)
+    drop_schemas(engine, "bench_")
+    core = build_core(engine)
+    handler = core.environment_handler
+    template, schema = "bench_tpl", "bench_env"
+    create_template(engine, template, args.rows)
+    handler.clone_template(template, schema)
+
+    # edits spread over the id range so they land in different buckets
+    step = max(1, args.rows // args.changes)
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                f'UPDATE "{schema}".messages SET body = \'edited\' '
+                "WHERE id % :step = 0"
+            ),
+            {"step": step},
+        )
+        conn.execute(
+            text(
+                f'DELETE FROM "{schema}".messages WHERE id % :step = 1 AND id > 1'
+            ),
+            {"step": step},
+        )
+        conn.execute(text(f"UPDATE \"{schema}\".users SET name = 'x' WHERE id = 1"))
+
+    engine_diff = DiffEngine(
+        core.sessions,
+        handler.template_cache,
+        max_workers=args.workers,
+        bucket_rows=args.bucket_rows,
+    )
+    stats = DiffStats()
+
+    def bucketed() -> None:
+        nonlocal stats
+        stats = DiffStats()
+        for _ in engine_diff.diff(template, schema, stats=stats):
+            pass
+
+    tables = handler.template_cache.get(template).tables
+
+    def naive() -> None:
+        with engine.connect() as conn:
+            for table in tables:
+                left, right = f'"{template}"."{table}"', f'"{schema}"."{table}"'
+                conn.execute(
+                    text(
+                        f"(SELECT * FROM {left} EXCEPT SELECT * FROM {right}) "
+                        f"UNION ALL (SELECT * FROM {right} EXCEPT SELECT * FROM {left})"
+                    )
+                ).all()
+
+    bucketed_timings = measure(bucketed, args.repeat)
+    naive_timings = measure(naive, args.repeat)
+    engine_diff.shutdown()
+
+    changes = sum(sum(counts.values()) for counts in stats.changes.values())
+    print(
+        f"{args.rows} template rows, {changes} changes, "
+        f"{stats.changed_buckets}/{stats.buckets} buckets differ"
+    )
+    print(f"bucketed hash diff  {summary(bucketed_timings)}")
+    print(f"naive EXCEPT diff   {summary(naive_timings)}")
+    drop_schemas(engine, "bench_")
+
+
+if __name__ == "__main__":
+    main()
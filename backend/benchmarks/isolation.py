@@ -0,0 +1,71 @@
+from __future__ import annotations
+import argparse
+from sqlalchemy import text
+from .common import (
+    build_core,
+    create_platform,
+    create_template,
+    drop_schemas,
+    engine_from_env,
+    measure,
+    summary,
+)
+
+# schema-per-environment (CREATE SCHEMA + INSERT ... SELECT) against
+# database-per-environment (CREATE DATABASE ... TEMPLATE) per template size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = engine_from_env()
+    create_platform(engine)
+    drop_schemas(engine, "bench_")
+    core = build_core(engine)
+    handler, databases = core.environment_handler, core.database_handler
+    for n in range(args.repeat):
+        databases.drop_database(f"bench_env_db_{n}")
+    autocommit = engine.execution_options(isolation_level="AUTOCOMMIT")
+
+    for rows in [int(size) for size in args.sizes.split(",")]:
+        template = f"bench_tpl_{rows}"
+        template_database = f"bench_tpl_db_{rows}"
+        create_template(engine, template, rows)
+        with autocommit.connect() as conn:
+            conn.execute(
+                text(f'DROP DATABASE IF EXISTS "{template_database}" WITH (FORCE)')
+            )
+            conn.execute(text(f'CREATE DATABASE "{template_database}"'))
+        template_engine = engine_from_env(template_database)
+        create_template(template_engine, "slack", rows)
+        # CREATE DATABASE ... TEMPLATE refuses while anyone is connected
+        template_engine.dispose()
+
+        schemas = iter(range(args.repeat))
+        schema_timings = measure(
+            lambda: handler.clone_template(template, f"bench_env_{next(schemas)}"),
+            args.repeat,
+        )
+        drop_schemas(engine, "bench_env_")
+
+        clones = iter(range(args.repeat))
+        database_timings = measure(
+            lambda: databases.clone_database(
+                template_database, f"bench_env_db_{next(clones)}"
+            ),
+            args.repeat,
+        )
+        for n in range(args.repeat):
+            databases.drop_database(f"bench_env_db_{n}")
+
+        print(f"{rows:>9} rows  schema   {summary(schema_timings)}")
+        print(f"{rows:>9} rows  database {summary(database_timings)}")
+        databases.drop_database(template_database)
+        drop_schemas(engine, template)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+from __future__ import annotations
+import argparse
+from sqlalchemy import text
+from .common import (
+    build_core,
+    create_platform,
+    create_template,
+    drop_schemas,
+    engine_from_env,
+    measure,
+    summary,
+)
+
+# in-place reset after a small agent edit against provisioning a fresh
+# environment from the template
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = engine_from_env()
+    create_platform(engine)
+    drop_schemas(engine, "bench_")
+    handler = build_core(engine).environment_handler
+    template = "bench_tpl"
+    create_template(engine, template, args.rows)
+
+    fresh = iter(range(args.repeat))
+    create_timings = measure(
+        lambda: handler.clone_template(template, f"bench_env_{next(fresh)}"),
+        args.repeat,
+    )
+
+    schema = "bench_env_0"
+
+    def edit_and_reset(statement: str) -> None:
+        with engine.begin() as conn:
+            conn.execute(text(statement))
+        handler.reset_schema(template, schema)
+
+    # nothing references messages, so only it is re-copied
+    leaf_timings = measure(
+        lambda: edit_and_reset(
+            f'UPDATE "{schema}".messages SET body = \'edited\' WHERE id = 1'
+        ),
+        args.repeat,
+    )
+    # users is referenced by messages, so both are re-copied
+    root_timings = measure(
+        lambda: edit_and_reset(
+            f'UPDATE "{schema}".users SET name = \'edited\' WHERE id = 1'
+        ),
+        args.repeat,
+    )
+    # TRUNCATE is not journalled, so this takes the full re-copy path
+    truncate_timings = measure(
+        lambda: edit_and_reset(f'TRUNCATE "{schema}".messages'), args.repeat
+    )
+    # nothing changed since the last reset, so this is the floor
+    noop_timings = measure(lambda: handler.reset_schema(template, schema), args.repeat)
+
+    print(f"{args.rows} template rows")
+    print(f"fresh environment     {summary(create_timings)}")
+    print(f"reset, messages edit  {summary(leaf_timings)}")
+    print(f"reset, users edit     {summary(root_timings)}")
+    print(f"reset, truncate       {summary(truncate_timings)}")
+    print(f"reset, nothing dirty  {summary(noop_timings)}")
+    drop_schemas(engine, "bench_")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+from __future__ import annotations
+import argparse
+import random
+from sqlalchemy import Column, ForeignKey, Integer, MetaData, String, Table, select
+from .common import (
+    build_core,
+    create_platform,
+    create_template,
+    drop_schemas,
+    engine_from_env,
+    measure,
+    summary,
+)
+
+# the same Slack-style query against many environments, routed with a
+# schema_translate_map per environment against a shared search_path
+
+metadata = MetaData()
+users = Table(
+    "users",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", String),
+)
+messages = Table(
+    "messages",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("channel_id", Integer),
+    Column("user_id", Integer, ForeignKey("users.id")),
+    Column("body", String),
+)
+QUERY = (
+    select(messages.c.id, messages.c.body, users.c.name)
+    .join(users, users.c.id == messages.c.user_id)
+    .where(messages.c.channel_id == 1)
+    .order_by(messages.c.id.desc())
+    .limit(20)
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--environments", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--rows", type=int, default=1000)
+    args = parser.parse_args()
+
+    engine = engine_from_env()
+    create_platform(engine)
+    drop_schemas(engine, "bench_")
+    handler = build_core(engine).environment_handler
+    template = "bench_tpl"
+    create_template(engine, template, args.rows)
+    schemas = [f"bench_env_{n}" for n in range(args.environments)]
+    for schema in schemas:
+        handler.clone_template(template, schema)
+
+    for routing in ("translate", "search_path"):
+        core = build_core(engine_from_env(), routing=routing)
+        sessions = core.sessions
+        picks = random.Random(0)
+
+        def query() -> None:
+            factory = sessions.get_schema_factory(picks.choice(schemas))
+            with factory() as s:
+                s.execute(QUERY).all()
+
+        # every environment once first so both modes start warm
+        for schema in schemas:
+            with sessions.get_schema_factory(schema)() as s:
+                s.execute(QUERY).all()
+        sessions.compiled_cache.reset()
+        timings = measure(query, args.queries)
+        cache = sessions.compiled_cache.snapshot()
+        print(
+            f"{routing:<11} {summary(timings)}  "
+            f"cache hit ratio {cache.hit_ratio:.2f}, {cache.entries} entries"
+        )
+    drop_schemas(engine, "bench_")
+
+
+if __name__ == "__main__":
+    main()
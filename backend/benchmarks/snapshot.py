@@ -0,0 +1,68 @@
+from __future__ import annotations
+import argparse
+import tempfile
+from pathlib import Path
+from .common import (
+    build_core,
+    create_platform,
+    create_template,
+    drop_schemas,
+    engine_from_env,
+    measure,
+    summary,
+)
+
+# snapshot export and import per template size, with the archive size, against
+# cloning the same template inside the server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = engine_from_env()
+    create_platform(engine)
+    drop_schemas(engine, "bench_")
+    core = build_core(engine)
+    handler, snapshots = core.environment_handler, core.snapshots
+
+    with tempfile.TemporaryDirectory() as directory:
+        archive = Path(directory) / "snapshot.gz"
+        for rows in [int(size) for size in args.sizes.split(",")]:
+            template = f"bench_tpl_{rows}"
+            create_template(engine, template, rows)
+
+            def export() -> None:
+                with archive.open("wb") as out:
+                    snapshots.export_schema(template, out)
+
+            export_timings = measure(export, args.repeat)
+
+            imports = iter(range(args.repeat))
+
+            def load() -> None:
+                with archive.open("rb") as src:
+                    snapshots.import_schema(src, f"bench_env_{next(imports)}")
+
+            import_timings = measure(load, args.repeat)
+            drop_schemas(engine, "bench_env_")
+
+            clones = iter(range(args.repeat))
+            clone_timings = measure(
+                lambda: handler.clone_template(template, f"bench_env_{next(clones)}"),
+                args.repeat,
+            )
+            drop_schemas(engine, "bench_env_")
+
+            size = archive.stat().st_size / 1024
+            print(f"{rows:>9} rows  archive {size:,.0f} KiB")
+            print(f"{rows:>9} rows  export  {summary(export_timings)}")
+            print(f"{rows:>9} rows  import  {summary(import_timings)}")
+            print(f"{rows:>9} rows  clone   {summary(clone_timings)}")
+            drop_schemas(engine, template)
+
+
+if __name__ == "__main__":
+    main()
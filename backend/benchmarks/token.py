@@ -0,0 +1,73 @@
+from __future__ import annotations
+import argparse
+import os
+from datetime import datetime, timedelta
+from time import perf_counter
+from sqlalchemy import delete
+from backend.src.platform.db.schema import RevokedToken
+from .common import build_core, create_platform, engine_from_env, summary
+
+# per-request token check with and without the verified-claims cache, and the
+# cost of reloading the persisted revocation list on start or reconnect
+
+
+def decode_loop(core, tokens: list[str], rounds: int) -> list[float]:
+    timings = []
+    for _ in range(rounds):
+        for token in tokens:
+            started = perf_counter()
+            core.token.decode_token(token)
+            timings.append(perf_counter() - started)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--revoked", type=int, default=10000)
+    args = parser.parse_args()
+
+    engine = engine_from_env()
+    create_platform(engine)
+    core = build_core(engine)
+    tokens = [
+        core.token.issue_token(
+            environment_id="env", user_id="user", impersonate_user_id=None
+        )
+        for _ in range(args.tokens)
+    ]
+
+    for cache_size in (0, 10000):
+        core.token.cache_size = cache_size
+        core.token._verified.clear()
+        timings = sorted(decode_loop(core, tokens, args.rounds))
+        print(
+            f"decode cache_size={cache_size:<6} "
+            f"median {timings[len(timings) // 2] * 1e6:7.1f} us  "
+            f"p95 {timings[int(len(timings) * 0.95)] * 1e6:7.1f} us"
+        )
+
+    expires = datetime.now() + timedelta(minutes=30)
+    with core.sessions.get_meta_session() as s:
+        s.execute(delete(RevokedToken))
+        s.add_all(
+            RevokedToken(jti=os.urandom(16).hex(), expiresAt=expires)
+            for _ in range(args.revoked)
+        )
+        s.commit()
+    loads = []
+    for _ in range(20):
+        started = perf_counter()
+        core.load_revoked_tokens()
+        loads.append(perf_counter() - started)
+    print(f"reload {args.revoked} revoked  {summary(loads)}")
+
+    with core.sessions.get_meta_session() as s:
+        s.execute(delete(RevokedToken))
+        s.commit()
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,24 @@
 from __future__ import annotations
 
+import asyncio
 import base64
 import hashlib
 import hmac
 import os
 import secrets
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Optional, Tuple, List, Dict
+from threading import Lock
+from time import monotonic, perf_counter
+from typing import Optional, Tuple, Dict, cast
 from uuid import UUID, uuid4
 
+from sqlalchemy import Row, func, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from backend.src.platform.isolationEngine.routing import LastUsedFlusher
 from backend.src.platform.isolationEngine.session import SessionManager
 from backend.src.platform.db.schema import ApiKey, OrganizationMembership, User
 
@@ -30,9 +38,114 @@ def verify_secret(secret: str, stored_hash_b64: str, stored_salt_b64: str) -> bo
     return hmac.compare_digest(derived_b64, stored_hash_b64)
 
 
+API_KEY_REVOKED_CHANNEL = "dtu_api_key_revoked"
+
+
+@dataclass
+class KeyCacheStats:
+    hits: int = 0
+    misses: int = 0
+    invalidations: int = 0
+    verifications: int = 0
+    verify_seconds_total: float = 0.0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    @property
+    def seconds_saved(self) -> float:
+        # every hit skips one PBKDF2 verification of average cost
+        if not self.verifications:
+            return 0.0
+        return self.hits * self.verify_seconds_total / self.verifications
+
+
+class VerifiedKeyCache:
+    def __init__(self, ttl_seconds: float = 60.0, max_entries: int = 10_000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # keyed so a dump of the cache does not give away usable secrets
+        self._hash_key = os.urandom(32)
+        self._entries: OrderedDict[bytes, Tuple[str, Dict[str, object], float]] = (
+            OrderedDict()
+        )
+        self._by_key: Dict[str, set] = {}
+        self._lock = Lock()
+        self.stats = KeyCacheStats()
+
+    def _digest(self, key_id: str, secret: str) -> bytes:
+        return hmac.new(
+            self._hash_key, f"{key_id}_{secret}".encode(), hashlib.sha256
+        ).digest()
+
+    def get(self, key_id: str, secret: str) -> Optional[Dict[str, object]]:
+        digest = self._digest(key_id, secret)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None or entry[2] <= monotonic():
+                if entry is not None:
+                    self._drop(digest)
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.stats.hits += 1
+        return _copy_principal(entry[1])
+
+    def put(
+        self,
+        key_id: str,
+        secret: str,
+        principal: Dict[str, object],
+        expires_at: Optional[datetime],
+    ) -> None:
+        ttl = self.ttl_seconds
+        if expires_at is not None:
+            ttl = min(ttl, (expires_at - datetime.now()).total_seconds())
+        if ttl <= 0:
+            return
+        digest = self._digest(key_id, secret)
+        key_id = UUID(key_id).hex
+        with self._lock:
+            self._entries[digest] = (key_id, principal, monotonic() + ttl)
+            self._entries.move_to_end(digest)
+            self._by_key.setdefault(key_id, set()).add(digest)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def record_verification(self, seconds: float) -> None:
+        with self._lock:
+            self.stats.verifications += 1
+            self.stats.verify_seconds_total += seconds
+
+    def invalidate(self, key_id: Optional[str] = None) -> None:
+        with self._lock:
+            self.stats.invalidations += 1
+            if key_id is None:
+                self._entries.clear()
+                self._by_key.clear()
+                return
+            for digest in self._by_key.pop(UUID(key_id).hex, ()):
+                self._entries.pop(digest, None)
+
+    def _drop(self, digest: bytes) -> None:
+        key_id, _, _ = self._entries.pop(digest)
+        digests = self._by_key.get(key_id)
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._by_key[key_id]
+
+
 class KeyHandler:
-    def __init__(self, session_manager: SessionManager):
+    def __init__(
+        self,
+        session_manager: SessionManager,
+        key_cache: Optional[VerifiedKeyCache] = None,
+    ):
         self.session_manager = session_manager
+        self.key_cache = key_cache
 
     def create_api_key(
         self,
@@ -75,6 +188,22 @@ class KeyHandler:
             "is_organization_admin": is_organization_admin,
         }
 
+    def revoke_api_key(self, key_id: str) -> None:
+        with self.session_manager.get_meta_session() as session:
+            session.execute(
+                update(ApiKey)
+                .where(ApiKey.id == UUID(key_id))
+                .values(revokedAt=datetime.now(), updatedAt=datetime.now())
+            )
+            # other workers drop their cached principal on commit
+            session.execute(
+                text("SELECT pg_notify(:channel, :key_id)"),
+                {"channel": API_KEY_REVOKED_CHANNEL, "key_id": UUID(key_id).hex},
+            )
+            session.commit()
+        if self.key_cache is not None:
+            self.key_cache.invalidate(key_id)
+
 
 def parse_api_key(header: Optional[str]) -> Optional[Tuple[str, str]]:
     if not header:
@@ -93,36 +222,139 @@ def parse_api_key(header: Optional[str]) -> Optional[Tuple[str, str]]:
         return None
 
 
-def validate_api_key(header: Optional[str], session: Session) -> Dict[str, object]:
+def _principal_query(key_uuid: UUID):
+    # key, admin flags and memberships in one round trip
+    org_ids = (
+        select(func.array_agg(OrganizationMembership.organizationId))
+        .where(OrganizationMembership.userId == ApiKey.userId)
+        .correlate(ApiKey)
+        .scalar_subquery()
+    )
+    return (
+        select(
+            ApiKey.keyHash,
+            ApiKey.keySalt,
+            ApiKey.expiresAt,
+            ApiKey.revokedAt,
+            ApiKey.userId,
+            User.isPlatformAdmin,
+            User.isOrganizationAdmin,
+            org_ids.label("org_ids"),
+        )
+        .outerjoin(User, User.id == ApiKey.userId)
+        .where(ApiKey.id == key_uuid)
+    )
+
+
+def _check_key(row: Optional[Row]) -> Row:
+    if (
+        row is None
+        or row.revokedAt
+        or (row.expiresAt and row.expiresAt <= datetime.now())
+    ):
+        raise PermissionError("invalid or expired api key")
+    return row
+
+
+def _copy_principal(principal: Dict[str, object]) -> Dict[str, object]:
+    # callers may mutate org_ids, the cached principal must not change
+    return {**principal, "org_ids": list(cast(list, principal["org_ids"]))}
+
+
+def _principal(row) -> Dict[str, object]:
+    return {
+        "user_id": row.userId,
+        "org_ids": list(row.org_ids or []),
+        "is_platform_admin": bool(row.isPlatformAdmin),
+        "is_organization_admin": bool(row.isOrganizationAdmin),
+    }
+
+
+def _parse_and_check_cache(
+    header: Optional[str],
+    cache: Optional[VerifiedKeyCache],
+    last_used: Optional[LastUsedFlusher],
+) -> Tuple[str, str, UUID, Optional[Dict[str, object]]]:
     parsed = parse_api_key(header)
     if not parsed:
         raise PermissionError("invalid api key format")
     key_id, secret = parsed
-
     key_uuid = UUID(key_id)
-    key: Optional[ApiKey] = (
-        session.query(ApiKey).filter(ApiKey.id == key_uuid).one_or_none()
-    )
-    if not key or key.revokedAt or (key.expiresAt and key.expiresAt <= datetime.now()):
-        raise PermissionError("invalid or expired api key")
+    cached = cache.get(key_id, secret) if cache is not None else None
+    if cached is not None and last_used is not None:
+        last_used.touch(key_uuid)
+    return key_id, secret, key_uuid, cached
+
 
-    if not verify_secret(secret, key.keyHash, key.keySalt):
+def _accept(
+    row,
+    key_id: str,
+    secret: str,
+    verified: bool,
+    seconds: float,
+    cache: Optional[VerifiedKeyCache],
+) -> Dict[str, object]:
+    if cache is not None:
+        cache.record_verification(seconds)
+    if not verified:
         raise PermissionError("invalid api key")
+    principal = _principal(row)
+    if cache is not None:
+        cache.put(key_id, secret, principal, row.expiresAt)
+        return _copy_principal(principal)
+    return principal
 
-    key.lastUsedAt = datetime.now()
-    user: Optional[User] = (
-        session.query(User).filter(User.id == key.userId).one_or_none()
+
+def _touch_statement(key_uuid: UUID):
+    return (
+        update(ApiKey).where(ApiKey.id == key_uuid).values(lastUsedAt=datetime.now())
     )
-    is_platform_admin = bool(user.isPlatformAdmin) if user else False
-    is_organization_admin = bool(user.isOrganizationAdmin) if user else False
-    org_ids: List[int] = [
-        m.organizationId
-        for m in session.query(OrganizationMembership).filter_by(userId=key.userId)
-    ]
-    session.commit()
-    return {
-        "user_id": key.userId,
-        "org_ids": org_ids,
-        "is_platform_admin": is_platform_admin,
-        "is_organization_admin": is_organization_admin,
-    }
+
+
+def validate_api_key(
+    header: Optional[str],
+    session: Session,
+    cache: Optional[VerifiedKeyCache] = None,
+    last_used: Optional[LastUsedFlusher] = None,
+) -> Dict[str, object]:
+    key_id, secret, key_uuid, cached = _parse_and_check_cache(header, cache, last_used)
+    if cached is not None:
+        return cached
+
+    row = _check_key(session.execute(_principal_query(key_uuid)).one_or_none())
+    started = perf_counter()
+    verified = verify_secret(secret, row.keyHash, row.keySalt)
+    principal = _accept(row, key_id, secret, verified, perf_counter() - started, cache)
+
+    if last_used is not None:
+        last_used.touch(key_uuid)
+    else:
+        session.execute(_touch_statement(key_uuid))
+        session.commit()
+    return principal
+
+
+async def validate_api_key_async(
+    header: Optional[str],
+    session: AsyncSession,
+    cache: Optional[VerifiedKeyCache] = None,
+    last_used: Optional[LastUsedFlusher] = None,
+) -> Dict[str, object]:
+    key_id, secret, key_uuid, cached = _parse_and_check_cache(header, cache, last_used)
+    if cached is not None:
+        return cached
+
+    row = _check_key((await session.execute(_principal_query(key_uuid))).one_or_none())
+    # PBKDF2 releases the GIL, keep it off the event loop
+    started = perf_counter()
+    verified = await asyncio.to_thread(
+        verify_secret, secret, row.keyHash, row.keySalt
+    )
+    principal = _accept(row, key_id, secret, verified, perf_counter() - started, cache)
+
+    if last_used is not None:
+        last_used.touch(key_uuid)
+    else:
+        await session.execute(_touch_statement(key_uuid))
+        await session.commit()
+    return principal
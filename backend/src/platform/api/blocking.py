@@ -0,0 +1,100 @@
+from __future__ import annotations
+import asyncio
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from dataclasses import dataclass
+from sys import maxsize
+from threading import Lock
+from time import monotonic
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass
+class BlockingStats:
+    submitted: int = 0
+    completed: int = 0
+    rejected: int = 0  # refused because max_queue calls were already waiting
+    queued: int = 0  # waiting for a worker right now
+    running: int = 0
+    max_queued: int = 0
+    wait_seconds_total: float = 0.0
+    wait_seconds_max: float = 0.0
+
+    @property
+    def wait_seconds_avg(self) -> float:
+        started = self.completed + self.running
+        return self.wait_seconds_total / started if started else 0.0
+
+
+class BlockingExecutor:
+    def __init__(
+        self, max_workers: int = 16, max_queue: int = 256, name: str = "blocking"
+    ):
+        # sync SQLAlchemy and PBKDF2 run here so one slow call does not stall
+        # every other request on the event loop
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=name
+        )
+        self.max_queue = max_queue
+        self.stats = BlockingStats()
+        self._lock = Lock()
+
+    async def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        with self._lock:
+            if self.stats.queued >= self.max_queue:
+                self.stats.rejected += 1
+                raise RuntimeError("blocking executor queue is full")
+            self.stats.submitted += 1
+            self.stats.queued += 1
+            self.stats.max_queued = max(self.stats.max_queued, self.stats.queued)
+        enqueued = monotonic()
+        state = {"started": False, "abandoned": False}
+
+        def call() -> T:
+            waited = monotonic() - enqueued
+            with self._lock:
+                if state["abandoned"]:
+                    # the caller is gone, nobody reads this outcome
+                    raise CancelledError
+                state["started"] = True
+                self.stats.queued -= 1
+                self.stats.running += 1
+                self.stats.wait_seconds_total += waited
+                self.stats.wait_seconds_max = max(self.stats.wait_seconds_max, waited)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.stats.running -= 1
+                    self.stats.completed += 1
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+        finally:
+            # a caller cancelled while still queued never reaches a worker
+            with self._lock:
+                if not state["started"]:
+                    state["abandoned"] = True
+                    self.stats.queued -= 1
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def finisher(max_workers: int = 4) -> BlockingExecutor:
+    # ends request sessions apart from the request pool: when every request
+    # worker waits on the connection pool, the connections are held by
+    # sessions waiting to be closed, so closing must never queue behind them.
+    # Each queued call gives a connection back, so the queue is not bounded
+    return BlockingExecutor(max_workers=max_workers, max_queue=maxsize, name="finish")
+
+
+def finish_session(session, commit: bool) -> None:
+    try:
+        if commit:
+            session.commit()
+        else:
+            session.rollback()
+    finally:
+        session.close()
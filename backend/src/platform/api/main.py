@@ -1,27 +1,185 @@
+from contextlib import asynccontextmanager
 from sqlalchemy import create_engine
-from backend.src.platform.isolationEngine.auth import TokenHandler
+from sqlalchemy.ext.asyncio import create_async_engine
+from backend.src.platform.api.auth import API_KEY_REVOKED_CHANNEL, VerifiedKeyCache
+from backend.src.platform.api.blocking import BlockingExecutor
+from backend.src.platform.db.schema import ApiKey
+from backend.src.platform.evalutionEngine.assertions import AssertionEngine
+from backend.src.platform.evalutionEngine.diff import DiffEngine
+from backend.src.platform.isolationEngine.async_session import (
+    AsyncSessionManager,
+    async_url,
+)
+from backend.src.platform.isolationEngine.auth import (
+    TOKEN_REVOKED_CHANNEL,
+    TokenHandler,
+)
 from backend.src.platform.isolationEngine.session import SessionManager
 from starlette.applications import Starlette
 from os import environ
 from backend.src.platform.isolationEngine.core import Core
+from backend.src.platform.isolationEngine.database import DatabaseHandler
 from backend.src.platform.isolationEngine.environment import EnvironmentHandler
+from backend.src.platform.isolationEngine.hibernation import HibernationManager
+from backend.src.platform.isolationEngine.pool import WarmPoolManager
+from backend.src.platform.isolationEngine.provisioning import ProvisioningExecutor
+from backend.src.platform.isolationEngine.reaper import EnvironmentReaper
+from backend.src.platform.isolationEngine.routing import (
+    INVALIDATE_CHANNEL,
+    InvalidationListener,
+    LastUsedFlusher,
+    RouteCache,
+)
+from backend.src.platform.isolationEngine.seeding import SeedingEngine
 
 
 def create_app():
-    app = Starlette()
     db_url = environ["DATABASE_URL"]
     secret = environ["SECRET_KEY"]
 
     platform_engine = create_engine(db_url, pool_pre_ping=True)
-    token = TokenHandler(secret=secret)
-    sessions = SessionManager(platform_engine, token)
+    token = TokenHandler(
+        secret=secret, cache_size=int(environ.get("TOKEN_CACHE_SIZE", "10000"))
+    )
+    routes = RouteCache(ttl_seconds=float(environ.get("ROUTE_CACHE_SECONDS", "5")))
+    invalidations = InvalidationListener(platform_engine)
+    invalidations.subscribe(INVALIDATE_CHANNEL, routes.invalidate, routes.invalidate)
+    key_cache = VerifiedKeyCache(
+        ttl_seconds=float(environ.get("API_KEY_CACHE_SECONDS", "60"))
+    )
+    invalidations.subscribe(
+        API_KEY_REVOKED_CHANNEL, key_cache.invalidate, key_cache.invalidate
+    )
+    key_last_used = LastUsedFlusher(
+        platform_engine,
+        interval_seconds=float(environ.get("LAST_USED_FLUSH_SECONDS", "5")),
+        model=ApiKey,
+    )
+    last_used = LastUsedFlusher(
+        platform_engine,
+        interval_seconds=float(environ.get("LAST_USED_FLUSH_SECONDS", "5")),
+    )
+    sessions = SessionManager(
+        platform_engine,
+        token,
+        max_database_engines=int(environ.get("MAX_DATABASE_ENGINES", "32")),
+        ready_wait_seconds=float(environ.get("ENV_READY_WAIT_SECONDS", "2")),
+        routes=routes,
+        last_used=last_used,
+        max_schema_factories=int(environ.get("MAX_SCHEMA_FACTORIES", "1024")),
+        routing=environ.get("SCHEMA_ROUTING", "translate"),
+    )
+    async_sessions = (
+        AsyncSessionManager(
+            create_async_engine(async_url(db_url), pool_pre_ping=True),
+            sessions,
+            max_database_engines=int(environ.get("MAX_DATABASE_ENGINES", "32")),
+        )
+        if environ.get("DB_ASYNC") == "1"
+        else None
+    )
+    seeder = SeedingEngine(
+        platform_engine,
+        max_workers=int(environ.get("SEED_WORKERS", "4")),
+        disable_triggers=environ.get("SEED_DISABLE_TRIGGERS") == "1",
+    )
     environment_handler = EnvironmentHandler(
-        token_handler=token, session_manager=sessions
+        token_handler=token, session_manager=sessions, seeder=seeder
+    )
+
+    pool = WarmPoolManager(
+        session_manager=sessions,
+        environment_handler=environment_handler,
+        max_workers=int(environ.get("WARM_POOL_WORKERS", "4")),
+    )
+    pool.warm_all()
+
+    database_handler = DatabaseHandler(sessions)
+    hibernation = HibernationManager(
+        session_manager=sessions,
+        environment_handler=environment_handler,
+        directory=environ.get("HIBERNATION_DIR", "/var/lib/dtu/hibernated"),
+        idle_seconds=int(environ.get("HIBERNATE_IDLE_SECONDS", "900")),
+        max_live_schemas=int(environ.get("MAX_LIVE_SCHEMAS") or 0) or None,
+    )
+    sessions.restorer = hibernation.restore
+    reaper = EnvironmentReaper(
+        session_manager=sessions,
+        database_handler=database_handler,
+        interval_seconds=float(environ.get("REAPER_INTERVAL_SECONDS", "30")),
+        drops_per_second=float(environ.get("REAPER_DROPS_PER_SECOND", "5")),
+        hibernation=hibernation,
+    )
+
+    provisioner = ProvisioningExecutor(
+        max_workers=int(environ.get("PROVISION_WORKERS", "4")),
+        max_pending=int(environ.get("PROVISION_MAX_PENDING", "256")),
+    )
+
+    core = Core(
+        token=token,
+        sessions=sessions,
+        environment_handler=environment_handler,
+        pool=pool,
+        database_handler=database_handler,
+        provisioner=provisioner,
+    )
+    # revocations sent while the listener was down are only in revoked_tokens
+    invalidations.subscribe(
+        TOKEN_REVOKED_CHANNEL, token.on_revoked, core.load_revoked_tokens
+    )
+
+    diff = DiffEngine(
+        session_manager=sessions,
+        template_cache=environment_handler.template_cache,
+        max_workers=int(environ.get("DIFF_WORKERS", "4")),
+        bucket_rows=int(environ.get("DIFF_BUCKET_ROWS", "1000")),
+    )
+    assertions = AssertionEngine(
+        session_manager=sessions,
+        template_cache=environment_handler.template_cache,
+        max_workers=int(environ.get("ASSERTION_WORKERS", "8")),
+    )
+    blocking = BlockingExecutor(
+        max_workers=int(environ.get("BLOCKING_WORKERS", "16")),
+        max_queue=int(environ.get("BLOCKING_MAX_QUEUE", "256")),
     )
 
-    core = Core(token=token, sessions=sessions, environment_handler=environment_handler)
+    @asynccontextmanager
+    async def lifespan(app):
+        core.load_revoked_tokens()
+        invalidations.start()
+        last_used.start()
+        key_last_used.start()
+        reaper.start()
+        hibernation.start()
+        try:
+            yield
+        finally:
+            await invalidations.stop()
+            await last_used.stop()
+            await key_last_used.stop()
+            await hibernation.stop()
+            await reaper.stop()
+            pool.shutdown()
+            provisioner.shutdown()
+            diff.shutdown()
+            assertions.shutdown()
+            blocking.shutdown()
+            if async_sessions is not None:
+                await async_sessions.dispose()
 
+    app = Starlette(lifespan=lifespan)
     app.state.core = core
     app.state.sessions = sessions
+    app.state.pool = pool
+    app.state.reaper = reaper
+    app.state.hibernation = hibernation
+    app.state.diff = diff
+    app.state.assertions = assertions
+    app.state.key_cache = key_cache
+    app.state.key_last_used = key_last_used
+    app.state.blocking = blocking
+    app.state.async_sessions = async_sessions
 
     return app
@@ -1,37 +1,86 @@
 import ariadne.asgi
+from backend.src.platform.isolationEngine.async_session import AsyncSessionManager
+from backend.src.platform.isolationEngine.routing import LastUsedFlusher
 from backend.src.platform.isolationEngine.session import SessionManager
-from backend.src.platform.api.auth import validate_api_key
+from backend.src.platform.api.auth import (
+    VerifiedKeyCache,
+    validate_api_key,
+    validate_api_key_async,
+)
+from backend.src.platform.api.blocking import (
+    BlockingExecutor,
+    finish_session,
+    finisher,
+)
 
 
 class PlatformGraphQL(ariadne.asgi.GraphQL):
-    def __init__(self, session_manager: SessionManager):
+    def __init__(
+        self,
+        session_manager: SessionManager,
+        key_cache: VerifiedKeyCache | None = None,
+        executor: BlockingExecutor | None = None,
+        async_sessions: AsyncSessionManager | None = None,
+        key_last_used: LastUsedFlusher | None = None,
+        finish_executor: BlockingExecutor | None = None,
+    ):
         self.session_manager = session_manager
+        self.key_cache = key_cache
+        self.key_last_used = key_last_used
+        self.executor = executor or BlockingExecutor()
+        # commit/rollback and close run here, never behind self.executor
+        self.finish_executor = finish_executor or finisher()
+        # when set, requests use AsyncSession and resolvers must await it
+        self.async_sessions = async_sessions
 
     async def context_value(self, request):
-        session = self.session_manager.get_meta_session()
+        api_key_hdr = request.headers.get("X-API-Key") or request.headers.get(
+            "Authorization"
+        )
+        if self.async_sessions is not None:
+            session = self.async_sessions.get_meta_session()
+            try:
+                principal = await validate_api_key_async(
+                    api_key_hdr, session, self.key_cache, self.key_last_used
+                )
+            except Exception:
+                await session.close()
+                raise
+        else:
+            session = self.session_manager.get_meta_session()
+            try:
+                principal = await self.executor.run(
+                    validate_api_key,
+                    api_key_hdr,
+                    session,
+                    self.key_cache,
+                    self.key_last_used,
+                )
+            except Exception:
+                session.close()
+                raise
+        request.state.db_session = session
+        request.state.principal = principal
+        return {"request": request, "session": session, "principal": principal}
+
+    async def _finish(self, request, commit: bool) -> None:
+        session = getattr(request.state, "db_session", None)
+        if session is None:
+            return
+        request.state.db_session = None
+        if self.async_sessions is None:
+            await self.finish_executor.run(finish_session, session, commit)
+            return
         try:
-            api_key_hdr = request.headers.get("X-API-Key") or request.headers.get(
-                "Authorization"
-            )
-            principal = validate_api_key(api_key_hdr, session)
-            request.state.db_session = session
-            request.state.principal = principal
-            return {"request": request, "session": session, "principal": principal}
-        except Exception:
-            session.close()
-            raise
+            await (session.commit() if commit else session.rollback())
+        finally:
+            await session.close()
 
     async def handle_request(self, request):
         try:
             response = await super().handle_request(request)
-            if getattr(request.state, "db_session", None):
-                request.state.db_session.commit()
-            return response
         except Exception:
-            if getattr(request.state, "db_session", None):
-                request.state.db_session.rollback()
+            await self._finish(request, commit=False)
             raise
-        finally:
-            if getattr(request.state, "db_session", None):
-                request.state.db_session.close()
-                request.state.db_session = None
+        await self._finish(request, commit=True)
+        return response
@@ -1,8 +1,17 @@
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import String, DateTime, Enum, UniqueConstraint, Integer, Boolean
+from sqlalchemy import (
+    String,
+    DateTime,
+    Enum,
+    UniqueConstraint,
+    Integer,
+    Boolean,
+    Index,
+)
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, text
 from datetime import datetime
+import uuid
 from uuid import uuid4
 
 
@@ -64,7 +73,7 @@ class TemplateEnvironment(PlatformBase):
         {"schema": "meta"},  # keep control-plane out of state routing
     )
 
-    id: Mapped[UUID] = mapped_column(
+    id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True), primary_key=True, default=uuid4
     )
     service: Mapped[str] = mapped_column(
@@ -80,13 +89,19 @@ class TemplateEnvironment(PlatformBase):
     ownerOrgId: Mapped[int | None] = mapped_column(nullable=True)
     ownerUserId: Mapped[int | None] = mapped_column(nullable=True)
     kind: Mapped[str] = mapped_column(
-        Enum("schema", "artifact", "jsonb", name="template_kind"),
+        Enum("schema", "database", "artifact", "jsonb", name="template_kind"),
         nullable=False,
         default="schema",
     )
     location: Mapped[str] = mapped_column(
         String(512), nullable=False
-    )  # schema_name or s3://… URI
+    )  # schema_name, template database name or s3://… URI
+    poolTarget: Mapped[int] = mapped_column(
+        Integer, default=0, nullable=False
+    )  # warm environments kept ready to claim
+    journalEnabled: Mapped[bool] = mapped_column(
+        Boolean, default=True, nullable=False
+    )  # row-level change journal in cloned environments
     createdAt: Mapped[datetime] = mapped_column(
         DateTime, default=datetime.now, nullable=False
     )
@@ -95,27 +110,59 @@ class TemplateEnvironment(PlatformBase):
     )
 
 
+# when an environment with maxIdleSeconds goes idle; the reaper has to filter
+# on this exact expression for ix_run_time_environments_idle_deadline to apply
+IDLE_DEADLINE = '"lastUsedAt" + make_interval(secs => "maxIdleSeconds")'
+
+
 class RunTimeEnvironment(PlatformBase):
     __tablename__ = "run_time_environments"
     __table_args__ = (
         UniqueConstraint("schema", name="uq_run_time_environments_schema"),
+        Index("ix_run_time_environments_pool", "templateId", "pooled", "status"),
+        Index("ix_run_time_environments_expiry", "status", "expiresAt"),
+        Index("ix_run_time_environments_idle", "status", "lastUsedAt"),
+        Index(
+            "ix_run_time_environments_idle_deadline",
+            "status",
+            text(f"({IDLE_DEADLINE})"),
+        ),
         {"schema": "meta"},
     )
 
-    id: Mapped[UUID] = mapped_column(
+    id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True), primary_key=True, default=uuid4
     )
-    environmentId: Mapped[UUID | None] = mapped_column(
+    environmentId: Mapped[uuid.UUID | None] = mapped_column(
+        UUID(as_uuid=True), nullable=True
+    )
+    templateId: Mapped[uuid.UUID | None] = mapped_column(
         UUID(as_uuid=True), nullable=True
     )
-    templateId: Mapped[UUID | None] = mapped_column(UUID(as_uuid=True), nullable=True)
     schema: Mapped[str] = mapped_column(String(128), nullable=False)
+    database: Mapped[str | None] = mapped_column(
+        String(128), nullable=True
+    )  # set when the environment is isolated in its own database
+    templateSchema: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    lazy: Mapped[bool] = mapped_column(
+        Boolean, default=False, nullable=False
+    )  # untouched tables are views over templateSchema
     status: Mapped[str] = mapped_column(
-        Enum("initializing", "ready", "expired", "deleted", name="test_state_status"),
+        Enum(
+            "initializing",
+            "ready",
+            "hibernated",
+            "expired",
+            "deleted",
+            name="test_state_status",
+        ),
         nullable=False,
         default="initializing",
     )
     permanent: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+    pooled: Mapped[bool] = mapped_column(
+        Boolean, default=False, nullable=False
+    )  # provisioned by the warm pool and not yet claimed
     expiresAt: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
     maxIdleSeconds: Mapped[int | None] = mapped_column(Integer, nullable=True)
     lastUsedAt: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
@@ -129,7 +176,7 @@ class RunTimeEnvironment(PlatformBase):
 
 class ApiKey(PlatformBase):
     __tablename__ = "api_keys"
-    id: Mapped[UUID] = mapped_column(
+    id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True), primary_key=True, default=uuid4
     )
     keyHash: Mapped[str] = mapped_column(String(255), nullable=False)
@@ -140,3 +187,18 @@ class ApiKey(PlatformBase):
     lastUsedAt: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
     createdAt: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
     updatedAt: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+
+
+class RevokedToken(PlatformBase):
+    __tablename__ = "revoked_tokens"
+    __table_args__ = (
+        Index("ix_revoked_tokens_expires", "expiresAt"),
+        {"schema": "meta"},
+    )
+
+    jti: Mapped[str] = mapped_column(String(64), primary_key=True)
+    # kept until the token would have expired anyway
+    expiresAt: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    createdAt: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.now, nullable=False
+    )
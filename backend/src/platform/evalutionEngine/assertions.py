@@ -0,0 +1,329 @@
+from __future__ import annotations
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Any
+from sqlalchemy import Table, and_, column, func, literal, literal_column, or_
+from sqlalchemy import select, table as table_clause, true, union_all
+from backend.src.platform.isolationEngine.session import SessionManager
+from backend.src.platform.isolationEngine.templates import TemplateCache
+
+# "column__op": value, a bare column means eq. Leading parts follow foreign
+# keys, named by the FK column with or without its Id/_id suffix, so
+# {"identifier": "ENG-12", "state__name": "Done"} on issues checks the
+# workflow state the issue points at
+_OPERATORS = {
+    "eq": lambda c, v: c == v,
+    "ne": lambda c, v: c != v,
+    "gt": lambda c, v: c > v,
+    "gte": lambda c, v: c >= v,
+    "lt": lambda c, v: c < v,
+    "lte": lambda c, v: c <= v,
+    "in": lambda c, v: c.in_(v),
+    "contains": lambda c, v: c.contains(v, autoescape=True),
+    "icontains": lambda c, v: c.icontains(v, autoescape=True),
+    "is_null": lambda c, v: c.is_(None) if v else c.is_not(None),
+}
+
+
+@dataclass
+class Assertion:
+    name: str
+    table: str
+    where: dict[str, Any] = field(default_factory=dict)
+    expect: str = "exists"  # exists | absent | count
+    count: int | None = None  # exact number of matching rows for expect="count"
+
+
+@dataclass
+class AssertionResult:
+    name: str
+    passed: bool
+    count: int
+    evidence: list[dict] = field(default_factory=list)  # up to evidence_rows matches
+
+
+@dataclass
+class CompiledAssertions:
+    template_schema: str
+    assertions: list[Assertion]
+    # per table the indexes into assertions that share one scan
+    tables: dict[str, tuple[Table, list[int]]]
+
+    def predicates(
+        self, table: Table, t, indexes: list[int], schema: str | None = None
+    ) -> list:
+        # schema is set when t is a lightweight table clause for one environment
+        return [
+            _predicate(table, t, self.assertions[i].where, schema) for i in indexes
+        ]
+
+
+@dataclass
+class CrossEnvironmentResult:
+    # environment id -> results in assertion order, evidence is not collected
+    results: dict[str, list[AssertionResult]]
+    queries: int
+    seconds: float
+
+
+def _hop(table: Table, name: str) -> tuple[str, Table, str]:
+    for fk in table.foreign_keys:
+        local = fk.parent.name
+        if name in (local, local.removesuffix("Id"), local.removesuffix("_id")):
+            return local, fk.column.table, fk.column.name
+    raise ValueError(f"unknown foreign key {table.name}.{name}")
+
+
+def _lookup(table: Table, key: str) -> tuple[list[tuple[str, Table, str]], str, str]:
+    parts = key.split("__")
+    op = parts.pop() if len(parts) > 1 and parts[-1] in _OPERATORS else "eq"
+    *path, name = parts
+    hops = []
+    for step in path:
+        hops.append(_hop(table, step))
+        table = hops[-1][1]
+    if name not in table.c:
+        raise ValueError(f"unknown column {table.name}.{name}")
+    return hops, name, op
+
+
+def _predicate(table: Table, t, where: dict[str, Any], schema: str | None = None):
+    clauses = []
+    for key, value in where.items():
+        hops, name, op = _lookup(table, key)
+        tables = [t]
+        for _, remote, _ in hops:
+            if schema is not None:
+                remote = table_clause(
+                    remote.name,
+                    *(column(c.name, c.type) for c in remote.columns),
+                    schema=schema,
+                )
+            tables.append(remote.alias())
+        clause = _OPERATORS[op](tables[-1].c[name], value)
+        # innermost first: each hop becomes "fk IN (SELECT pk ... WHERE ...)"
+        for i in reversed(range(len(hops))):
+            local, _, remote_column = hops[i]
+            clause = tables[i].c[local].in_(
+                select(tables[i + 1].c[remote_column]).where(clause)
+            )
+        clauses.append(clause)
+    return and_(true(), *clauses)
+
+
+def _passed(assertion: Assertion, count: int) -> bool:
+    if assertion.expect == "exists":
+        return count > 0
+    if assertion.expect == "absent":
+        return count == 0
+    return count == assertion.count
+
+
+class AssertionEngine:
+    def __init__(
+        self,
+        session_manager: SessionManager,
+        template_cache: TemplateCache,
+        max_workers: int = 8,
+        evidence_rows: int = 5,
+    ):
+        self.session_manager = session_manager
+        self.template_cache = template_cache
+        self.evidence_rows = evidence_rows
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="assert"
+        )
+
+    def compile(
+        self, template_schema: str, assertions: list[Assertion]
+    ) -> CompiledAssertions:
+        metadata = self.template_cache.get(template_schema).metadata
+        by_name = {t.name: t for t in metadata.sorted_tables}
+        tables: dict[str, tuple[Table, list[int]]] = {}
+        for i, assertion in enumerate(assertions):
+            if assertion.expect not in ("exists", "absent", "count"):
+                raise ValueError(f"unknown expectation {assertion.expect}")
+            if assertion.expect == "count" and assertion.count is None:
+                raise ValueError(f"assertion {assertion.name} needs a count")
+            table = by_name.get(assertion.table)
+            if table is None:
+                raise ValueError(f"unknown table {assertion.table}")
+            for key in assertion.where:
+                _lookup(table, key)
+            tables.setdefault(assertion.table, (table, []))[1].append(i)
+        return CompiledAssertions(template_schema, assertions, tables)
+
+    def evaluate(
+        self, environment_id: str, assertions: list[Assertion] | CompiledAssertions
+    ) -> list[AssertionResult]:
+        route = self.session_manager.lookup_environment(environment_id)
+        if route.template_schema is None or route.database is not None:
+            raise ValueError("only schema environments with a template can be scored")
+        compiled = (
+            assertions
+            if isinstance(assertions, CompiledAssertions)
+            else self.compile(route.template_schema, assertions)
+        )
+        return self._run(compiled, route.schema)
+
+    def evaluate_many(
+        self, environment_ids: list[str], assertions: list[Assertion]
+    ) -> dict[str, list[AssertionResult]]:
+        routes = self.session_manager.lookup_environments(environment_ids)
+        by_template: dict[str, list[str]] = defaultdict(list)
+        for environment_id, route in routes.items():
+            if route.template_schema is None or route.database is not None:
+                raise ValueError(f"environment {environment_id} cannot be scored")
+            by_template[route.template_schema].append(environment_id)
+        futures = {}
+        for template_schema, ids in by_template.items():
+            compiled = self.compile(template_schema, assertions)
+            for environment_id in ids:
+                futures[environment_id] = self.executor.submit(
+                    self._run, compiled, routes[environment_id].schema
+                )
+        return {
+            environment_id: futures[environment_id].result()
+            for environment_id in environment_ids
+        }
+
+    def _run(self, compiled: CompiledAssertions, schema: str) -> list[AssertionResult]:
+        counts: dict[int, int] = {}
+        evidence: dict[int, list[dict]] = defaultdict(list)
+        engine = self.session_manager.base_engine.execution_options(
+            schema_translate_map={compiled.template_schema: schema}
+        )
+        with engine.connect() as conn:
+            for table, indexes in compiled.tables.values():
+                t = table.alias("t")
+                predicates = compiled.predicates(table, t, indexes)
+                # one scan answers every assertion on the table
+                row = conn.execute(
+                    select(
+                        *(
+                            func.count().filter(predicate).label(f"a{i}")
+                            for i, predicate in zip(indexes, predicates)
+                        )
+                    )
+                    .select_from(t)
+                    .where(or_(*predicates))
+                ).one()
+                counts.update(zip(indexes, row))
+                matched = [
+                    (i, predicate)
+                    for i, predicate in zip(indexes, predicates)
+                    if counts[i]
+                ]
+                if not matched or self.evidence_rows <= 0:
+                    continue
+                rows = conn.execute(
+                    union_all(
+                        *(
+                            select(
+                                literal(i).label("k"),
+                                func.to_jsonb(literal_column("t")).label("row"),
+                            )
+                            .select_from(t)
+                            .where(predicate)
+                            .limit(self.evidence_rows)
+                            for i, predicate in matched
+                        )
+                    )
+                )
+                for i, data in rows:
+                    evidence[i].append(data)
+
+        return [
+            AssertionResult(
+                name=assertion.name,
+                passed=_passed(assertion, counts[i]),
+                count=counts[i],
+                evidence=evidence.get(i, []),
+            )
+            for i, assertion in enumerate(compiled.assertions)
+        ]
+
+    def evaluate_across(
+        self,
+        environment_ids: list[str],
+        assertions: list[Assertion],
+        chunk_size: int = 100,
+    ) -> CrossEnvironmentResult:
+        started = perf_counter()
+        routes = self.session_manager.lookup_environments(environment_ids)
+        by_template: dict[str, list[tuple[str, str]]] = defaultdict(list)
+        for environment_id, route in routes.items():
+            if route.template_schema is None or route.database is not None:
+                raise ValueError(f"environment {environment_id} cannot be scored")
+            by_template[route.template_schema].append((environment_id, route.schema))
+
+        futures = []
+        for template_schema, environments in by_template.items():
+            compiled = self.compile(template_schema, assertions)
+            for i in range(0, len(environments), chunk_size):
+                chunk = environments[i : i + chunk_size]
+                for table, indexes in compiled.tables.values():
+                    futures.append(
+                        (
+                            indexes,
+                            self.executor.submit(
+                                self._count_across, compiled, table, indexes, chunk
+                            ),
+                        )
+                    )
+
+        counts: dict[str, dict[int, int]] = defaultdict(dict)
+        for indexes, future in futures:
+            for environment_id, *row in future.result():
+                counts[environment_id].update(zip(indexes, row))
+        return CrossEnvironmentResult(
+            results={
+                environment_id: [
+                    AssertionResult(
+                        name=assertion.name,
+                        passed=_passed(assertion, counts[environment_id][i]),
+                        count=counts[environment_id][i],
+                    )
+                    for i, assertion in enumerate(assertions)
+                ]
+                for environment_id in environment_ids
+            },
+            queries=len(futures),
+            seconds=perf_counter() - started,
+        )
+
+    def _count_across(
+        self,
+        compiled: CompiledAssertions,
+        table: Table,
+        indexes: list[int],
+        environments: list[tuple[str, str]],
+    ) -> list[tuple]:
+        # the same counting select per schema, glued into one UNION ALL; a
+        # column clause belongs to one table, so each schema gets fresh ones
+        selects = []
+        for environment_id, schema in environments:
+            t = table_clause(
+                table.name,
+                *(column(c.name, c.type) for c in table.columns),
+                schema=schema,
+            ).alias("t")
+            predicates = compiled.predicates(table, t, indexes, schema)
+            selects.append(
+                select(
+                    literal(environment_id).label("environment_id"),
+                    *(
+                        func.count().filter(predicate).label(f"a{i}")
+                        for i, predicate in zip(indexes, predicates)
+                    ),
+                )
+                .select_from(t)
+                .where(or_(*predicates))
+            )
+        with self.session_manager.base_engine.connect() as conn:
+            return [tuple(row) for row in conn.execute(union_all(*selects))]
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
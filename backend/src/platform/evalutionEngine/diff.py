@@ -0,0 +1,319 @@
+from __future__ import annotations
+import json
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from queue import Empty, Full, Queue
+from threading import Event, Lock
+from time import perf_counter
+from typing import Callable, Iterator
+from sqlalchemy import Integer, Table, text
+from sqlalchemy.exc import DBAPIError
+from backend.src.platform.isolationEngine.session import SessionManager
+from backend.src.platform.isolationEngine.templates import TemplateCache
+from backend.src.platform.isolationEngine.tracking import DIRTY_TABLE
+
+_DONE = object()
+
+
+@dataclass
+class RowChange:
+    table: str
+    op: str  # insert | update | delete
+    pk: dict
+    before: dict | None = None
+    after: dict | None = None
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "table": self.table,
+                "op": self.op,
+                "pk": self.pk,
+                "before": self.before,
+                "after": self.after,
+            },
+            default=str,
+        )
+
+
+@dataclass
+class DiffStats:
+    tables: int = 0
+    buckets: int = 0  # buckets compared across all tables
+    changed_buckets: int = 0
+    changes: dict[str, dict[str, int]] = field(default_factory=dict)
+    seconds: float = 0.0
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class DiffEngine:
+    def __init__(
+        self,
+        session_manager: SessionManager,
+        template_cache: TemplateCache,
+        max_workers: int = 4,
+        bucket_rows: int = 1000,
+        queue_size: int = 1000,
+    ):
+        self.session_manager = session_manager
+        self.template_cache = template_cache
+        self.bucket_rows = bucket_rows
+        self.queue_size = queue_size
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="diff"
+        )
+
+    def diff_environment(
+        self, environment_id: str, stats: DiffStats | None = None
+    ) -> Iterator[RowChange]:
+        route = self.session_manager.lookup_environment(environment_id)
+        if route.template_schema is None or route.database is not None:
+            raise ValueError("only schema environments with a template can be diffed")
+        return self.diff(route.template_schema, route.schema, stats=stats)
+
+    def diff(
+        self,
+        template_schema: str,
+        target_schema: str,
+        tables: list[str] | None = None,
+        stats: DiffStats | None = None,
+    ) -> Iterator[RowChange]:
+        compiled = self.template_cache.get(template_schema)
+        if tables is None:
+            tables = self._changed_tables(target_schema, compiled.tables)
+        stats = stats if stats is not None else DiffStats()
+        stats.tables = len(tables)
+        by_name = {t.name: t for t in compiled.metadata.sorted_tables}
+        started = perf_counter()
+
+        # workers stream into a bounded queue so memory stays flat however
+        # large the diff is
+        queue: Queue = Queue(maxsize=self.queue_size)
+        stop = Event()
+        lock = Lock()
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    continue
+            return False
+
+        def work(table: Table) -> None:
+            try:
+                counts = {"insert": 0, "update": 0, "delete": 0}
+                for change in self._diff_table(
+                    template_schema, target_schema, table, stats, lock
+                ):
+                    counts[change.op] += 1
+                    if not put(change):
+                        return
+                with lock:
+                    stats.changes[table.name] = counts
+                put(_DONE)
+            except BaseException as exc:
+                put(exc)
+
+        for name in tables:
+            self.executor.submit(work, by_name[name])
+
+        try:
+            remaining = len(tables)
+            while remaining:
+                try:
+                    item = queue.get(timeout=0.1)
+                except Empty:
+                    continue
+                if item is _DONE:
+                    remaining -= 1
+                elif isinstance(item, BaseException):
+                    raise item
+                else:
+                    yield item
+        finally:
+            stop.set()
+            stats.seconds = perf_counter() - started
+
+    def diff_ndjson(self, template_schema: str, target_schema: str) -> Iterator[str]:
+        for change in self.diff(template_schema, target_schema):
+            yield change.to_json() + "\n"
+
+    def _changed_tables(self, target_schema: str, tables: list[str]) -> list[str]:
+        # the dirty-table triggers already know which tables can differ
+        with self.session_manager.base_engine.connect() as conn:
+            tracked = conn.execute(
+                text("SELECT to_regclass(:rel)"),
+                {"rel": f'"{target_schema}".{DIRTY_TABLE}'},
+            ).scalar()
+            if tracked is None:
+                return tables
+            dirty = set(
+                conn.execute(
+                    text(f'SELECT "table" FROM "{target_schema}".{DIRTY_TABLE}')
+                )
+                .scalars()
+                .all()
+            )
+        return [t for t in tables if t in dirty]
+
+    def _bucketer(
+        self, conn, table: Table, template_schema: str
+    ) -> tuple[Callable[[str], str], Callable[[str, str], str]]:
+        # the bucket expression, and a subquery of the rows in the buckets
+        # bound as :b
+        pk = list(table.primary_key.columns)
+        if len(pk) == 1 and isinstance(pk[0].type, Integer):
+            column = _quote(pk[0].name)
+            size = self.bucket_rows
+            # division truncates towards zero, so bucket b holds the ids
+            # between these bounds; range scans on the primary key find them
+            bounds = (
+                f"CASE WHEN b > 0 THEN b * {size} ELSE b * {size} - {size} + 1 END, "
+                f"CASE WHEN b < 0 THEN b * {size} ELSE b * {size} + {size} - 1 END"
+            )
+            return (
+                lambda alias: f"({alias}.{column} / {size})",
+                lambda alias, relation: (
+                    f"SELECT {alias}.* FROM (SELECT {bounds} FROM "
+                    "unnest(CAST(:b AS bigint[])) b) r (lo, hi) "
+                    f"JOIN {relation} {alias} ON {alias}.{column} BETWEEN r.lo AND r.hi"
+                ),
+            )
+        estimate = conn.execute(
+            text(
+                "SELECT GREATEST(reltuples, 0)::bigint FROM pg_class "
+                "WHERE oid = CAST(:rel AS regclass)"
+            ),
+            {"rel": f"{_quote(template_schema)}.{_quote(table.name)}"},
+        ).scalar()
+        buckets = max(1, int(estimate or 0) // self.bucket_rows)
+
+        def expression(alias: str) -> str:
+            return (
+                "(abs(hashtext(ROW("
+                + ", ".join(f"{alias}.{_quote(c.name)}" for c in pk)
+                + f")::text)) % {buckets})"
+            )
+
+        return expression, lambda alias, relation: (
+            f"SELECT * FROM {relation} {alias} WHERE {expression(alias)} = ANY(:b)"
+        )
+
+    def _diff_table(
+        self,
+        template_schema: str,
+        target_schema: str,
+        table: Table,
+        stats: DiffStats,
+        lock: Lock,
+    ) -> Iterator[RowChange]:
+        source = f"{_quote(template_schema)}.{_quote(table.name)}"
+        target = f"{_quote(target_schema)}.{_quote(table.name)}"
+        pk = [c.name for c in table.primary_key.columns]
+        with self.session_manager.base_engine.connect() as conn:
+            if not pk:
+                yield from self._diff_multiset(conn, table.name, source, target)
+                return
+
+            bucket, in_buckets = self._bucketer(conn, table, template_schema)
+            try:
+                hashes = self._bucket_hashes(conn, source, target, bucket, "record")
+            except DBAPIError:
+                # a column type without a hash function, e.g. json or point
+                conn.rollback()
+                hashes = self._bucket_hashes(conn, source, target, bucket, "text")
+            changed = [b for b, differs in hashes if differs]
+            with lock:
+                stats.buckets += len(hashes)
+                stats.changed_buckets += len(changed)
+            if not changed:
+                return
+
+            join = " AND ".join(f"o.{_quote(c)} = n.{_quote(c)}" for c in pk)
+            present_o = f"o.{_quote(pk[0])} IS NOT NULL"
+            present_n = f"n.{_quote(pk[0])} IS NOT NULL"
+            rows = conn.execution_options(stream_results=True, yield_per=500).execute(
+                text(
+                    f"""
+                    SELECT
+                        CASE WHEN {present_o} THEN to_jsonb(o) END AS before,
+                        CASE WHEN {present_n} THEN to_jsonb(n) END AS after
+                    FROM ({in_buckets("o", source)}) o
+                    FULL JOIN ({in_buckets("n", target)}) n ON {join}
+                    WHERE NOT ({present_o} AND {present_n})
+                        OR to_jsonb(o) <> to_jsonb(n)
+                    """
+                ),
+                {"b": changed},
+            )
+            for before, after in rows:
+                row = after if after is not None else before
+                yield RowChange(
+                    table=table.name,
+                    op=(
+                        "insert"
+                        if before is None
+                        else "delete" if after is None else "update"
+                    ),
+                    pk={c: row[c] for c in pk},
+                    before=before,
+                    after=after,
+                )
+
+    def _bucket_hashes(
+        self,
+        conn,
+        source: str,
+        target: str,
+        bucket: Callable[[str], str],
+        row_hash: str,
+    ) -> list:
+        # one order-independent hash per bucket on each side, so no bucket is
+        # sorted; rows are unique by pk, so the xor cannot cancel out a
+        # duplicate. hash_record_extended skips the row to text conversion
+        def side(alias: str, relation: str) -> str:
+            hashed = (
+                f"hash_record_extended({alias}, 0)"
+                if row_hash == "record"
+                else f"hashtextextended({alias}::text, 0)"
+            )
+            return (
+                f"SELECT {bucket(alias)} AS b, count(*) AS c, "
+                f"bit_xor({hashed}) AS h FROM {relation} {alias} GROUP BY 1"
+            )
+
+        return conn.execute(
+            text(
+                f"WITH o AS ({side('o', source)}), n AS ({side('n', target)}) "
+                "SELECT COALESCE(o.b, n.b), (o.c, o.h) IS DISTINCT FROM (n.c, n.h) "
+                "FROM o FULL JOIN n ON o.b = n.b"
+            )
+        ).all()
+
+    def _diff_multiset(
+        self, conn, table: str, source: str, target: str
+    ) -> Iterator[RowChange]:
+        # without a primary key rows have no identity, only inserts and deletes
+        for op, left, right in (("insert", target, source), ("delete", source, target)):
+            rows = conn.execution_options(stream_results=True, yield_per=500).execute(
+                text(
+                    f"SELECT to_jsonb(r) FROM "
+                    f"(SELECT * FROM {left} EXCEPT ALL SELECT * FROM {right}) r"
+                )
+            )
+            for (row,) in rows:
+                yield RowChange(
+                    table=table,
+                    op=op,
+                    pk={},
+                    before=row if op == "delete" else None,
+                    after=row if op == "insert" else None,
+                )
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
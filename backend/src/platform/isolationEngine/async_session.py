@@ -0,0 +1,152 @@
+from __future__ import annotations
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+from sqlalchemy import event, select, update
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from backend.src.platform.db.schema import RunTimeEnvironment
+from .session import SessionManager, _apply_search_path
+from .types import EnvironmentRoute
+
+
+def async_url(url: str) -> str:
+    # same database, asyncpg driver
+    scheme, rest = url.split("://", 1)
+    return f"postgresql+asyncpg://{rest}" if scheme.startswith("postgres") else url
+
+
+class AsyncSessionManager:
+    def __init__(
+        self,
+        base_engine: AsyncEngine,
+        session_manager: SessionManager,
+        max_database_engines: int = 32,
+        database_pool_size: int = 2,
+    ):
+        # route cache, lastUsedAt flusher, routing mode and restorer are shared
+        # with the sync manager so both paths see the same environments
+        self.base_engine = base_engine
+        self.sync = session_manager
+        self.max_database_engines = max_database_engines
+        self.database_pool_size = database_pool_size
+        self._meta_factory = async_sessionmaker(
+            bind=base_engine, expire_on_commit=False
+        )
+        self._schema_factories: OrderedDict[str, async_sessionmaker] = OrderedDict()
+        self._database_engines: OrderedDict[str, AsyncEngine] = OrderedDict()
+        self._lock = Lock()
+
+    def get_meta_session(self) -> AsyncSession:
+        return self._meta_factory()
+
+    async def lookup_environment(self, env_id: str) -> EnvironmentRoute:
+        routes = self.sync.routes
+        if routes is not None:
+            route = routes.get(env_id)
+            if route is not None:
+                await self._touch(env_id)
+                return route
+        async with self._meta_factory() as s:
+            env = await s.scalar(
+                select(RunTimeEnvironment).where(RunTimeEnvironment.id == env_id)
+            )
+            if env is None or env.status != "ready":
+                # waiting for provisioning and restoring hibernated schemas
+                # stay on the sync path
+                return await asyncio.to_thread(self.sync.lookup_environment, env_id)
+            route = self.sync._route(env)
+            if routes is not None:
+                routes.put(env_id, route, env.expiresAt)
+        await self._touch(env_id)
+        return route
+
+    async def _touch(self, env_id: str) -> None:
+        # same as SessionManager.touch, awaited on the async engine
+        if self.sync.last_used is not None:
+            self.sync.last_used.touch(env_id)
+            return
+        async with self._meta_factory() as s:
+            await s.execute(
+                update(RunTimeEnvironment)
+                .where(RunTimeEnvironment.id == env_id)
+                .values(lastUsedAt=datetime.now())
+            )
+            await s.commit()
+
+    def get_engine_for_database(self, database: str) -> AsyncEngine:
+        with self._lock:
+            engine = self._database_engines.get(database)
+            if engine is not None:
+                self._database_engines.move_to_end(database)
+                return engine
+            engine = create_async_engine(
+                self.base_engine.url.set(database=database),
+                pool_pre_ping=True,
+                pool_size=self.database_pool_size,
+                max_overflow=self.database_pool_size,
+            )
+            self._database_engines[database] = engine
+            evicted = []
+            while len(self._database_engines) > self.max_database_engines:
+                evicted.append(self._database_engines.popitem(last=False)[1])
+        for old in evicted:
+            asyncio.get_running_loop().create_task(old.dispose())
+        return engine
+
+    def get_schema_factory(self, schema: str) -> async_sessionmaker:
+        with self._lock:
+            factory = self._schema_factories.get(schema)
+            if factory is not None:
+                self._schema_factories.move_to_end(schema)
+                return factory
+            if self.sync.routing == "search_path":
+                factory = async_sessionmaker(
+                    bind=self.base_engine, info={"search_path": schema}
+                )
+            else:
+                factory = async_sessionmaker(
+                    bind=self.base_engine.execution_options(
+                        schema_translate_map={None: schema}
+                    )
+                )
+            self._schema_factories[schema] = factory
+            while len(self._schema_factories) > self.sync.max_schema_factories:
+                self._schema_factories.popitem(last=False)
+            return factory
+
+    def get_session_for_route(self, route: EnvironmentRoute, **kw) -> AsyncSession:
+        if route.database is not None:
+            return AsyncSession(
+                bind=self.get_engine_for_database(route.database), **kw
+            )
+        session = self.get_schema_factory(route.schema)(**kw)
+        if self.sync.routing == "search_path":
+            event.listen(session.sync_session, "after_begin", _apply_search_path)
+        if route.lazy and route.template_schema:
+            # the hooks run inside the greenlet, so the sync materializer works
+            self.sync.lazy.attach(
+                session.sync_session, route.schema, route.template_schema
+            )
+        return session
+
+    async def lookup_token(self, token: str) -> EnvironmentRoute:
+        claims = self.sync.token_handler.decode_token(token)
+        return await self.lookup_environment(claims["environment_id"])
+
+    async def get_session_for_token(self, token: str) -> AsyncSession:
+        route = await self.lookup_token(token)
+        return self.get_session_for_route(route, expire_on_commit=False)
+
+    async def dispose(self) -> None:
+        with self._lock:
+            engines = list(self._database_engines.values())
+            self._database_engines.clear()
+        for engine in engines:
+            await engine.dispose()
+        await self.base_engine.dispose()
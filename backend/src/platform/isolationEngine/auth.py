@@ -1,22 +1,78 @@
 from jwt import decode, encode
 from os import environ
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from hashlib import sha256
+from threading import Lock
+from time import time
 from uuid import uuid4
 
+TOKEN_REVOKED_CHANNEL = "dtu_token_revoked"
+
 
 class TokenHandler:
-    def __init__(self, secret: str = environ["SECRET_KEY"], audience: str = "dtu"):
+    def __init__(
+        self,
+        secret: str = environ["SECRET_KEY"],
+        audience: str = "dtu",
+        cache_size: int = 10000,
+    ):
         self.secret = secret
         self.audience = audience
+        # verified claims by token digest, each entry dies with its exp
+        self.cache_size = cache_size
+        self._verified: OrderedDict[bytes, dict] = OrderedDict()
+        self._revoked: dict[str, float] = {}  # jti -> exp
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def decode_token(self, token: str, check_revoked: bool = True) -> dict:
+        digest = sha256(token.encode()).digest()
+        now = time()
+        with self._lock:
+            claims = self._verified.get(digest)
+            if claims is not None and claims["exp"] > now:
+                self._verified.move_to_end(digest)
+                self.hits += 1
+            else:
+                self._verified.pop(digest, None)
+                claims = None
+                self.misses += 1
+        if claims is None:
+            claims = decode(
+                token,
+                self.secret,
+                algorithms=["HS256"],
+                audience=self.audience,
+                options={"require": ["exp", "iat", "aud"]},
+            )
+        with self._lock:
+            if check_revoked and claims.get("jti") in self._revoked:
+                self._verified.pop(digest, None)
+                raise PermissionError("token revoked")
+            if self.cache_size > 0:
+                self._verified[digest] = claims
+                while len(self._verified) > self.cache_size:
+                    self._verified.popitem(last=False)
+        return dict(claims)
+
+    def revoke(self, jti: str, exp: float) -> None:
+        self.revoke_many({jti: exp})
+
+    def revoke_many(self, revoked: dict[str, float]) -> None:
+        with self._lock:
+            now = time()
+            # a revoked jti only matters until the token would expire anyway
+            self._revoked = {j: e for j, e in self._revoked.items() if e > now}
+            self._revoked.update(revoked)
+            stale = [d for d, c in self._verified.items() if c.get("jti") in revoked]
+            for digest in stale:
+                del self._verified[digest]
 
-    def decode_token(self, token: str) -> dict:
-        return decode(
-            token,
-            self.secret,
-            algorithms=["HS256"],
-            audience=self.audience,
-            options={"require": ["exp", "iat", "aud"]},
-        )
+    def on_revoked(self, payload: str) -> None:
+        jti, _, exp = payload.partition(":")
+        self.revoke(jti, float(exp))
 
     def encode_token(self, payload: dict) -> str:
         return encode(payload, self.secret, algorithm="HS256")
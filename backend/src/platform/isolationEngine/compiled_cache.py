@@ -0,0 +1,63 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from threading import Lock
+from sqlalchemy import Engine, event
+
+
+@dataclass
+class CompiledCacheSnapshot:
+    hits: int
+    misses: int
+    uncached: int  # statements SQLAlchemy could not or would not cache
+    entries: int  # current size of the engine's compiled cache
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class CompiledCacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+        self._engines: list[Engine] = []
+        self._lock = Lock()
+
+    def attach(self, engine: Engine) -> None:
+        event.listen(engine, "before_cursor_execute", self._record)
+        with self._lock:
+            self._engines.append(engine)
+
+    def detach(self, engine: Engine) -> None:
+        event.remove(engine, "before_cursor_execute", self._record)
+        with self._lock:
+            self._engines.remove(engine)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if context is None:
+            return
+        with self._lock:
+            if context.cache_hit is context.dialect.CACHE_HIT:
+                self.hits += 1
+            elif context.cache_hit is context.dialect.CACHE_MISS:
+                self.misses += 1
+            else:
+                self.uncached += 1
+
+    def snapshot(self) -> CompiledCacheSnapshot:
+        with self._lock:
+            entries = sum(
+                len(engine._compiled_cache or ()) for engine in self._engines
+            )
+            return CompiledCacheSnapshot(
+                hits=self.hits,
+                misses=self.misses,
+                uncached=self.uncached,
+                entries=entries,
+            )
+
+    def reset(self) -> None:
+        with self._lock:
+            self.hits = self.misses = self.uncached = 0
@@ -1,10 +1,29 @@
-from .auth import TokenHandler
+from .auth import TOKEN_REVOKED_CHANNEL, TokenHandler
 from .session import SessionManager
 from contextlib import contextmanager
+from typing import BinaryIO, Iterator
+from .database import DatabaseHandler
 from .environment import EnvironmentHandler
+from .pool import WarmPoolManager
+from .provisioning import ProvisioningExecutor
+from .snapshot import SnapshotHandler, SnapshotStats
 from uuid import uuid4
-from .types import InitEnvRequest, InitEnvResult
+from .types import (
+    BatchInitResult,
+    ForkResult,
+    InitEnvRequest,
+    InitEnvResult,
+    ResetResult,
+)
 from datetime import datetime, timedelta
+from time import monotonic, perf_counter, sleep
+from sqlalchemy import delete, select, text
+from sqlalchemy.dialects.postgresql import insert
+from backend.src.platform.db.schema import (
+    RevokedToken,
+    RunTimeEnvironment,
+    TemplateEnvironment,
+)
 
 
 class Core:
@@ -13,40 +32,229 @@ class Core:
         token: TokenHandler,
         sessions: SessionManager,
         environment_handler: EnvironmentHandler,
+        pool: WarmPoolManager | None = None,
+        database_handler: DatabaseHandler | None = None,
+        provisioner: ProvisioningExecutor | None = None,
+        snapshots: SnapshotHandler | None = None,
     ):
         self.token = token
         self.sessions = sessions
         self.environment_handler = environment_handler
+        self.pool = pool
+        self.database_handler = database_handler or DatabaseHandler(sessions)
+        self.provisioner = provisioner or ProvisioningExecutor()
+        self.snapshots = snapshots or SnapshotHandler(
+            sessions, environment_handler.template_cache
+        )
 
     def get_session_for_token(self, token: str):
         claims = self.token.decode_token(token)
-        schema, _ = self.sessions.lookup_environment(claims["environment_id"])
-        return self.sessions.get_session_for_schema(schema)
+        route = self.sessions.lookup_environment(claims["environment_id"])
+        return self.sessions.get_session_for_route(route)
 
     @contextmanager
     def with_session(self, token: str):
         claims = self.token.decode_token(token)
-        schema, _ = self.sessions.lookup_environment(claims["environment_id"])
-        with self.sessions.get_session_for_schema(schema) as s:
+        route = self.sessions.lookup_environment(claims["environment_id"])
+        with self.sessions.get_session_for_route(route) as s:
             yield s
 
-    def init_env_and_issue_token(self, request: InitEnvRequest) -> InitEnvResult:
-        evn_uuid = uuid4()
-        environment_id = evn_uuid.hex
-        environment_schema = f"state_{environment_id}"
-        self.environment_handler.create_schema(environment_schema)
-        self.environment_handler.migrate_schema(
-            request.environment_schema, environment_schema
-        )
-        self.environment_handler.seed_data_from_template(
-            request.environment_schema, environment_schema
+    def revoke_token(self, token: str) -> None:
+        # revoking twice is a no-op, so skip the check that would reject it
+        claims = self.token.decode_token(token, check_revoked=False)
+        payload = f"{claims['jti']}:{claims['exp']}"
+        # running workers learn about it through TOKEN_REVOKED_CHANNEL, new or
+        # reconnecting ones from revoked_tokens via load_revoked_tokens
+        with self.sessions.get_meta_session() as s:
+            s.execute(
+                insert(RevokedToken)
+                .values(
+                    jti=claims["jti"],
+                    expiresAt=datetime.fromtimestamp(claims["exp"]),
+                )
+                .on_conflict_do_nothing(index_elements=[RevokedToken.jti])
+            )
+            s.execute(
+                delete(RevokedToken).where(RevokedToken.expiresAt <= datetime.now())
+            )
+            s.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": TOKEN_REVOKED_CHANNEL, "payload": payload},
+            )
+            s.commit()
+        # only once committed, so a failed revoke leaves this worker in step
+        # with the table
+        self.token.on_revoked(payload)
+
+    def load_revoked_tokens(self) -> None:
+        with self.sessions.get_meta_session() as s:
+            rows = s.execute(
+                select(RevokedToken.jti, RevokedToken.expiresAt).where(
+                    RevokedToken.expiresAt > datetime.now()
+                )
+            ).all()
+        self.token.revoke_many({jti: expires.timestamp() for jti, expires in rows})
+
+    def init_env_and_issue_token(
+        self, request: InitEnvRequest, wait: bool = True
+    ) -> InitEnvResult:
+        expires_at = datetime.now() + timedelta(seconds=request.ttl_seconds)
+        claimed = (
+            self.pool.claim(
+                request.environment_schema,
+                expires_at=expires_at,
+                permanent=request.permanent,
+                max_idle_seconds=request.max_idle_seconds,
+            )
+            if self.pool and not request.lazy
+            else None
         )
+        if claimed:
+            environment_id, _ = claimed
+            return self._issue(environment_id, request, expires_at, "ready")
+
+        template = self.environment_handler.get_template(request.environment_schema)
+        isolation, source = self._template_source(request, template)
+        environment_id = uuid4().hex
+        name = f"state_{environment_id}"
         self.environment_handler.set_runtime_environment(
             environment_id=environment_id,
-            schema=environment_schema,
-            expires_at=datetime.now() + timedelta(seconds=request.ttl_seconds),
+            schema=name,
+            database=name if isolation == "database" else None,
+            template_id=template.id if template else None,
+            template_schema=source,
+            lazy=isolation == "lazy",
+            status="initializing",
+            expires_at=expires_at,
             last_used_at=datetime.now(),
+            permanent=request.permanent,
+            max_idle_seconds=request.max_idle_seconds,
+        )
+        journal = template is None or template.journalEnabled
+        if wait:
+            self._provision(environment_id, isolation, source, name, journal)
+            return self._issue(environment_id, request, expires_at, "ready")
+        try:
+            self.provisioner.submit(
+                environment_id,
+                self._provision,
+                environment_id,
+                isolation,
+                source,
+                name,
+                journal,
+            )
+        except RuntimeError:
+            self.environment_handler.set_runtime_status(environment_id, "deleted")
+            raise
+        return self._issue(environment_id, request, expires_at, "initializing")
+
+    def init_envs_batch(
+        self, request: InitEnvRequest, count: int, chunk_size: int = 25
+    ) -> BatchInitResult:
+        started = perf_counter()
+        template = self.environment_handler.get_template(request.environment_schema)
+        isolation, source = self._template_source(request, template)
+        if isolation != "schema":
+            environments = [
+                self.init_env_and_issue_token(request) for _ in range(count)
+            ]
+            return BatchInitResult(
+                environments=environments,
+                timings={"provision": perf_counter() - started},
+                seconds=perf_counter() - started,
+            )
+
+        environment_ids = [uuid4().hex for _ in range(count)]
+        schemas = [f"state_{environment_id}" for environment_id in environment_ids]
+        now = datetime.now()
+        expires_at = now + timedelta(seconds=request.ttl_seconds)
+        try:
+            timings = self.environment_handler.clone_template_many(
+                source,
+                schemas,
+                chunk_size,
+                journal=template is None or template.journalEnabled,
+            )
+            phase = perf_counter()
+            self.environment_handler.set_runtime_environments(
+                [
+                    {
+                        "id": environment_id,
+                        "schema": schema,
+                        "status": "ready",
+                        "templateId": template.id if template else None,
+                        "templateSchema": source,
+                        "permanent": request.permanent,
+                        "maxIdleSeconds": request.max_idle_seconds,
+                        "expiresAt": expires_at,
+                        "lastUsedAt": now,
+                    }
+                    for environment_id, schema in zip(environment_ids, schemas)
+                ]
+            )
+            timings["register"] = perf_counter() - phase
+        except Exception:
+            # unregistered schemas are invisible to the reaper
+            for schema in schemas:
+                self.environment_handler.drop_schema(schema)
+            raise
+
+        phase = perf_counter()
+        environments = [
+            self._issue(environment_id, request, expires_at, "ready")
+            for environment_id in environment_ids
+        ]
+        timings["tokens"] = perf_counter() - phase
+        return BatchInitResult(
+            environments=environments,
+            timings=timings,
+            seconds=perf_counter() - started,
         )
+
+    def _template_source(
+        self, request: InitEnvRequest, template: TemplateEnvironment | None
+    ) -> tuple[str, str]:
+        if template is not None and template.kind == "database":
+            return "database", template.location
+        source = request.environment_schema
+        if template is not None and template.kind == "artifact":
+            source = self.snapshots.ensure_template_schema(
+                template.id.hex, template.location
+            )
+        return ("lazy" if request.lazy else "schema"), source
+
+    def _provision(
+        self,
+        environment_id: str,
+        isolation: str,
+        source: str,
+        name: str,
+        journal: bool = True,
+    ) -> None:
+        try:
+            if isolation == "database":
+                self.database_handler.clone_database(source, name)
+            elif isolation == "lazy":
+                self.environment_handler.create_lazy_schema(source, name)
+            else:
+                self.environment_handler.clone_template(source, name, journal)
+        except Exception:
+            if isolation == "database":
+                self.database_handler.drop_database(name)
+            else:
+                self.environment_handler.drop_schema(name)
+            self.environment_handler.set_runtime_status(environment_id, "deleted")
+            raise
+        self.environment_handler.set_runtime_status(environment_id, "ready")
+
+    def _issue(
+        self,
+        environment_id: str,
+        request: InitEnvRequest,
+        expires_at: datetime,
+        status: str,
+    ) -> InitEnvResult:
         token = self.token.issue_token(
             environment_id=environment_id,
             user_id=request.user_id,
@@ -57,6 +265,157 @@ class Core:
             environment_id=environment_id,
             impersonate_user_id=request.impersonate_user_id,
             user_id=request.user_id,
-            expires_at=datetime.now() + timedelta(seconds=request.ttl_seconds),
+            expires_at=expires_at,
             token=token,
+            status=status,
+        )
+
+    def environment_status(self, environment_id: str) -> str | None:
+        with self.sessions.get_meta_session() as s:
+            return s.scalar(
+                select(RunTimeEnvironment.status).where(
+                    RunTimeEnvironment.id == environment_id
+                )
+            )
+
+    def wait_until_ready(
+        self, environment_id: str, timeout: float = 30.0
+    ) -> str | None:
+        deadline = monotonic() + timeout
+        self.provisioner.wait(environment_id, timeout)
+        while True:
+            status = self.environment_status(environment_id)
+            if status != "initializing" or monotonic() >= deadline:
+                return status
+            sleep(0.2)
+
+    def reset_environment(self, environment_id: str) -> ResetResult:
+        started = perf_counter()
+        route = self.sessions.lookup_environment(environment_id)
+        if route.template_schema is None:
+            raise ValueError("environment has no template to reset to")
+        if route.database is not None:
+            self.database_handler.drop_database(route.database)
+            self.database_handler.clone_database(route.template_schema, route.database)
+            tables = []
+        elif route.lazy:
+            tables = self.environment_handler.reset_lazy_schema(
+                route.template_schema, route.schema
+            )
+        else:
+            tables = self.environment_handler.reset_schema(
+                route.template_schema, route.schema
+            )
+        return ResetResult(
+            environment_id=environment_id,
+            tables=tables,
+            seconds=perf_counter() - started,
+        )
+
+    def fork_environment(
+        self,
+        environment_id: str,
+        *,
+        user_id: str,
+        impersonate_user_id: str | None = None,
+        count: int = 1,
+        ttl_seconds: int = 1800,
+    ) -> ForkResult:
+        started = perf_counter()
+        route = self.sessions.lookup_environment(environment_id)
+        if route.database is not None or route.lazy:
+            raise ValueError("only schema environments can be forked")
+        with self.sessions.get_meta_session() as s:
+            parent = s.scalars(
+                select(RunTimeEnvironment).where(
+                    RunTimeEnvironment.id == environment_id
+                )
+            ).one()
+        child_ids = [uuid4().hex for _ in range(count)]
+        schemas = [f"state_{child_id}" for child_id in child_ids]
+        now = datetime.now()
+        expires_at = now + timedelta(seconds=ttl_seconds)
+        try:
+            reports = self.environment_handler.fork_schema(route.schema, schemas)
+            # children are tracked and reaped like the environment they came from
+            self.environment_handler.set_runtime_environments(
+                [
+                    {
+                        "id": child_id,
+                        "schema": schema,
+                        "status": "ready",
+                        "templateId": parent.templateId,
+                        "templateSchema": route.template_schema,
+                        "permanent": parent.permanent,
+                        "maxIdleSeconds": parent.maxIdleSeconds,
+                        "expiresAt": expires_at,
+                        "lastUsedAt": now,
+                    }
+                    for child_id, schema in zip(child_ids, schemas)
+                ]
+            )
+        except Exception:
+            # without a RunTimeEnvironment row the reaper never finds them
+            for schema in schemas:
+                self.environment_handler.drop_schema(schema)
+            raise
+        children = [
+            InitEnvResult(
+                environment_id=child_id,
+                user_id=user_id,
+                impersonate_user_id=impersonate_user_id,
+                expires_at=expires_at,
+                token=self.token.issue_token(
+                    environment_id=child_id,
+                    user_id=user_id,
+                    impersonate_user_id=impersonate_user_id,
+                    token_ttl_seconds=ttl_seconds,
+                ),
+            )
+            for child_id in child_ids
+        ]
+        return ForkResult(
+            source_environment_id=environment_id,
+            environments=children,
+            rows=sum(sum(r.rows.values()) for r in reports),
+            seconds=perf_counter() - started,
+        )
+
+    def stream_changes(self, environment_id: str, since_id: int = 0) -> Iterator[str]:
+        route = self.sessions.lookup_environment(environment_id)
+        if route.database is not None or route.lazy:
+            raise ValueError("only schema environments keep a change journal")
+        return self.environment_handler.stream_changes(route.schema, since_id)
+
+    def export_environment(self, environment_id: str, out: BinaryIO) -> SnapshotStats:
+        route = self.sessions.lookup_environment(environment_id)
+        if route.database is not None or route.lazy:
+            raise ValueError("only schema environments can be exported")
+        return self.snapshots.export_schema(route.schema, out)
+
+    def import_environment(
+        self,
+        src: BinaryIO,
+        *,
+        user_id: str,
+        impersonate_user_id: str | None = None,
+        ttl_seconds: int = 1800,
+    ) -> InitEnvResult:
+        environment_id = uuid4().hex
+        schema = f"state_{environment_id}"
+        self.snapshots.import_schema(src, schema, track_changes=True)
+        request = InitEnvRequest(
+            environment_schema=schema,
+            user_id=user_id,
+            impersonate_user_id=impersonate_user_id,
+            ttl_seconds=ttl_seconds,
+        )
+        expires_at = datetime.now() + timedelta(seconds=ttl_seconds)
+        self.environment_handler.set_runtime_environment(
+            environment_id=environment_id,
+            schema=schema,
+            expires_at=expires_at,
+            last_used_at=datetime.now(),
+            max_idle_seconds=request.max_idle_seconds,
         )
+        return self._issue(environment_id, request, expires_at, "ready")
@@ -0,0 +1,39 @@
+from __future__ import annotations
+from threading import Lock
+from sqlalchemy import text
+from .session import SessionManager
+
+
+class DatabaseHandler:
+    def __init__(self, session_manager: SessionManager):
+        self.session_manager = session_manager
+        # CREATE DATABASE ... TEMPLATE fails if another session is connected to
+        # the template, so clones of the same template are serialized
+        self._template_locks: dict[str, Lock] = {}
+        self._lock = Lock()
+
+    def _template_lock(self, template_database: str) -> Lock:
+        with self._lock:
+            return self._template_locks.setdefault(template_database, Lock())
+
+    def clone_database(self, template_database: str, target_database: str) -> None:
+        engine = self.session_manager.base_engine.execution_options(
+            isolation_level="AUTOCOMMIT"
+        )
+        with self._template_lock(template_database), engine.connect() as conn:
+            major = (conn.dialect.server_version_info or (0,))[0]
+            strategy = " STRATEGY FILE_COPY" if major >= 15 else ""
+            conn.execute(
+                text(
+                    f'CREATE DATABASE "{target_database}" '
+                    f'TEMPLATE "{template_database}"{strategy}'
+                )
+            )
+
+    def drop_database(self, database: str) -> None:
+        self.session_manager.dispose_database_engine(database)
+        engine = self.session_manager.base_engine.execution_options(
+            isolation_level="AUTOCOMMIT"
+        )
+        with engine.connect() as conn:
+            conn.execute(text(f'DROP DATABASE IF EXISTS "{database}" WITH (FORCE)'))
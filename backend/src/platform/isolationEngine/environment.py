@@ -1,28 +1,67 @@
+from concurrent.futures import wait
 from datetime import datetime
-from typing import Iterable
-from sqlalchemy import text, MetaData
-from backend.src.platform.db.schema import RunTimeEnvironment
+from time import perf_counter
+from typing import Iterator
+from uuid import UUID
+from sqlalchemy import select, text, update
+from sqlalchemy.exc import DBAPIError
+from backend.src.platform.db.schema import RunTimeEnvironment, TemplateEnvironment
 from .auth import TokenHandler
 from .session import SessionManager
+from .routing import notify_changed
+from .seeding import SeedingEngine, SeedReport
+from .sequences import reset_sequences, reset_sequences_many
+from .templates import CompiledTemplate, TemplateCache
+from .tracking import JOURNAL_FUNCTION, ChangeTracker
 
 
 class EnvironmentHandler:
-    def __init__(self, token_handler: TokenHandler, session_manager: SessionManager):
+    def __init__(
+        self,
+        token_handler: TokenHandler,
+        session_manager: SessionManager,
+        template_cache: TemplateCache | None = None,
+        seeder: SeedingEngine | None = None,
+    ):
         self.token_handler = token_handler
         self.session_manager = session_manager
+        self.template_cache = template_cache or TemplateCache(
+            session_manager.base_engine
+        )
+        self.seeder = seeder or SeedingEngine(session_manager.base_engine)
+        self.tracker = ChangeTracker()
+
+    def get_template(self, location: str) -> TemplateEnvironment | None:
+        with self.session_manager.get_meta_session() as s:
+            return s.scalars(
+                select(TemplateEnvironment)
+                .where(TemplateEnvironment.location == location)
+                .order_by(TemplateEnvironment.createdAt.desc())
+                .limit(1)
+            ).first()
 
     def create_schema(self, schema: str) -> None:
         with self.session_manager.get_meta_session() as conn:
             conn.execute(text(f'CREATE SCHEMA "{schema}"'))
+            conn.commit()
 
-    def migrate_schema(self, template_schema: str, target_schema: str) -> None:
-        engine = self.session_manager.base_engine
-        meta = MetaData()
-        meta.reflect(bind=engine, schema=template_schema)
-        translated = engine.execution_options(
-            schema_translate_map={template_schema: target_schema}
-        )
-        meta.create_all(translated)
+    def drop_schema(self, schema: str) -> None:
+        with self.session_manager.get_meta_session() as conn:
+            conn.execute(text(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE'))
+            conn.commit()
+        self.session_manager.forget_schema(schema)
+
+    def migrate_schema(
+        self,
+        template_schema: str,
+        target_schema: str,
+        compiled: CompiledTemplate | None = None,
+    ) -> None:
+        compiled = compiled or self.template_cache.get(template_schema)
+        with self.session_manager.base_engine.begin() as conn:
+            conn.execution_options(no_parameters=True).exec_driver_sql(
+                compiled.render(target_schema)
+            )
 
     def _list_tables(self, conn, schema: str) -> list[str]:
         rows = conn.execute(
@@ -38,57 +77,333 @@ class EnvironmentHandler:
         ).fetchall()
         return [r[0] for r in rows]
 
-    def _reset_sequences(self, conn, schema: str, tables: Iterable[str]) -> None:
-        for tbl in tables:
-            seq_name_row = conn.execute(
-                text("SELECT pg_get_serial_sequence(:rel, 'id')"),
-                {"rel": f"{schema}.{tbl}"},
-            ).fetchone()
-            if not seq_name_row or not seq_name_row[0]:
-                continue
-            conn.execute(
-                text(
-                    "SELECT setval(:seq, COALESCE((SELECT MAX(id) FROM "
-                    f'"{schema}".{tbl}'
-                    "), 0) + 1, false)"
-                ),
-                {"seq": seq_name_row[0]},
-            )
+    def _reset_sequences(self, conn, schema: str) -> None:
+        reset_sequences(conn, schema)
 
     def seed_data_from_template(
         self,
         template_schema: str,
         target_schema: str,
         tables_order: list[str] | None = None,
-    ) -> None:
+    ) -> SeedReport:
+        compiled = self.template_cache.get(template_schema)
+        levels = [[t] for t in tables_order] if tables_order else compiled.levels
+        report = self.seeder.seed(template_schema, target_schema, levels)
+        with self.session_manager.base_engine.begin() as conn:
+            self._reset_sequences(conn, target_schema)
+        return report
+
+    def clone_template(
+        self, template_schema: str, target_schema: str, journal: bool = True
+    ) -> SeedReport:
+        self.create_schema(target_schema)
+        self.migrate_schema(template_schema, target_schema)
+        report = self.seed_data_from_template(template_schema, target_schema)
+        with self.session_manager.base_engine.begin() as conn:
+            compiled = self.template_cache.get(template_schema, conn)
+            self.tracker.install(
+                conn,
+                target_schema,
+                compiled.tables,
+                compiled.primary_keys if journal else None,
+            )
+        return report
+
+    def clone_template_many(
+        self,
+        template_schema: str,
+        target_schemas: list[str],
+        chunk_size: int = 25,
+        journal: bool = True,
+    ) -> dict[str, float]:
+        timings: dict[str, float] = {}
+        engine = self.session_manager.base_engine
+
+        started = perf_counter()
+        compiled = self.template_cache.get(template_schema)
+        timings["compile"] = perf_counter() - started
+
+        started = perf_counter()
+        for i in range(0, len(target_schemas), chunk_size):
+            script = []
+            for schema in target_schemas[i : i + chunk_size]:
+                script.append(f'CREATE SCHEMA "{schema}"')
+                script.append(compiled.render(schema))
+            with engine.begin() as conn:
+                conn.execution_options(no_parameters=True).exec_driver_sql(
+                    ";\n".join(script)
+                )
+        timings["ddl"] = perf_counter() - started
+
+        started = perf_counter()
+        self.seeder.seed_many(
+            template_schema, target_schemas, compiled.levels, chunk_size
+        )
+        timings["seed"] = perf_counter() - started
+
+        started = perf_counter()
+        primary_keys = compiled.primary_keys if journal else None
+        with engine.begin() as conn:
+            reset_sequences_many(conn, target_schemas)
+            conn.exec_driver_sql(
+                ";\n".join(
+                    stmt
+                    for schema in target_schemas
+                    for stmt in self.tracker.statements(
+                        schema, compiled.tables, primary_keys
+                    )
+                )
+            )
+        timings["finalize"] = perf_counter() - started
+        return timings
+
+    def fork_schema(
+        self, source_schema: str, target_schemas: list[str]
+    ) -> list[SeedReport]:
+        # live schemas change between forks, so their DDL is not kept in the cache
+        compiled = self.template_cache.get(source_schema, store=False)
+        with self.session_manager.base_engine.connect() as holder:
+            holder = holder.execution_options(isolation_level="REPEATABLE READ")
+            with holder.begin():
+                # all children copy the same point in time while the agent writes
+                snapshot = holder.execute(text("SELECT pg_export_snapshot()")).scalar()
+                # children journal their own writes only if the source does
+                primary_keys = (
+                    compiled.primary_keys
+                    if self.tracker.has_journal(holder, source_schema)
+                    else None
+                )
+                for target_schema in target_schemas:
+                    self.create_schema(target_schema)
+                    self.migrate_schema(source_schema, target_schema, compiled)
+
+                def fork(target_schema: str) -> SeedReport:
+                    def finalize(conn) -> None:
+                        self.tracker.install(
+                            conn, target_schema, compiled.tables, primary_keys
+                        )
+                        # a child differs from the template wherever its
+                        # parent did
+                        self.tracker.copy_dirty(conn, source_schema, target_schema)
+
+                    report = self.seeder.seed_snapshot(
+                        source_schema,
+                        target_schema,
+                        compiled.tables,
+                        snapshot,
+                        finalize,
+                    )
+                    # the catalog query behind it would not see sequences
+                    # created after the snapshot, so it runs afterwards
+                    with self.session_manager.base_engine.begin() as conn:
+                        self._reset_sequences(conn, target_schema)
+                    return report
+
+                futures = [
+                    self.seeder.executor.submit(fork, target_schema)
+                    for target_schema in target_schemas
+                ]
+                # let every copy finish before a failure reaches the caller,
+                # who drops the children
+                wait(futures)
+                return [future.result() for future in futures]
+
+    def reset_schema(self, template_schema: str, target_schema: str) -> list[str]:
+        compiled = self.template_cache.get(template_schema)
         engine = self.session_manager.base_engine
         with engine.begin() as conn:
-            meta = MetaData()
-            meta.reflect(bind=engine, schema=template_schema)
-            ordered = [t.name for t in meta.sorted_tables]
-            for tbl in ordered:
+            dirty = self.tracker.dirty_tables(conn, target_schema)
+            if not dirty:
+                return []
+            triggers = self.tracker.triggers(conn, target_schema)
+            # restoring template rows is not an agent change
+            self.tracker.disable_capture(conn)
+            recopy = set(dirty)
+            if JOURNAL_FUNCTION in triggers:
+                recopy = dirty - self._restore_changed_rows(
+                    conn, compiled, template_schema, target_schema, dirty
+                )
+            # tables referencing a truncated one have to be re-copied as well
+            children: dict[str, set[str]] = {}
+            for table in compiled.metadata.sorted_tables:
+                for fk in table.foreign_keys:
+                    children.setdefault(fk.column.table.name, set()).add(table.name)
+            pending = list(recopy)
+            while pending:
+                for child in children.get(pending.pop(), ()):
+                    if child not in recopy:
+                        recopy.add(child)
+                        pending.append(child)
+            if recopy:
                 conn.execute(
                     text(
-                        f'INSERT INTO "{target_schema}".{tbl} SELECT * FROM "{template_schema}".{tbl}'
+                        "TRUNCATE "
+                        + ", ".join(
+                            f'"{target_schema}"."{t}"'
+                            for t in compiled.tables
+                            if t in recopy
+                        )
                     )
                 )
-            self._reset_sequences(conn, target_schema, ordered)
+        if recopy:
+            # parallel per FK level like a fresh clone, so the copy is no longer
+            # one transaction; the dirty set is kept until it is done, and a
+            # failed reset is repaired by the next one
+            levels = [[t for t in level if t in recopy] for level in compiled.levels]
+            self.seeder.seed(
+                template_schema,
+                target_schema,
+                [level for level in levels if level],
+                skip_triggers=triggers,
+            )
+        with engine.begin() as conn:
+            self._reset_sequences(conn, target_schema)
+            self.tracker.clear(conn, target_schema)
+        return [t for t in compiled.tables if t in dirty or t in recopy]
+
+    def _restore_changed_rows(
+        self,
+        conn,
+        compiled: CompiledTemplate,
+        template_schema: str,
+        target_schema: str,
+        dirty: set[str],
+    ) -> set[str]:
+        # undo the journalled changes row by row, so a small edit costs
+        # O(changes) instead of a table copy; returns the tables restored.
+        # TRUNCATE is not journalled, so a table whose row count still differs
+        # from the template afterwards is left for the full copy
+        tables = {t.name: t for t in compiled.metadata.sorted_tables}
+        keyed = [
+            t for t in compiled.tables if t in dirty and compiled.primary_keys[t]
+        ]
+        inserts, updates, deletes = [], [], []
+        for name in keyed:
+            pk = compiled.primary_keys[name]
+            keys = self.tracker.changed_keys(target_schema, name, pk)
+            target = f'"{target_schema}"."{name}"'
+            source = f'"{template_schema}"."{name}"'
+            using = ", ".join(f'"{c}"' for c in pk)
+            match = " AND ".join(f'x."{c}" = t."{c}"' for c in pk)
+            columns = [
+                c.name
+                for c in tables[name].columns
+                if not c.primary_key
+                and c.computed is None
+                and not (c.identity is not None and c.identity.always)
+            ]
+            inserts.append(
+                (
+                    name,
+                    f"WITH k AS ({keys}) INSERT INTO {target} OVERRIDING SYSTEM "
+                    f"VALUE SELECT t.* FROM {source} t JOIN k USING ({using}) "
+                    f"WHERE NOT EXISTS (SELECT FROM {target} x WHERE {match})",
+                )
+            )
+            if columns:
+                assignments = ", ".join(f'"{c}" = t."{c}"' for c in columns)
+                updates.append(
+                    (
+                        name,
+                        f"WITH k AS ({keys}) UPDATE {target} x SET {assignments} "
+                        f"FROM {source} t JOIN k USING ({using}) WHERE {match}",
+                    )
+                )
+            deletes.append(
+                (
+                    name,
+                    f"WITH k AS ({keys}) DELETE FROM {target} x "
+                    f"WHERE ({using}) IN (SELECT * FROM k) AND NOT EXISTS "
+                    f"(SELECT FROM {source} t WHERE {match})",
+                )
+            )
+        # parents first for inserts, children first for deletes
+        statements = inserts + updates + deletes[::-1]
+        try:
+            with conn.begin_nested():
+                for name, statement in statements:
+                    conn.execute(text(statement), {"table": name})
+        except DBAPIError:
+            # e.g. a constraint the row order cannot satisfy: copy everything
+            return set()
+        restored = set()
+        for name in keyed:
+            if conn.execute(
+                text(
+                    f'SELECT (SELECT count(*) FROM "{target_schema}"."{name}") = '
+                    f'(SELECT count(*) FROM "{template_schema}"."{name}")'
+                )
+            ).scalar():
+                restored.add(name)
+        return restored
+
+    def reset_lazy_schema(self, template_schema: str, target_schema: str) -> list[str]:
+        with self.session_manager.base_engine.begin() as conn:
+            return self.session_manager.lazy.reset(
+                conn, template_schema, target_schema
+            )
+
+    def create_lazy_schema(self, template_schema: str, target_schema: str) -> None:
+        compiled = self.template_cache.get(template_schema)
+        with self.session_manager.base_engine.begin() as conn:
+            conn.execute(text(f'CREATE SCHEMA "{target_schema}"'))
+            self.session_manager.lazy.create(
+                conn, template_schema, target_schema, compiled.tables
+            )
+
+    def stream_changes(self, schema: str, since_id: int = 0) -> Iterator[str]:
+        with self.session_manager.base_engine.connect() as conn:
+            if not self.tracker.has_journal(conn, schema):
+                raise ValueError("change journal is disabled for this environment")
+            yield from self.tracker.stream_journal(conn, schema, since_id)
+
+    def set_runtime_environments(self, rows: list[dict]) -> None:
+        with self.session_manager.get_meta_session() as s:
+            s.add_all(RunTimeEnvironment(**row) for row in rows)
+            s.commit()
 
     def set_runtime_environment(
         self,
         environment_id: str,
         schema: str,
         expires_at: datetime | None,
-        last_used_at: datetime,
+        last_used_at: datetime | None,
+        status: str = "ready",
+        template_id: UUID | None = None,
+        pooled: bool = False,
+        database: str | None = None,
+        template_schema: str | None = None,
+        lazy: bool = False,
+        permanent: bool = False,
+        max_idle_seconds: int | None = None,
     ) -> None:
         with self.session_manager.get_meta_session() as s:
             s.add(
                 RunTimeEnvironment(
                     id=environment_id,
                     schema=schema,
-                    status="ready",
+                    database=database,
+                    templateSchema=template_schema,
+                    lazy=lazy,
+                    status=status,
+                    templateId=template_id,
+                    pooled=pooled,
+                    permanent=permanent,
+                    maxIdleSeconds=max_idle_seconds,
                     expiresAt=expires_at,
                     lastUsedAt=last_used_at,
                 )
             )
             s.commit()
+
+    def set_runtime_status(self, environment_id: str, status: str) -> None:
+        with self.session_manager.get_meta_session() as s:
+            s.execute(
+                update(RunTimeEnvironment)
+                .where(RunTimeEnvironment.id == environment_id)
+                .values(status=status, updatedAt=datetime.now())
+            )
+            notify_changed(s, [environment_id])
+            s.commit()
+        if self.session_manager.routes is not None:
+            self.session_manager.routes.invalidate(environment_id)
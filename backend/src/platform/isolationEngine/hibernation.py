@@ -0,0 +1,286 @@
+from __future__ import annotations
+import asyncio
+import gzip
+import json
+import logging
+import shutil
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from threading import Lock
+from time import perf_counter
+from sqlalchemy import func, select, update
+from backend.src.platform.db.schema import RunTimeEnvironment
+from .environment import EnvironmentHandler
+from .routing import notify_changed
+from .session import SessionManager
+from .templates import render_ddl
+from .tracking import CAPTURE_SETTING, DIRTY_TABLE, JOURNAL_TABLE
+
+logger = logging.getLogger(__name__)
+
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+@dataclass
+class HibernationStats:
+    hibernated: int = 0
+    skipped: int = 0  # hibernations that hit lock_timeout, retried next cycle
+    restored: int = 0
+    restore_seconds_total: float = 0.0
+    restore_seconds_max: float = 0.0
+
+    @property
+    def restore_seconds_avg(self) -> float:
+        return self.restore_seconds_total / self.restored if self.restored else 0.0
+
+
+class HibernationManager:
+    def __init__(
+        self,
+        session_manager: SessionManager,
+        environment_handler: EnvironmentHandler,
+        directory: str,
+        idle_seconds: int = 900,
+        max_live_schemas: int | None = None,
+        batch_size: int = 20,
+        interval_seconds: float = 60.0,
+        lock_timeout_ms: int = 2000,
+    ):
+        self.session_manager = session_manager
+        self.environment_handler = environment_handler
+        self.directory = Path(directory)
+        self.idle_seconds = idle_seconds
+        self.max_live_schemas = max_live_schemas
+        self.batch_size = batch_size
+        self.interval_seconds = interval_seconds
+        self.lock_timeout_ms = lock_timeout_ms
+        self.stats = HibernationStats()
+        self._stats_lock = Lock()
+        self._task: asyncio.Task | None = None
+
+    def _candidates(self) -> list[str]:
+        eligible = (
+            RunTimeEnvironment.status == "ready",
+            RunTimeEnvironment.permanent.is_(False),
+            RunTimeEnvironment.pooled.is_(False),
+            RunTimeEnvironment.lazy.is_(False),
+            RunTimeEnvironment.database.is_(None),
+            RunTimeEnvironment.templateSchema.is_not(None),
+        )
+        with self.session_manager.get_meta_session() as s:
+            idle = s.scalars(
+                select(RunTimeEnvironment.id)
+                .where(
+                    *eligible,
+                    RunTimeEnvironment.lastUsedAt
+                    < datetime.now() - timedelta(seconds=self.idle_seconds),
+                )
+                .order_by(RunTimeEnvironment.lastUsedAt)
+                .limit(self.batch_size)
+            ).all()
+            if self.max_live_schemas is None or len(idle) >= self.batch_size:
+                return [i.hex for i in idle]
+            # least recently used schemas beyond the live limit go too
+            live = (
+                s.scalar(
+                    select(func.count())
+                    .select_from(RunTimeEnvironment)
+                    .where(RunTimeEnvironment.status == "ready")
+                )
+                or 0
+            )
+            overflow = min(
+                live - len(idle) - self.max_live_schemas, self.batch_size - len(idle)
+            )
+            if overflow <= 0:
+                return [i.hex for i in idle]
+            lru = s.scalars(
+                select(RunTimeEnvironment.id)
+                .where(*eligible, RunTimeEnvironment.id.not_in(idle))
+                .order_by(RunTimeEnvironment.lastUsedAt.nulls_first())
+                .limit(overflow)
+            ).all()
+            return [i.hex for i in (*idle, *lru)]
+
+    def _claim(self, environment_id: str, status: str) -> tuple[str, str] | None:
+        with self.session_manager.get_meta_session() as s:
+            row = s.execute(
+                update(RunTimeEnvironment)
+                .where(
+                    RunTimeEnvironment.id == environment_id,
+                    RunTimeEnvironment.status == status,
+                )
+                .values(status="initializing", updatedAt=datetime.now())
+                .returning(
+                    RunTimeEnvironment.schema, RunTimeEnvironment.templateSchema
+                )
+            ).first()
+            if row:
+                notify_changed(s, [environment_id])
+            s.commit()
+        return (row[0], row[1]) if row else None
+
+    def hibernate(self, environment_id: str) -> bool:
+        # "initializing" keeps new lookups out while the schema is exported
+        claimed = self._claim(environment_id, "ready")
+        if claimed is None:
+            return False
+        schema, template_schema = claimed
+        # the environment's own DDL, so a restore does not depend on how the
+        # template looks by then
+        compiled = self.environment_handler.template_cache.get(schema, store=False)
+        tables = compiled.tables
+        target = self.directory / environment_id
+        target.mkdir(parents=True, exist_ok=True)
+
+        raw = self.session_manager.base_engine.raw_connection()
+        try:
+            cur = raw.cursor()
+            cur.execute(f"SET LOCAL lock_timeout = {int(self.lock_timeout_ms)}")
+            cur.execute(
+                "LOCK TABLE "
+                + ", ".join(f'"{schema}"."{t}"' for t in tables)
+                + " IN EXCLUSIVE MODE"
+            )
+            cur.execute(f'SELECT "table" FROM "{schema}".{DIRTY_TABLE}')
+            dirty = [row[0] for row in cur.fetchall()]
+            cur.execute("SELECT to_regclass(%s)", (f'"{schema}".{JOURNAL_TABLE}',))
+            journal = cur.fetchall()[0][0] is not None
+            for table in [*tables, JOURNAL_TABLE] if journal else tables:
+                with gzip.open(target / f"{table}.copy.gz", "wb") as sink:
+                    cur.copy_expert(
+                        f'COPY "{schema}"."{table}" TO STDOUT (FORMAT binary)', sink
+                    )
+            (target / "manifest.json").write_text(
+                json.dumps(
+                    {
+                        "schema": schema,
+                        "template_schema": template_schema,
+                        "fingerprint": compiled.fingerprint,
+                        "ddl": compiled.ddl,
+                        "tables": tables,
+                        "primary_keys": compiled.primary_keys,
+                        "dirty_tables": dirty,
+                        "journal": journal,
+                    }
+                )
+            )
+            cur.execute(f'DROP SCHEMA "{schema}" CASCADE')
+            raw.commit()
+        except Exception as exc:
+            raw.rollback()
+            shutil.rmtree(target, ignore_errors=True)
+            self.environment_handler.set_runtime_status(environment_id, "ready")
+            if getattr(exc, "pgcode", None) != LOCK_NOT_AVAILABLE:
+                raise
+            # lock_timeout: a live session holds a table, retry next cycle
+            with self._stats_lock:
+                self.stats.skipped += 1
+            return False
+        finally:
+            raw.close()
+
+        self.environment_handler.set_runtime_status(environment_id, "hibernated")
+        with self._stats_lock:
+            self.stats.hibernated += 1
+        return True
+
+    def restore(self, environment_id: str) -> bool:
+        claimed = self._claim(environment_id, "hibernated")
+        if claimed is None:
+            return False
+        started = perf_counter()
+        schema, template_schema = claimed
+        source = self.directory / environment_id
+        handler = self.environment_handler
+        try:
+            manifest = json.loads((source / "manifest.json").read_text())
+            if "ddl" in manifest:
+                ddl = manifest["ddl"]
+                tables = manifest["tables"]
+                primary_keys = manifest["primary_keys"]
+            else:
+                # artifacts written before the DDL was stored with them
+                compiled = handler.template_cache.get(template_schema)
+                ddl, tables = compiled.ddl, compiled.tables
+                primary_keys = compiled.primary_keys
+            journal = manifest.get("journal", False)
+            copied = [*tables, JOURNAL_TABLE] if journal else tables
+            raw = self.session_manager.base_engine.raw_connection()
+            try:
+                cur = raw.cursor()
+                cur.execute(f'CREATE SCHEMA "{schema}"')
+                cur.execute(render_ddl(ddl, schema))
+                cur.execute(
+                    ";\n".join(
+                        handler.tracker.statements(
+                            schema, tables, primary_keys if journal else None
+                        )
+                    )
+                )
+                cur.execute(f"SET LOCAL {CAPTURE_SETTING} = 'off'")
+                for table in copied:
+                    with gzip.open(source / f"{table}.copy.gz", "rb") as stream:
+                        cur.copy_expert(
+                            f'COPY "{schema}"."{table}" FROM STDIN (FORMAT binary)',
+                            stream,
+                        )
+                # keep reset_environment aware of what the agent had changed
+                for table in manifest["dirty_tables"]:
+                    cur.execute(
+                        f'INSERT INTO "{schema}".{DIRTY_TABLE} VALUES (%s)', (table,)
+                    )
+                raw.commit()
+            finally:
+                raw.close()
+            with self.session_manager.base_engine.begin() as conn:
+                handler._reset_sequences(conn, schema)
+        except Exception:
+            handler.drop_schema(schema)
+            handler.set_runtime_status(environment_id, "hibernated")
+            raise
+
+        handler.set_runtime_status(environment_id, "ready")
+        shutil.rmtree(source, ignore_errors=True)
+        seconds = perf_counter() - started
+        with self._stats_lock:
+            self.stats.restored += 1
+            self.stats.restore_seconds_total += seconds
+            self.stats.restore_seconds_max = max(
+                self.stats.restore_seconds_max, seconds
+            )
+        return True
+
+    def discard(self, environment_id: str) -> None:
+        shutil.rmtree(self.directory / environment_id, ignore_errors=True)
+
+    def hibernate_idle(self) -> int:
+        hibernated = 0
+        for environment_id in self._candidates():
+            try:
+                hibernated += self.hibernate(environment_id)
+            except Exception:
+                logger.exception("failed to hibernate %s", environment_id)
+        return hibernated
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.hibernate_idle)
+            except Exception:
+                logger.exception("hibernation cycle failed")
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
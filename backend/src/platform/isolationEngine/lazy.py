@@ -0,0 +1,171 @@
+from __future__ import annotations
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+from .sequences import reset_sequences
+
+GUARD_FUNCTION = "dtu_lazy_guard"
+
+
+class LazyMaterializer:
+    def create(
+        self,
+        conn,
+        template_schema: str,
+        target_schema: str,
+        tables: list[str],
+        with_guard: bool = True,
+    ) -> None:
+        # writes that bypass the session hook must never reach the template
+        statements = []
+        if with_guard:
+            statements.append(
+                f'CREATE FUNCTION "{target_schema}".{GUARD_FUNCTION}() '
+                "RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+                "RAISE EXCEPTION 'table %.% is not materialized', "
+                "TG_TABLE_SCHEMA, TG_TABLE_NAME; END $$"
+            )
+        for table in tables:
+            statements.append(
+                f'CREATE VIEW "{target_schema}"."{table}" AS '
+                f'SELECT * FROM "{template_schema}"."{table}"'
+            )
+            statements.append(
+                f"CREATE TRIGGER {GUARD_FUNCTION} "
+                "INSTEAD OF INSERT OR UPDATE OR DELETE "
+                f'ON "{target_schema}"."{table}" FOR EACH ROW '
+                f'EXECUTE FUNCTION "{target_schema}".{GUARD_FUNCTION}()'
+            )
+        # text() escapes the RAISE format's % for the driver
+        conn.execute(text(";\n".join(statements)))
+
+    def materialize(
+        self, conn, template_schema: str, target_schema: str, table: str
+    ) -> bool:
+        conn.execute(
+            text("SELECT pg_advisory_xact_lock(hashtext(:key))"),
+            {"key": f"{target_schema}.{table}"},
+        )
+        kind = conn.execute(
+            text(
+                """
+                SELECT c.relkind
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = :schema AND c.relname = :table
+                """
+            ),
+            {"schema": target_schema, "table": table},
+        ).scalar()
+        if kind != "v":
+            return False
+
+        serial_columns = (
+            conn.execute(
+                text(
+                    """
+                    SELECT a.attname
+                    FROM pg_attribute a
+                    JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+                    WHERE a.attrelid = CAST(:rel AS regclass)
+                      AND pg_get_expr(d.adbin, d.adrelid) LIKE 'nextval(%'
+                    """
+                ),
+                {"rel": f'"{template_schema}"."{table}"'},
+            )
+            .scalars()
+            .all()
+        )
+
+        conn.execute(text(f'DROP VIEW "{target_schema}"."{table}"'))
+        conn.execute(
+            text(
+                f'CREATE TABLE "{target_schema}"."{table}" '
+                f'(LIKE "{template_schema}"."{table}" INCLUDING ALL)'
+            )
+        )
+        for column in serial_columns:
+            sequence = f"{table}_{column}_seq"
+            conn.execute(
+                text(
+                    f'CREATE SEQUENCE "{target_schema}"."{sequence}" '
+                    f'OWNED BY "{target_schema}"."{table}"."{column}"'
+                )
+            )
+            conn.execute(
+                text(
+                    f'ALTER TABLE "{target_schema}"."{table}" ALTER COLUMN "{column}" '
+                    f"SET DEFAULT nextval('\"{target_schema}\".\"{sequence}\"')"
+                )
+            )
+        conn.execute(
+            text(
+                f'INSERT INTO "{target_schema}"."{table}" OVERRIDING SYSTEM VALUE '
+                f'SELECT * FROM "{template_schema}"."{table}"'
+            )
+        )
+        reset_sequences(conn, target_schema)
+        return True
+
+    def reset(self, conn, template_schema: str, target_schema: str) -> list[str]:
+        materialized = (
+            conn.execute(
+                text(
+                    """
+                    SELECT c.relname
+                    FROM pg_class c
+                    JOIN pg_namespace n ON n.oid = c.relnamespace
+                    WHERE n.nspname = :schema AND c.relkind = 'r'
+                    ORDER BY c.relname
+                    """
+                ),
+                {"schema": target_schema},
+            )
+            .scalars()
+            .all()
+        )
+        if not materialized:
+            return []
+        conn.execute(
+            text(
+                "DROP TABLE "
+                + ", ".join(f'"{target_schema}"."{t}"' for t in materialized)
+            )
+        )
+        self.create(
+            conn, template_schema, target_schema, materialized, with_guard=False
+        )
+        return materialized
+
+    def attach(self, session: Session, schema: str, template_schema: str) -> Session:
+        materialized: set[str] = set()
+
+        def ensure(tables: set[str]) -> None:
+            pending = tables - materialized
+            if not pending:
+                return
+            conn = session.connection()
+            for table in sorted(pending):
+                self.materialize(conn, template_schema, schema, table)
+                materialized.add(table)
+
+        @event.listens_for(session, "before_flush")
+        def _before_flush(session, flush_context, instances):
+            ensure(
+                {
+                    table.name
+                    for obj in (*session.new, *session.dirty, *session.deleted)
+                    for table in inspect(obj).mapper.tables
+                }
+            )
+
+        @event.listens_for(session, "do_orm_execute")
+        def _do_orm_execute(state):
+            if state.is_insert or state.is_update or state.is_delete:
+                ensure({state.statement.table.name})
+
+        @event.listens_for(session, "after_rollback")
+        def _after_rollback(session):
+            # the DDL was transactional, so the views are back
+            materialized.clear()
+
+        return session
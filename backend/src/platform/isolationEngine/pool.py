@@ -0,0 +1,188 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from threading import Lock
+from uuid import uuid4
+from sqlalchemy import func, select, update
+from backend.src.platform.db.schema import RunTimeEnvironment, TemplateEnvironment
+from .environment import EnvironmentHandler
+from .session import SessionManager
+
+
+@dataclass
+class PoolStats:
+    hits: int = 0
+    misses: int = 0
+    provisioned: int = 0
+    failed: int = 0
+
+
+class WarmPoolManager:
+    def __init__(
+        self,
+        session_manager: SessionManager,
+        environment_handler: EnvironmentHandler,
+        max_workers: int = 4,
+    ):
+        self.session_manager = session_manager
+        self.environment_handler = environment_handler
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="warm-pool"
+        )
+        self.stats: dict[str, PoolStats] = {}
+        self._lock = Lock()
+        self._refill_lock = Lock()
+
+    def _stats(self, template_schema: str) -> PoolStats:
+        with self._lock:
+            return self.stats.setdefault(template_schema, PoolStats())
+
+    def claim(
+        self,
+        template_schema: str,
+        *,
+        expires_at: datetime | None,
+        permanent: bool = False,
+        max_idle_seconds: int | None = None,
+    ) -> tuple[str, str] | None:
+        now = datetime.now()
+        candidate = (
+            select(RunTimeEnvironment.id)
+            .join(
+                TemplateEnvironment,
+                TemplateEnvironment.id == RunTimeEnvironment.templateId,
+            )
+            .where(
+                TemplateEnvironment.kind == "schema",
+                TemplateEnvironment.location == template_schema,
+                RunTimeEnvironment.pooled.is_(True),
+                RunTimeEnvironment.status == "ready",
+            )
+            .limit(1)
+            .with_for_update(of=RunTimeEnvironment, skip_locked=True)
+            .scalar_subquery()
+        )
+        with self.session_manager.get_meta_session() as s:
+            row = s.execute(
+                update(RunTimeEnvironment)
+                .where(RunTimeEnvironment.id == candidate)
+                .values(
+                    pooled=False,
+                    permanent=permanent,
+                    maxIdleSeconds=max_idle_seconds,
+                    expiresAt=expires_at,
+                    lastUsedAt=now,
+                    updatedAt=now,
+                )
+                .returning(RunTimeEnvironment.id, RunTimeEnvironment.schema)
+            ).first()
+            s.commit()
+            # only schema templates are pooled, so anything else is not a miss
+            if row is None and not self._is_pooled(s, template_schema):
+                return None
+
+        stats = self._stats(template_schema)
+        with self._lock:
+            if row is None:
+                stats.misses += 1
+            else:
+                stats.hits += 1
+        self.executor.submit(self.refill, template_schema)
+        if row is None:
+            return None
+        return row[0].hex, row[1]
+
+    def _is_pooled(self, s, template_schema: str) -> bool:
+        return (
+            s.scalar(
+                select(TemplateEnvironment.id)
+                .where(
+                    TemplateEnvironment.kind == "schema",
+                    TemplateEnvironment.location == template_schema,
+                )
+                .limit(1)
+            )
+            is not None
+        )
+
+    def refill(self, template_schema: str) -> int:
+        with self._refill_lock, self.session_manager.get_meta_session() as s:
+            template = (
+                s.execute(
+                    select(TemplateEnvironment).where(
+                        TemplateEnvironment.kind == "schema",
+                        TemplateEnvironment.location == template_schema,
+                    )
+                )
+                .scalars()
+                .first()
+            )
+            if template is None or template.poolTarget <= 0:
+                return 0
+            available = s.scalar(
+                select(func.count())
+                .select_from(RunTimeEnvironment)
+                .where(
+                    RunTimeEnvironment.templateId == template.id,
+                    RunTimeEnvironment.pooled.is_(True),
+                    RunTimeEnvironment.status.in_(("initializing", "ready")),
+                )
+            )
+            missing = template.poolTarget - (available or 0)
+            pending = []
+            for _ in range(max(missing, 0)):
+                environment_id = uuid4().hex
+                schema = f"state_{environment_id}"
+                s.add(
+                    RunTimeEnvironment(
+                        id=environment_id,
+                        schema=schema,
+                        status="initializing",
+                        templateId=template.id,
+                        templateSchema=template_schema,
+                        pooled=True,
+                    )
+                )
+                pending.append((environment_id, schema, template.journalEnabled))
+            s.commit()
+
+        for environment_id, schema, journal in pending:
+            self.executor.submit(
+                self._provision, template_schema, environment_id, schema, journal
+            )
+        return len(pending)
+
+    def _provision(
+        self,
+        template_schema: str,
+        environment_id: str,
+        schema: str,
+        journal: bool = True,
+    ):
+        stats = self._stats(template_schema)
+        try:
+            self.environment_handler.clone_template(template_schema, schema, journal)
+        except Exception:
+            self.environment_handler.drop_schema(schema)
+            self.environment_handler.set_runtime_status(environment_id, "deleted")
+            with self._lock:
+                stats.failed += 1
+            raise
+        self.environment_handler.set_runtime_status(environment_id, "ready")
+        with self._lock:
+            stats.provisioned += 1
+
+    def warm_all(self) -> None:
+        with self.session_manager.get_meta_session() as s:
+            locations = s.scalars(
+                select(TemplateEnvironment.location).where(
+                    TemplateEnvironment.kind == "schema",
+                    TemplateEnvironment.poolTarget > 0,
+                )
+            ).all()
+        for location in locations:
+            self.refill(location)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
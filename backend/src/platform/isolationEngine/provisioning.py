@@ -0,0 +1,52 @@
+from __future__ import annotations
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Event, Lock
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class ProvisioningExecutor:
+    def __init__(self, max_workers: int = 4, max_pending: int = 256):
+        # max_workers caps concurrent CREATE/COPY work hitting Postgres
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="provision"
+        )
+        self.max_pending = max_pending
+        self._slots = BoundedSemaphore(max_pending)
+        self._pending: dict[str, Event] = {}
+        self._lock = Lock()
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def submit(self, environment_id: str, fn: Callable[..., object], *args) -> None:
+        if not self._slots.acquire(blocking=False):
+            raise RuntimeError("provisioning queue is full")
+        done = Event()
+        with self._lock:
+            self._pending[environment_id] = done
+
+        def run():
+            try:
+                fn(*args)
+            except Exception:
+                logger.exception("provisioning %s failed", environment_id)
+            finally:
+                with self._lock:
+                    self._pending.pop(environment_id, None)
+                done.set()
+                self._slots.release()
+
+        self.executor.submit(run)
+
+    def wait(self, environment_id: str, timeout: float) -> bool:
+        with self._lock:
+            done = self._pending.get(environment_id)
+        return True if done is None else done.wait(timeout)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
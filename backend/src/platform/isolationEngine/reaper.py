@@ -0,0 +1,186 @@
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from sqlalchemy import literal_column, select, text, update
+from sqlalchemy.exc import OperationalError
+from backend.src.platform.db.schema import IDLE_DEADLINE, RunTimeEnvironment
+from .database import DatabaseHandler
+from .hibernation import LOCK_NOT_AVAILABLE, HibernationManager
+from .routing import notify_changed
+from .session import SessionManager
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ReaperStats:
+    expired: int = 0
+    reclaimed_schemas: int = 0
+    reclaimed_bytes: int = 0
+    skipped: int = 0  # drops that hit lock_timeout and were retried later
+    failed: int = 0
+
+
+class EnvironmentReaper:
+    def __init__(
+        self,
+        session_manager: SessionManager,
+        database_handler: DatabaseHandler,
+        interval_seconds: float = 30.0,
+        batch_size: int = 50,
+        drops_per_second: float = 5.0,
+        lock_timeout_ms: int = 2000,
+        hibernation: HibernationManager | None = None,
+    ):
+        self.session_manager = session_manager
+        self.database_handler = database_handler
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.drops_per_second = drops_per_second
+        self.lock_timeout_ms = lock_timeout_ms
+        self.hibernation = hibernation
+        self.stats = ReaperStats()
+        self._task: asyncio.Task | None = None
+
+    def expire(self) -> int:
+        now = datetime.now()
+        eligible = (
+            RunTimeEnvironment.status.in_(("ready", "hibernated")),
+            RunTimeEnvironment.permanent.is_(False),
+            RunTimeEnvironment.pooled.is_(False),
+        )
+        # one index range scan per condition; OR-ing them made Postgres read
+        # every ready environment
+        conditions = (
+            RunTimeEnvironment.expiresAt < now,
+            literal_column(IDLE_DEADLINE) < now,
+        )
+        expired = []
+        with self.session_manager.get_meta_session() as s:
+            for condition in conditions:
+                if len(expired) >= self.batch_size:
+                    break
+                candidates = (
+                    select(RunTimeEnvironment.id)
+                    .where(*eligible, condition)
+                    .limit(self.batch_size - len(expired))
+                    .with_for_update(skip_locked=True)
+                )
+                expired += s.execute(
+                    update(RunTimeEnvironment)
+                    .where(RunTimeEnvironment.id.in_(candidates))
+                    .values(status="expired", updatedAt=now)
+                    .returning(RunTimeEnvironment.id)
+                ).all()
+            notify_changed(s, [env_id for (env_id,) in expired])
+            s.commit()
+        self.stats.expired += len(expired)
+        return len(expired)
+
+    def drop_expired(self) -> int:
+        with self.session_manager.get_meta_session() as s:
+            rows = s.execute(
+                select(
+                    RunTimeEnvironment.id,
+                    RunTimeEnvironment.schema,
+                    RunTimeEnvironment.database,
+                )
+                .where(RunTimeEnvironment.status == "expired")
+                .order_by(RunTimeEnvironment.updatedAt)
+                .limit(self.batch_size)
+            ).all()
+
+        dropped = 0
+        for env_id, schema, database in rows:
+            started = time.monotonic()
+            try:
+                reclaimed = (
+                    self._drop_database(database)
+                    if database is not None
+                    else self._drop_schema(schema)
+                )
+            except OperationalError as exc:
+                if getattr(exc.orig, "pgcode", None) != LOCK_NOT_AVAILABLE:
+                    raise
+                # lock_timeout: something live holds the schema, retry next cycle
+                self.stats.skipped += 1
+                continue
+            except Exception:
+                logger.exception("failed to reclaim environment %s", env_id)
+                self.stats.failed += 1
+                continue
+            if self.hibernation is not None:
+                self.hibernation.discard(env_id.hex)
+            with self.session_manager.get_meta_session() as s:
+                s.execute(
+                    update(RunTimeEnvironment)
+                    .where(RunTimeEnvironment.id == env_id)
+                    .values(status="deleted", updatedAt=datetime.now())
+                )
+                notify_changed(s, [env_id])
+                s.commit()
+            self.stats.reclaimed_schemas += 1
+            self.stats.reclaimed_bytes += reclaimed
+            dropped += 1
+            pause = 1 / self.drops_per_second - (time.monotonic() - started)
+            if pause > 0:
+                time.sleep(pause)
+        return dropped
+
+    def _drop_schema(self, schema: str) -> int:
+        with self.session_manager.base_engine.begin() as conn:
+            conn.execute(text(f"SET LOCAL lock_timeout = {int(self.lock_timeout_ms)}"))
+            size = conn.execute(
+                text(
+                    """
+                    SELECT COALESCE(SUM(pg_total_relation_size(c.oid)), 0)
+                    FROM pg_class c
+                    JOIN pg_namespace n ON n.oid = c.relnamespace
+                    WHERE n.nspname = :schema AND c.relkind IN ('r', 'm', 'p')
+                    """
+                ),
+                {"schema": schema},
+            ).scalar()
+            conn.execute(text(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE'))
+        self.session_manager.forget_schema(schema)
+        return int(size or 0)
+
+    def _drop_database(self, database: str) -> int:
+        with self.session_manager.base_engine.connect() as conn:
+            size = conn.execute(
+                text(
+                    "SELECT COALESCE(pg_database_size(oid), 0) "
+                    "FROM pg_database WHERE datname = :database"
+                ),
+                {"database": database},
+            ).scalar()
+        self.database_handler.drop_database(database)
+        return int(size or 0)
+
+    def reap_once(self) -> int:
+        self.expire()
+        return self.drop_expired()
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.reap_once)
+            except Exception:
+                logger.exception("environment reaper cycle failed")
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,223 @@
+from __future__ import annotations
+import asyncio
+import logging
+import select as selectors
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from threading import Lock
+from time import monotonic
+from typing import Callable
+from uuid import UUID
+from sqlalchemy import DateTime, Engine, cast, func, select, text, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from backend.src.platform.db.schema import RunTimeEnvironment
+from .types import EnvironmentRoute
+
+logger = logging.getLogger(__name__)
+
+INVALIDATE_CHANNEL = "dtu_environment_changed"
+
+
+def notify_changed(conn, environment_ids) -> None:
+    # delivered on commit to every process holding a RouteCache
+    for environment_id in environment_ids:
+        conn.execute(
+            text("SELECT pg_notify(:channel, :id)"),
+            {"channel": INVALIDATE_CHANNEL, "id": UUID(str(environment_id)).hex},
+        )
+
+
+@dataclass
+class _CachedRoute:
+    route: EnvironmentRoute
+    expires_at: datetime | None
+    cached_at: float
+
+
+class RouteCache:
+    def __init__(self, ttl_seconds: float = 5.0, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, _CachedRoute] = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, environment_id: str) -> EnvironmentRoute | None:
+        key = UUID(environment_id).hex
+        with self._lock:
+            entry = self._entries.get(key)
+            if (
+                entry is None
+                or monotonic() - entry.cached_at > self.ttl_seconds
+                or (entry.expires_at is not None and entry.expires_at < datetime.now())
+            ):
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.route
+
+    def put(
+        self, environment_id: str, route: EnvironmentRoute, expires_at: datetime | None
+    ) -> None:
+        with self._lock:
+            self._entries[UUID(environment_id).hex] = _CachedRoute(
+                route, expires_at, monotonic()
+            )
+            self._entries.move_to_end(UUID(environment_id).hex)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, environment_id: str | None = None) -> None:
+        with self._lock:
+            if environment_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(UUID(environment_id).hex, None)
+
+
+class LastUsedFlusher:
+    def __init__(
+        self,
+        engine: Engine,
+        interval_seconds: float = 5.0,
+        model: type = RunTimeEnvironment,
+    ):
+        # model needs a uuid id and a lastUsedAt column
+        self.engine = engine
+        self.interval_seconds = interval_seconds
+        self.model = model
+        self._pending: dict[UUID, datetime] = {}
+        self._lock = Lock()
+        self._task: asyncio.Task | None = None
+
+    def touch(self, environment_id: str | UUID) -> None:
+        key = UUID(str(environment_id))
+        with self._lock:
+            self._pending[key] = datetime.now()
+
+    def flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        # two unnests in one target list are zipped row by row
+        values = select(
+            func.unnest(cast(list(pending), ARRAY(PG_UUID(as_uuid=True)))).label("id"),
+            func.unnest(cast(list(pending.values()), ARRAY(DateTime))).label("at"),
+        ).subquery()
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(
+                    update(self.model)
+                    .where(self.model.id == values.c.id)
+                    .values(lastUsedAt=values.c.at)
+                )
+        except Exception:
+            with self._lock:
+                for key, at in pending.items():
+                    self._pending.setdefault(key, at)
+            raise
+        return len(pending)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception:
+                logger.exception("lastUsedAt flush failed")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+
+def _driver_connection(raw):
+    conn = raw.driver_connection
+    if conn is None:
+        raise RuntimeError("listener connection was invalidated")
+    return conn
+
+
+class InvalidationListener:
+    def __init__(self, engine: Engine, poll_seconds: float = 1.0):
+        self.engine = engine
+        self.poll_seconds = poll_seconds
+        self._channels: dict[str, tuple[Callable, Callable | None]] = {}
+        self._raw = None
+        self._task: asyncio.Task | None = None
+
+    def subscribe(
+        self,
+        channel: str,
+        on_message: Callable[[str], None],
+        on_reconnect: Callable[[], None] | None = None,
+    ) -> None:
+        # on_reconnect drops whatever may have been missed while disconnected
+        self._channels[channel] = (on_message, on_reconnect)
+
+    def _connect(self):
+        raw = self.engine.raw_connection()
+        _driver_connection(raw).autocommit = True
+        cur = raw.cursor()
+        for channel, (_, on_reconnect) in self._channels.items():
+            cur.execute(f"LISTEN {channel}")
+            if on_reconnect is not None:
+                on_reconnect()
+        return raw
+
+    def listen_once(self) -> int:
+        if self._raw is None:
+            self._raw = self._connect()
+        conn = _driver_connection(self._raw)
+        received = 0
+        if selectors.select([conn], [], [], self.poll_seconds)[0]:
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                self._channels[notify.channel][0](notify.payload)
+                received += 1
+        return received
+
+    def close(self) -> None:
+        if self._raw is not None:
+            self._raw.invalidate()
+            self._raw = None
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.listen_once)
+            except Exception:
+                logger.exception("invalidation listener failed")
+                self.close()
+                await asyncio.sleep(self.poll_seconds)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.close()
@@ -0,0 +1,180 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Callable
+from sqlalchemy import Connection, Engine, text
+
+
+@dataclass
+class SeedReport:
+    timings: dict[str, float] = field(default_factory=dict)
+    rows: dict[str, int] = field(default_factory=dict)
+    total_seconds: float = 0.0
+
+
+class SeedingEngine:
+    def __init__(
+        self,
+        engine: Engine,
+        max_workers: int = 4,
+        disable_triggers: bool = False,
+    ):
+        self.engine = engine
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="seed"
+        )
+        # session_replication_role = replica skips FK triggers so every table
+        # can be copied at once; needs superuser and a consistent template
+        self.disable_triggers = disable_triggers
+
+    def seed(
+        self,
+        template_schema: str,
+        target_schema: str,
+        levels: list[list[str]],
+        skip_triggers: list[str] | None = None,
+    ) -> SeedReport:
+        report = SeedReport()
+        started = perf_counter()
+        if self.disable_triggers:
+            levels = [[t for level in levels for t in level]]
+        for level in levels:
+            futures = {
+                self.executor.submit(
+                    self._insert_select,
+                    template_schema,
+                    target_schema,
+                    table,
+                    skip_triggers,
+                ): table
+                for table in level
+            }
+            for future in as_completed(futures):
+                rows, seconds = future.result()
+                report.rows[futures[future]] = rows
+                report.timings[futures[future]] = seconds
+        report.total_seconds = perf_counter() - started
+        return report
+
+    def seed_snapshot(
+        self,
+        source_schema: str,
+        target_schema: str,
+        tables: list[str],
+        snapshot: str,
+        finalize: Callable[[Connection], None] | None = None,
+    ) -> SeedReport:
+        # a transaction importing an exported snapshot cannot see rows other
+        # workers committed after it, so parents and children are copied in
+        # one transaction; finalize runs in it before the commit
+        report = SeedReport()
+        started = perf_counter()
+        engine = self.engine.execution_options(isolation_level="REPEATABLE READ")
+        with engine.begin() as conn:
+            conn.execute(text(f"SET TRANSACTION SNAPSHOT '{snapshot}'"))
+            if self.disable_triggers:
+                conn.execute(text("SET LOCAL session_replication_role = replica"))
+            for table in tables:
+                table_started = perf_counter()
+                result = conn.execute(
+                    text(
+                        f'INSERT INTO "{target_schema}"."{table}" '
+                        "OVERRIDING SYSTEM VALUE "
+                        f'SELECT * FROM "{source_schema}"."{table}"'
+                    )
+                )
+                report.rows[table] = result.rowcount
+                report.timings[table] = perf_counter() - table_started
+            if finalize is not None:
+                finalize(conn)
+        report.total_seconds = perf_counter() - started
+        return report
+
+    def seed_many(
+        self,
+        template_schema: str,
+        target_schemas: list[str],
+        levels: list[list[str]],
+        chunk_size: int = 25,
+    ) -> SeedReport:
+        report = SeedReport()
+        started = perf_counter()
+        chunks = [
+            target_schemas[i : i + chunk_size]
+            for i in range(0, len(target_schemas), chunk_size)
+        ]
+        for level in levels:
+            futures = {
+                self.executor.submit(
+                    self._insert_fanout, template_schema, chunk, table
+                ): table
+                for table in level
+                for chunk in chunks
+            }
+            for future in as_completed(futures):
+                rows, seconds = future.result()
+                table = futures[future]
+                report.rows[table] = report.rows.get(table, 0) + rows
+                report.timings[table] = report.timings.get(table, 0.0) + seconds
+        report.total_seconds = perf_counter() - started
+        return report
+
+    def _insert_fanout(
+        self, template_schema: str, target_schemas: list[str], table: str
+    ) -> tuple[int, float]:
+        # one scan of the template table feeds every target in the chunk
+        started = perf_counter()
+        inserts = ",\n".join(
+            f'i{n} AS (INSERT INTO "{schema}"."{table}" OVERRIDING SYSTEM VALUE '
+            "SELECT * FROM src)"
+            for n, schema in enumerate(target_schemas)
+        )
+        with self.engine.begin() as conn:
+            if self.disable_triggers:
+                conn.execute(text("SET LOCAL session_replication_role = replica"))
+            rows = conn.execute(
+                text(
+                    f'WITH src AS (SELECT * FROM "{template_schema}"."{table}"),\n'
+                    f"{inserts}\n"
+                    "SELECT count(*) FROM src"
+                )
+            ).scalar()
+        return int(rows or 0) * len(target_schemas), perf_counter() - started
+
+    def _insert_select(
+        self,
+        template_schema: str,
+        target_schema: str,
+        table: str,
+        skip_triggers: list[str] | None = None,
+    ) -> tuple[int, float]:
+        started = perf_counter()
+        with self.engine.begin() as conn:
+            if self.disable_triggers:
+                conn.execute(text("SET LOCAL session_replication_role = replica"))
+            if skip_triggers:
+                # only this transaction sees them disabled, and only while it
+                # holds the table lock
+                conn.execute(
+                    _alter_triggers(target_schema, table, skip_triggers, "DISABLE")
+                )
+            result = conn.execute(
+                text(
+                    f'INSERT INTO "{target_schema}"."{table}" '
+                    "OVERRIDING SYSTEM VALUE "
+                    f'SELECT * FROM "{template_schema}"."{table}"'
+                )
+            )
+            if skip_triggers:
+                conn.execute(
+                    _alter_triggers(target_schema, table, skip_triggers, "ENABLE")
+                )
+        return result.rowcount, perf_counter() - started
+
+
+def _alter_triggers(schema: str, table: str, triggers: list[str], action: str):
+    return text(
+        f'ALTER TABLE "{schema}"."{table}" '
+        + ", ".join(f"{action} TRIGGER {trigger}" for trigger in triggers)
+    )
@@ -0,0 +1,33 @@
+from sqlalchemy import text
+
+# one setval per sequence owned by a column of the given schemas (serial or
+# identity), each advancing it past the column max; rendered server-side so
+# names are quoted by format()
+OWNED_SEQUENCES_SQL = """
+SELECT format(
+    'setval(%L, COALESCE((SELECT max(%I) FROM %I.%I), 0) + 1, false)',
+    seq.oid::regclass::text, a.attname, n.nspname, c.relname
+)
+FROM pg_depend d
+JOIN pg_class seq ON seq.oid = d.objid AND seq.relkind = 'S'
+JOIN pg_class c ON c.oid = d.refobjid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+JOIN pg_attribute a
+  ON a.attrelid = c.oid AND a.attnum = d.refobjsubid
+WHERE d.classid = 'pg_class'::regclass
+  AND d.refclassid = 'pg_class'::regclass
+  AND d.deptype IN ('a', 'i')
+  AND n.nspname = ANY(:schemas)
+"""
+
+
+def reset_sequences(conn, schema: str) -> None:
+    reset_sequences_many(conn, [schema])
+
+
+def reset_sequences_many(conn, schemas: list[str]) -> None:
+    calls = (
+        conn.execute(text(OWNED_SEQUENCES_SQL), {"schemas": schemas}).scalars().all()
+    )
+    if calls:
+        conn.execute(text("SELECT " + ", ".join(calls)))
@@ -1,52 +1,241 @@
 from __future__ import annotations
+from collections import OrderedDict
 from datetime import datetime
+from threading import Lock
+from time import monotonic, sleep
+from typing import Callable
+from uuid import UUID
 from sqlalchemy.orm import Session, sessionmaker
 from .auth import TokenHandler
-from sqlalchemy import Engine
+from sqlalchemy import Engine, create_engine, event, update
 from backend.src.platform.db.schema import RunTimeEnvironment
+from .compiled_cache import CompiledCacheStats
+from .lazy import LazyMaterializer
+from .routing import LastUsedFlusher, RouteCache
+from .types import EnvironmentRoute
 from contextlib import contextmanager
 
 
+def _apply_search_path(session: Session, transaction, connection) -> None:
+    # SET LOCAL ends with the transaction, so a pooled connection never
+    # carries one environment's search_path into another's session. public
+    # stays after the environment for extension types and functions; the
+    # environment's own tables always resolve first.
+    schema = session.info["search_path"].replace('"', '""')
+    connection.exec_driver_sql(f'SET LOCAL search_path TO "{schema}", public')
+
+
 class SessionManager:
     def __init__(
         self,
         base_engine: Engine,
         token_handler: TokenHandler,
+        max_database_engines: int = 32,
+        database_pool_size: int = 2,
+        ready_wait_seconds: float = 0.0,
+        routes: RouteCache | None = None,
+        last_used: LastUsedFlusher | None = None,
+        max_schema_factories: int = 1024,
+        routing: str = "translate",
     ):
+        if routing not in ("translate", "search_path"):
+            raise ValueError(f"unknown routing mode {routing}")
         self.base_engine = base_engine
         self.token_handler = token_handler
+        self.max_database_engines = max_database_engines
+        self.database_pool_size = database_pool_size
+        self.ready_wait_seconds = ready_wait_seconds
+        self.routes = routes
+        # batches lastUsedAt writes instead of one UPDATE per lookup
+        self.last_used = last_used
+        self._database_engines: OrderedDict[str, Engine] = OrderedDict()
+        self._database_engines_lock = Lock()
+        # one translated engine + sessionmaker per schema, reused across requests
+        self.max_schema_factories = max_schema_factories
+        self.routing = routing
+        self._schema_factories: OrderedDict[str, sessionmaker] = OrderedDict()
+        self._schema_factories_lock = Lock()
+        self.factory_hits = 0
+        self.factory_misses = 0
+        self._meta_factory = sessionmaker(bind=base_engine, expire_on_commit=False)
+        self.compiled_cache = CompiledCacheStats()
+        self.compiled_cache.attach(base_engine)
+        self.lazy = LazyMaterializer()
+        # restores a hibernated environment in place, see HibernationManager
+        self.restorer: Callable[[str], bool] | None = None
 
     def get_meta_session(self) -> Session:
-        return sessionmaker(bind=self.base_engine)(expire_on_commit=False)
+        return self._meta_factory()
+
+    def get_schema_factory(self, schema: str) -> sessionmaker:
+        with self._schema_factories_lock:
+            factory = self._schema_factories.get(schema)
+            if factory is not None:
+                self._schema_factories.move_to_end(schema)
+                self.factory_hits += 1
+                return factory
+            self.factory_misses += 1
+            if self.routing == "search_path":
+                factory = sessionmaker(
+                    bind=self.base_engine, info={"search_path": schema}
+                )
+                event.listen(factory, "after_begin", _apply_search_path)
+            else:
+                factory = sessionmaker(
+                    bind=self.base_engine.execution_options(
+                        schema_translate_map={None: schema}
+                    )
+                )
+            self._schema_factories[schema] = factory
+            while len(self._schema_factories) > self.max_schema_factories:
+                self._schema_factories.popitem(last=False)
+            return factory
 
-    def lookup_environment(self, env_id: str):
+    def forget_schema(self, schema: str) -> None:
+        with self._schema_factories_lock:
+            self._schema_factories.pop(schema, None)
+
+    def lookup_environment(self, env_id: str) -> EnvironmentRoute:
+        if self.routes is not None:
+            route = self.routes.get(env_id)
+            if route is not None:
+                self.touch(env_id)
+                return route
+        deadline = monotonic() + self.ready_wait_seconds
         with Session(bind=self.base_engine) as s:
-            env = (
-                s.query(RunTimeEnvironment)
-                .filter(RunTimeEnvironment.id == env_id)
-                .one_or_none()
-            )
+            while True:
+                env = (
+                    s.query(RunTimeEnvironment)
+                    .filter(RunTimeEnvironment.id == env_id)
+                    .one_or_none()
+                )
+                if (
+                    env is not None
+                    and env.status == "hibernated"
+                    and self.restorer is not None
+                ):
+                    s.rollback()
+                    self.restorer(env_id)
+                    continue
+                if (
+                    env is None
+                    or env.status != "initializing"
+                    or monotonic() >= deadline
+                ):
+                    break
+                s.rollback()
+                sleep(0.1)
+            if env is not None and env.status == "initializing":
+                raise PermissionError("environment not ready")
             if env is None or env.status != "ready":
                 raise PermissionError("environment not available")
+            route = self._route(env)
+            if self.routes is not None:
+                self.routes.put(env_id, route, env.expiresAt)
+            if self.last_used is not None:
+                self.last_used.touch(env.id)
+                return route
             env.lastUsedAt = datetime.now()
             s.commit()
-            return env.schema, env.lastUsedAt
+            return route
+
+    def touch(self, env_id: str) -> None:
+        # a cache hit skips the row read, but the reaper still needs lastUsedAt
+        if self.last_used is not None:
+            self.last_used.touch(env_id)
+            return
+        with Session(bind=self.base_engine) as s:
+            s.execute(
+                update(RunTimeEnvironment)
+                .where(RunTimeEnvironment.id == env_id)
+                .values(lastUsedAt=datetime.now())
+            )
+            s.commit()
 
-    def get_session_for_schema(self, schema: str) -> Session:
-        translated_engine = self.base_engine.execution_options(
-            schema_translate_map={
-                None: schema,
-            }
+    def lookup_environments(self, env_ids: list[str]) -> dict[str, EnvironmentRoute]:
+        # one round trip for the ready ones, the rest go through
+        # lookup_environment so hibernated environments are restored
+        ids = [UUID(env_id) for env_id in env_ids]
+        with Session(bind=self.base_engine) as s:
+            ready = (
+                s.query(RunTimeEnvironment)
+                .filter(
+                    RunTimeEnvironment.id.in_(ids),
+                    RunTimeEnvironment.status == "ready",
+                )
+                .all()
+            )
+            if self.last_used is not None:
+                for env in ready:
+                    self.last_used.touch(env.id)
+            else:
+                s.execute(
+                    update(RunTimeEnvironment)
+                    .where(RunTimeEnvironment.id.in_([env.id for env in ready]))
+                    .values(lastUsedAt=datetime.now())
+                )
+                s.commit()
+            found = {env.id: self._route(env) for env in ready}
+        return {
+            env_id: found[key] if key in found else self.lookup_environment(env_id)
+            for env_id, key in zip(env_ids, ids)
+        }
+
+    def _route(self, env: RunTimeEnvironment) -> EnvironmentRoute:
+        return EnvironmentRoute(
+            schema=env.schema,
+            database=env.database,
+            template_schema=env.templateSchema,
+            lazy=env.lazy,
         )
-        return sessionmaker(bind=translated_engine)()
+
+    def get_engine_for_database(self, database: str) -> Engine:
+        with self._database_engines_lock:
+            engine = self._database_engines.get(database)
+            if engine is not None:
+                self._database_engines.move_to_end(database)
+                return engine
+            engine = create_engine(
+                self.base_engine.url.set(database=database),
+                pool_pre_ping=True,
+                pool_size=self.database_pool_size,
+                max_overflow=self.database_pool_size,
+            )
+            self._database_engines[database] = engine
+            self.compiled_cache.attach(engine)
+            while len(self._database_engines) > self.max_database_engines:
+                _, evicted = self._database_engines.popitem(last=False)
+                self.compiled_cache.detach(evicted)
+                evicted.dispose()
+            return engine
+
+    def dispose_database_engine(self, database: str) -> None:
+        with self._database_engines_lock:
+            engine = self._database_engines.pop(database, None)
+        if engine is not None:
+            self.compiled_cache.detach(engine)
+            engine.dispose()
+
+    def get_session_for_schema(
+        self, schema: str, database: str | None = None
+    ) -> Session:
+        if database is not None:
+            # database-isolated environments keep the template's own schemas
+            return sessionmaker(bind=self.get_engine_for_database(database))()
+        return self.get_schema_factory(schema)()
+
+    def get_session_for_route(self, route: EnvironmentRoute, **kw) -> Session:
+        if route.database is not None:
+            return Session(bind=self.get_engine_for_database(route.database), **kw)
+        session = self.get_schema_factory(route.schema)(**kw)
+        if route.lazy and route.template_schema:
+            self.lazy.attach(session, route.schema, route.template_schema)
+        return session
 
     def get_session_for_token(self, token: str) -> Session:
         claims = self.token_handler.decode_token(token)
-        schema, _ = self.lookup_environment(claims["environment_id"])
-        translated = self.base_engine.execution_options(
-            schema_translate_map={None: schema}
-        )
-        return Session(bind=translated, expire_on_commit=False)
+        route = self.lookup_environment(claims["environment_id"])
+        return self.get_session_for_route(route, expire_on_commit=False)
 
     @contextmanager
     def with_session(self, token: str):
@@ -0,0 +1,186 @@
+from __future__ import annotations
+import gzip
+import json
+import struct
+from dataclasses import dataclass, field
+from io import BufferedIOBase
+from typing import BinaryIO
+from sqlalchemy import text
+from .session import SessionManager
+from .templates import TemplateCache, render_ddl
+from .tracking import BOOKKEEPING_TABLES, ChangeTracker
+
+# gzip(MAGIC, manifest JSON line, then per table in manifest order a run of
+# length-prefixed binary COPY frames closed by a zero-length frame)
+MAGIC = b"DTUSNAP1\n"
+_FRAME = struct.Struct(">I")
+
+
+@dataclass
+class SnapshotStats:
+    tables: dict[str, int] = field(default_factory=dict)  # rows per table
+    bytes: int = 0  # uncompressed COPY payload
+
+
+class _FrameWriter:
+    def __init__(self, out: BufferedIOBase):
+        self.out = out
+        self.bytes = 0
+
+    def write(self, data: bytes) -> int:
+        if data:
+            self.out.write(_FRAME.pack(len(data)))
+            self.out.write(data)
+            self.bytes += len(data)
+        return len(data)
+
+    def end(self) -> None:
+        self.out.write(_FRAME.pack(0))
+
+
+class _FrameReader:
+    def __init__(self, src: BufferedIOBase):
+        self.src = src
+        self.buf = b""
+        self.done = False
+
+    def _read_exact(self, n: int) -> bytes:
+        data = self.src.read(n)
+        while len(data) < n:
+            more = self.src.read(n - len(data))
+            if not more:
+                raise EOFError("truncated snapshot")
+            data += more
+        return data
+
+    def read(self, size: int = -1) -> bytes:
+        while not self.done and (size < 0 or len(self.buf) < size):
+            (n,) = _FRAME.unpack(self._read_exact(_FRAME.size))
+            if n == 0:
+                self.done = True
+                break
+            self.buf += self._read_exact(n)
+        if size < 0:
+            data, self.buf = self.buf, b""
+        else:
+            data, self.buf = self.buf[:size], self.buf[size:]
+        return data
+
+
+class SnapshotHandler:
+    def __init__(self, session_manager: SessionManager, template_cache: TemplateCache):
+        self.session_manager = session_manager
+        self.template_cache = template_cache
+        self.tracker = ChangeTracker()
+
+    def export_schema(self, schema: str, out: BinaryIO) -> SnapshotStats:
+        compiled = self.template_cache.get(schema, store=False)
+        stats = SnapshotStats()
+        raw = self.session_manager.base_engine.raw_connection()
+        try:
+            cur = raw.cursor()
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            cur.execute(
+                """
+                SELECT c.relname
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = %s AND c.relkind = 'S'
+                  -- the tracker's own sequences are recreated on import
+                  AND NOT EXISTS (
+                      SELECT 1
+                      FROM pg_depend d
+                      JOIN pg_class t ON t.oid = d.refobjid
+                      WHERE d.objid = c.oid AND d.deptype = 'a'
+                        AND t.relname = ANY(%s)
+                  )
+                """,
+                (schema, list(BOOKKEEPING_TABLES)),
+            )
+            sequences = {}
+            for (name,) in cur.fetchall():
+                cur.execute(f'SELECT last_value, is_called FROM "{schema}"."{name}"')
+                sequences[name] = list(cur.fetchall()[0])
+            manifest = {
+                "source_schema": schema,
+                "ddl": compiled.ddl,
+                "tables": compiled.tables,
+                "primary_keys": compiled.primary_keys,
+                "sequences": sequences,
+            }
+            with gzip.GzipFile(fileobj=out, mode="wb") as archive:
+                archive.write(MAGIC)
+                archive.write(json.dumps(manifest).encode() + b"\n")
+                for table in compiled.tables:
+                    frames = _FrameWriter(archive)
+                    cur.copy_expert(
+                        f'COPY "{schema}"."{table}" TO STDOUT (FORMAT binary)', frames
+                    )
+                    frames.end()
+                    stats.tables[table] = cur.rowcount
+                    stats.bytes += frames.bytes
+        finally:
+            raw.rollback()
+            raw.close()
+        return stats
+
+    def import_schema(
+        self, src: BinaryIO, target_schema: str, track_changes: bool = False
+    ) -> SnapshotStats:
+        stats = SnapshotStats()
+        raw = self.session_manager.base_engine.raw_connection()
+        try:
+            cur = raw.cursor()
+            with gzip.GzipFile(fileobj=src, mode="rb") as archive:
+                if archive.read(len(MAGIC)) != MAGIC:
+                    raise ValueError("not an environment snapshot")
+                manifest = json.loads(archive.readline())
+                cur.execute(f'CREATE SCHEMA "{target_schema}"')
+                cur.execute(render_ddl(manifest["ddl"], target_schema))
+                for table in manifest["tables"]:
+                    frames = _FrameReader(archive)
+                    cur.copy_expert(
+                        f'COPY "{target_schema}"."{table}" FROM STDIN (FORMAT binary)',
+                        frames,
+                    )
+                    # drain the terminator if COPY stopped at the binary trailer
+                    frames.read()
+                    stats.tables[table] = cur.rowcount
+            for name, (last_value, is_called) in manifest["sequences"].items():
+                cur.execute(
+                    "SELECT setval(%s, %s, %s)",
+                    (f'"{target_schema}"."{name}"', last_value, is_called),
+                )
+            if track_changes:
+                cur.execute(
+                    ";\n".join(
+                        self.tracker.statements(
+                            target_schema,
+                            manifest["tables"],
+                            manifest.get("primary_keys"),
+                        )
+                    )
+                )
+            raw.commit()
+        except BaseException:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+        return stats
+
+    def ensure_template_schema(self, template_id: str, location: str) -> str:
+        # artifact templates are unpacked once into a regular template schema
+        schema = f"template_{template_id}"
+        with self.session_manager.base_engine.begin() as conn:
+            conn.execute(
+                text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": schema}
+            )
+            exists = conn.execute(
+                text("SELECT 1 FROM pg_namespace WHERE nspname = :schema"),
+                {"schema": schema},
+            ).scalar()
+            if not exists:
+                with open(location, "rb") as src:
+                    self.import_schema(src, schema)
+        return schema
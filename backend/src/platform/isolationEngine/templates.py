@@ -0,0 +1,167 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from threading import Lock
+from sqlalchemy import Engine, Enum, MetaData, create_mock_engine, text
+from sqlalchemy.dialects.postgresql.named_types import (
+    CreateDomainType,
+    CreateEnumType,
+)
+from .tracking import BOOKKEEPING_TABLES
+
+TARGET_PLACEHOLDER = "dtu_clone_target"
+
+# one catalog round trip that changes whenever a column, constraint, default
+# or index of the template schema changes
+FINGERPRINT_SQL = """
+SELECT md5(COALESCE(string_agg(def, '|' ORDER BY def), ''))
+FROM (
+    SELECT c.relname || ':' || a.attname || ':'
+        || format_type(a.atttypid, a.atttypmod) || ':' || a.attnotnull || ':'
+        || COALESCE(pg_get_expr(d.adbin, d.adrelid), '') AS def
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    LEFT JOIN pg_attrdef d ON d.adrelid = c.oid AND d.adnum = a.attnum
+    WHERE n.nspname = :schema AND c.relkind IN ('r', 'p')
+    UNION ALL
+    SELECT conrelid::regclass::text || ':' || conname || ':'
+        || pg_get_constraintdef(con.oid)
+    FROM pg_constraint con
+    JOIN pg_namespace n ON n.oid = con.connamespace
+    WHERE n.nspname = :schema
+    UNION ALL
+    SELECT indexdef FROM pg_indexes WHERE schemaname = :schema
+    UNION ALL
+    SELECT t.typname || ':' || string_agg(e.enumlabel, ',' ORDER BY e.enumsortorder)
+    FROM pg_type t
+    JOIN pg_namespace n ON n.oid = t.typnamespace
+    JOIN pg_enum e ON e.enumtypid = t.oid
+    WHERE n.nspname = :schema
+    GROUP BY t.typname
+) defs
+"""
+
+
+@dataclass
+class CompiledTemplate:
+    template_schema: str
+    fingerprint: str
+    metadata: MetaData
+    tables: list[str]  # meta.sorted_tables order
+    levels: list[list[str]]  # tables grouped so no table references a later level
+    ddl: list[str]  # CREATE statements rendered against TARGET_PLACEHOLDER
+
+    def render(self, target_schema: str) -> str:
+        return render_ddl(self.ddl, target_schema)
+
+    @property
+    def primary_keys(self) -> dict[str, list[str]]:
+        return {
+            table.name: [c.name for c in table.primary_key.columns]
+            for table in self.metadata.sorted_tables
+        }
+
+
+def render_ddl(ddl: list[str], target_schema: str) -> str:
+    # run the result without parameters (no_parameters=True, or a bare DBAPI
+    # execute) so a % in a default or CHECK is not taken for a placeholder
+    return ";\n".join(
+        stmt.replace(f"{TARGET_PLACEHOLDER}.", f'"{target_schema}".') for stmt in ddl
+    )
+
+
+class TemplateCache:
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self._entries: dict[str, CompiledTemplate] = {}
+        self._lock = Lock()
+
+    def fingerprint(self, conn, template_schema: str) -> str:
+        return conn.execute(
+            text(FINGERPRINT_SQL), {"schema": template_schema}
+        ).scalar()
+
+    def get(
+        self, template_schema: str, conn=None, store: bool = True
+    ) -> CompiledTemplate:
+        if conn is None:
+            with self.engine.connect() as c:
+                fingerprint = self.fingerprint(c, template_schema)
+        else:
+            fingerprint = self.fingerprint(conn, template_schema)
+        cached = self._entries.get(template_schema)
+        if cached is not None and cached.fingerprint == fingerprint:
+            return cached
+        compiled = self._compile(template_schema, fingerprint)
+        if not store:
+            return compiled
+        with self._lock:
+            self._entries[template_schema] = compiled
+        return compiled
+
+    def invalidate(self, template_schema: str | None = None) -> None:
+        with self._lock:
+            if template_schema is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(template_schema, None)
+
+    def _compile(self, template_schema: str, fingerprint: str) -> CompiledTemplate:
+        meta = MetaData()
+        meta.reflect(
+            bind=self.engine,
+            schema=template_schema,
+            only=lambda name, _: name not in BOOKKEEPING_TABLES,
+        )
+
+        target = MetaData()
+        for table in meta.sorted_tables:
+            copy = table.to_metadata(target, schema=TARGET_PLACEHOLDER)
+            for column in copy.columns:
+                if (
+                    isinstance(column.type, Enum)
+                    and column.type.schema == template_schema
+                ):
+                    column.type.schema = TARGET_PLACEHOLDER
+
+        statements: list[str] = []
+
+        def capture(sql, *multiparams, **params):
+            statement = str(sql.compile(dialect=mock.dialect)).strip()
+            if (
+                isinstance(sql, (CreateEnumType, CreateDomainType))
+                and sql.element.schema != TARGET_PLACEHOLDER
+            ):
+                # a type outside the template schema is shared, so it already
+                # exists wherever the template does
+                statement = (
+                    f"DO $dtu$ BEGIN {statement}; "
+                    "EXCEPTION WHEN duplicate_object THEN NULL; END $dtu$"
+                )
+            statements.append(statement)
+
+        # a named paramstyle keeps % as written instead of doubling it
+        mock = create_mock_engine(self.engine.url, capture, paramstyle="named")
+        target.create_all(mock, checkfirst=False)
+
+        levels: dict[str, int] = {}
+        for table in meta.sorted_tables:
+            parents = {
+                fk.column.table.name
+                for fk in table.foreign_keys
+                if fk.column.table is not table and fk.column.table.name in levels
+            }
+            levels[table.name] = max((levels[p] + 1 for p in parents), default=0)
+        depth = max(levels.values(), default=-1) + 1
+        grouped: list[list[str]] = [[] for _ in range(depth)]
+        for name, level in levels.items():
+            grouped[level].append(name)
+
+        return CompiledTemplate(
+            template_schema=template_schema,
+            fingerprint=fingerprint,
+            metadata=meta,
+            tables=[t.name for t in meta.sorted_tables],
+            levels=grouped,
+            ddl=statements,
+        )
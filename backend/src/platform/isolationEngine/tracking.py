@@ -0,0 +1,154 @@
+from __future__ import annotations
+import json
+from typing import Iterator
+from sqlalchemy import text
+
+DIRTY_TABLE = "dtu_dirty_tables"
+DIRTY_FUNCTION = "dtu_mark_dirty"
+JOURNAL_TABLE = "dtu_journal"
+JOURNAL_FUNCTION = "dtu_journal_row"
+BOOKKEEPING_TABLES = (DIRTY_TABLE, JOURNAL_TABLE)
+
+# SET LOCAL dtu.capture = 'off' lets bulk restores skip both triggers
+CAPTURE_SETTING = "dtu.capture"
+_CAPTURE_OFF = (
+    f"IF current_setting('{CAPTURE_SETTING}', true) = 'off' "
+    "THEN RETURN NULL; END IF; "
+)
+
+
+class ChangeTracker:
+    def install(
+        self,
+        conn,
+        schema: str,
+        tables: list[str],
+        primary_keys: dict[str, list[str]] | None = None,
+    ) -> None:
+        conn.exec_driver_sql(
+            ";\n".join(self.statements(schema, tables, primary_keys))
+        )
+
+    def statements(
+        self,
+        schema: str,
+        tables: list[str],
+        primary_keys: dict[str, list[str]] | None = None,
+    ) -> list[str]:
+        # statement-level, so a write costs one extra upsert however many rows
+        # it touches
+        statements = [
+            f'CREATE TABLE "{schema}".{DIRTY_TABLE} '
+            '("table" varchar(128) PRIMARY KEY)',
+            f'CREATE FUNCTION "{schema}".{DIRTY_FUNCTION}() '
+            "RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+            + _CAPTURE_OFF
+            + f'INSERT INTO "{schema}".{DIRTY_TABLE} VALUES (TG_TABLE_NAME) '
+            "ON CONFLICT DO NOTHING; RETURN NULL; END $$",
+        ]
+        for table in tables:
+            statements.append(
+                f"CREATE TRIGGER {DIRTY_FUNCTION} "
+                "AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE "
+                f'ON "{schema}"."{table}" FOR EACH STATEMENT '
+                f'EXECUTE FUNCTION "{schema}".{DIRTY_FUNCTION}()'
+            )
+        if primary_keys is None:
+            return statements
+
+        # row-level journal, so "what did the agent change" costs O(changes)
+        statements += [
+            f'CREATE TABLE "{schema}".{JOURNAL_TABLE} ('
+            "id bigserial PRIMARY KEY, "
+            "at timestamptz NOT NULL DEFAULT clock_timestamp(), "
+            '"table" varchar(128) NOT NULL, op varchar(8) NOT NULL, '
+            "pk jsonb NOT NULL, old jsonb, new jsonb)",
+            f'CREATE FUNCTION "{schema}".{JOURNAL_FUNCTION}() '
+            "RETURNS trigger LANGUAGE plpgsql AS $$ "
+            "DECLARE rec jsonb; key jsonb := '{}'; col text; BEGIN "
+            + _CAPTURE_OFF
+            + "IF TG_OP = 'DELETE' THEN rec := to_jsonb(OLD); "
+            "ELSE rec := to_jsonb(NEW); END IF; "
+            "FOREACH col IN ARRAY TG_ARGV LOOP "
+            "key := key || jsonb_build_object(col, rec -> col); END LOOP; "
+            f'INSERT INTO "{schema}".{JOURNAL_TABLE} ("table", op, pk, old, new) '
+            "VALUES (TG_TABLE_NAME, TG_OP, key, "
+            "CASE WHEN TG_OP <> 'INSERT' THEN to_jsonb(OLD) END, "
+            "CASE WHEN TG_OP <> 'DELETE' THEN to_jsonb(NEW) END); "
+            "RETURN NULL; END $$",
+        ]
+        for table in tables:
+            args = ", ".join(f"'{col}'" for col in primary_keys.get(table, []))
+            statements.append(
+                f"CREATE TRIGGER {JOURNAL_FUNCTION} "
+                "AFTER INSERT OR UPDATE OR DELETE "
+                f'ON "{schema}"."{table}" FOR EACH ROW '
+                f'EXECUTE FUNCTION "{schema}".{JOURNAL_FUNCTION}({args})'
+            )
+        return statements
+
+    def disable_capture(self, conn) -> None:
+        conn.execute(text(f"SET LOCAL {CAPTURE_SETTING} = 'off'"))
+
+    def has_journal(self, conn, schema: str) -> bool:
+        return (
+            conn.execute(
+                text("SELECT to_regclass(:rel)"),
+                {"rel": f'"{schema}".{JOURNAL_TABLE}'},
+            ).scalar()
+            is not None
+        )
+
+    def triggers(self, conn, schema: str) -> list[str]:
+        # the dtu triggers installed on every table of the schema
+        if self.has_journal(conn, schema):
+            return [DIRTY_FUNCTION, JOURNAL_FUNCTION]
+        return [DIRTY_FUNCTION]
+
+    def changed_keys(self, schema: str, table: str, primary_key: list[str]) -> str:
+        # a SELECT of every primary key the journal names for the table, both
+        # before and after each change; binds :table
+        columns = ", ".join(f'r."{c}"' for c in primary_key)
+        return (
+            f"SELECT DISTINCT {columns} FROM \"{schema}\".{JOURNAL_TABLE} j "
+            "CROSS JOIN LATERAL (VALUES (j.old), (j.new)) v (doc) "
+            "CROSS JOIN LATERAL "
+            f'jsonb_populate_record(NULL::"{schema}"."{table}", v.doc) r '
+            'WHERE j."table" = :table AND v.doc IS NOT NULL'
+        )
+
+    def dirty_tables(self, conn, schema: str) -> set[str]:
+        return set(
+            conn.execute(text(f'SELECT "table" FROM "{schema}".{DIRTY_TABLE}'))
+            .scalars()
+            .all()
+        )
+
+    def copy_dirty(self, conn, source_schema: str, target_schema: str) -> None:
+        conn.execute(
+            text(
+                f'INSERT INTO "{target_schema}".{DIRTY_TABLE} '
+                f'SELECT "table" FROM "{source_schema}".{DIRTY_TABLE} '
+                "ON CONFLICT DO NOTHING"
+            )
+        )
+
+    def clear(self, conn, schema: str) -> None:
+        conn.execute(text(f'DELETE FROM "{schema}".{DIRTY_TABLE}'))
+        if self.has_journal(conn, schema):
+            conn.execute(text(f'TRUNCATE "{schema}".{JOURNAL_TABLE}'))
+
+    def stream_journal(
+        self, conn, schema: str, since_id: int = 0, batch_size: int = 1000
+    ) -> Iterator[str]:
+        result = conn.execution_options(
+            stream_results=True, yield_per=batch_size
+        ).execute(
+            text(
+                f'SELECT id, at, "table", op, pk, old, new '
+                f'FROM "{schema}".{JOURNAL_TABLE} WHERE id > :since ORDER BY id'
+            ),
+            {"since": since_id},
+        )
+        for row in result.mappings():
+            yield json.dumps(dict(row), default=str) + "\n"
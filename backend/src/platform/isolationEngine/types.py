@@ -11,6 +11,7 @@ class InitEnvRequest:
     ttl_seconds: int = 1800
     permanent: bool = False
     max_idle_seconds: int = 1800
+    lazy: bool = False  # expose template tables as views, copy on first write
 
 
 @dataclass
@@ -20,3 +21,42 @@ class InitEnvResult:
     impersonate_user_id: str | None
     expires_at: datetime | None
     token: str  # This is a JWT token for the client to access the correct environment state
+    status: str = "ready"  # "initializing" until async provisioning finishes
+
+
+@dataclass(frozen=True)
+class EnvironmentRoute:
+    schema: str
+    database: str | None = None
+    template_schema: str | None = None
+    lazy: bool = False
+
+
+@dataclass
+class ResetResult:
+    environment_id: str
+    tables: list[str]  # tables restored from the template
+    seconds: float
+
+
+@dataclass
+class ForkResult:
+    source_environment_id: str
+    environments: list[InitEnvResult]
+    rows: int  # rows copied across all children
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+@dataclass
+class BatchInitResult:
+    environments: list[InitEnvResult]
+    timings: dict[str, float]  # seconds per phase
+    seconds: float
+
+    @property
+    def environments_per_second(self) -> float:
+        return len(self.environments) / self.seconds if self.seconds else 0.0
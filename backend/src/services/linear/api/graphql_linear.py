@@ -1,29 +1,56 @@
 from ariadne.asgi import GraphQL
+from backend.src.platform.api.blocking import (
+    BlockingExecutor,
+    finish_session,
+    finisher,
+)
+from backend.src.platform.isolationEngine.async_session import AsyncSessionManager
 from backend.src.platform.isolationEngine.core import Core
 
 
 class GraphQLWithSession(GraphQL):
-    def __init__(self, schema, session_provider: Core):
-        super().__init__(schema)
+    def __init__(
+        self,
+        schema,
+        session_provider: Core,
+        executor: BlockingExecutor | None = None,
+        async_sessions: AsyncSessionManager | None = None,
+        finish_executor: BlockingExecutor | None = None,
+    ):
+        super().__init__(schema, context_value=self.context_value)
         self.session_provider = session_provider
+        self.executor = executor or BlockingExecutor()
+        # commit/rollback and close run here, never behind self.executor
+        self.finish_executor = finish_executor or finisher()
+        # when set, the environment lookup is awaited on the async engine; the
+        # Linear resolvers are sync, so they still get a sync Session
+        self.async_sessions = async_sessions
 
-    async def context_value(self, request):
+    async def context_value(self, request, data=None):
         token = request.headers.get("Authorization")
-        session = self.session_provider.get_session_for_token(token) if token else None
+        if not token:
+            session = None
+        elif self.async_sessions is not None:
+            route = await self.async_sessions.lookup_token(token)
+            session = self.session_provider.sessions.get_session_for_route(route)
+        else:
+            session = await self.executor.run(
+                self.session_provider.get_session_for_token, token
+            )
         request.state.db_session = session
         return {"request": request, "session": session}
 
+    async def _finish(self, request, commit: bool) -> None:
+        session = getattr(request.state, "db_session", None)
+        if session is not None:
+            request.state.db_session = None
+            await self.finish_executor.run(finish_session, session, commit)
+
     async def handle_request(self, request):
         try:
             resp = await super().handle_request(request)
-            if request.state.db_session:
-                request.state.db_session.commit()
-            return resp
         except Exception:
-            if request.state.db_session:
-                request.state.db_session.rollback()
+            await self._finish(request, commit=False)
             raise
-        finally:
-            if request.state.db_session:
-                request.state.db_session.close()
-                request.state.db_session = None
+        await self._finish(request, commit=True)
+        return resp
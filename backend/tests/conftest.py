@@ -0,0 +1,83 @@
+import os
+from uuid import uuid4
+import pytest
+from sqlalchemy import create_engine, make_url, text
+
+# TokenHandler reads its default secret at import time
+os.environ.setdefault("SECRET_KEY", "test")
+
+from backend.src.platform.db.schema import PlatformBase  # noqa: E402
+from backend.src.platform.isolationEngine.auth import TokenHandler  # noqa: E402
+from backend.src.platform.isolationEngine.environment import (  # noqa: E402
+    EnvironmentHandler,
+)
+from backend.src.platform.isolationEngine.session import SessionManager  # noqa: E402
+
+TEMPLATE = "tpl"
+
+# two FK levels: messages reference users
+TEMPLATE_SQL = f"""
+CREATE SCHEMA {TEMPLATE};
+CREATE TABLE {TEMPLATE}.users (
+    id serial PRIMARY KEY, name varchar(255) NOT NULL
+);
+CREATE TABLE {TEMPLATE}.messages (
+    id serial PRIMARY KEY,
+    user_id integer NOT NULL REFERENCES {TEMPLATE}.users (id),
+    body text NOT NULL
+);
+INSERT INTO {TEMPLATE}.users (name)
+    SELECT 'user ' || g FROM generate_series(1, 3) g;
+INSERT INTO {TEMPLATE}.messages (user_id, body)
+    SELECT 1 + g % 3, 'message ' || g FROM generate_series(1, 300) g
+"""
+
+
+@pytest.fixture(scope="session")
+def engine():
+    url = os.environ.get("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    # every run gets a throwaway database on the given server
+    admin = create_engine(url, isolation_level="AUTOCOMMIT")
+    database = f"dtu_test_{uuid4().hex[:12]}"
+    with admin.connect() as conn:
+        conn.execute(text(f'CREATE DATABASE "{database}"'))
+    engine = create_engine(make_url(url).set(database=database))
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE SCHEMA meta"))
+        PlatformBase.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(text(TEMPLATE_SQL))
+        yield engine
+    finally:
+        engine.dispose()
+        with admin.connect() as conn:
+            conn.execute(text(f'DROP DATABASE IF EXISTS "{database}" WITH (FORCE)'))
+        admin.dispose()
+
+
+@pytest.fixture
+def template(engine):
+    return TEMPLATE
+
+
+@pytest.fixture
+def sessions(engine):
+    return SessionManager(engine, TokenHandler(secret="test"))
+
+
+@pytest.fixture
+def handler(sessions):
+    return EnvironmentHandler(
+        token_handler=sessions.token_handler, session_manager=sessions
+    )
+
+
+@pytest.fixture
+def schema(engine):
+    name = f"state_{uuid4().hex}"
+    yield name
+    with engine.begin() as conn:
+        conn.execute(text(f'DROP SCHEMA IF EXISTS "{name}" CASCADE'))
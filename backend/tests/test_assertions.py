@@ -0,0 +1,89 @@
+from datetime import datetime
+from uuid import uuid4
+import pytest
+from sqlalchemy import text
+from backend.src.platform.evalutionEngine.assertions import Assertion, AssertionEngine
+
+ASSERTIONS = [
+    Assertion("by name", "messages", {"body": "message 3", "user__name": "user 1"}),
+    Assertion("fk column", "messages", {"body": "message 3", "user_id__name": "X"}),
+    Assertion(
+        "count", "messages", {"user__name__in": ["user 1"]}, "count", count=100
+    ),
+]
+
+
+@pytest.fixture
+def environment_id(engine, handler, template, schema):
+    handler.clone_template(template, schema)
+    environment_id = uuid4().hex
+    handler.set_runtime_environment(
+        environment_id=environment_id,
+        schema=schema,
+        template_schema=template,
+        expires_at=None,
+        last_used_at=datetime.now(),
+    )
+    return environment_id
+
+
+def test_assertions_follow_foreign_keys(engine, sessions, handler, environment_id):
+    assertions = AssertionEngine(sessions, handler.template_cache, max_workers=2)
+    try:
+        results = assertions.evaluate(environment_id, ASSERTIONS)
+        assert [(r.passed, r.count) for r in results] == [
+            (True, 1),
+            (False, 0),
+            (True, 100),
+        ]
+        assert results[0].evidence[0]["body"] == "message 3"
+
+        schema = sessions.lookup_environment(environment_id).schema
+        with engine.begin() as conn:
+            conn.execute(text(f"UPDATE \"{schema}\".users SET name = 'X' WHERE id = 1"))
+        across = assertions.evaluate_across([environment_id], ASSERTIONS)
+        assert [r.passed for r in across.results[environment_id]] == [
+            False,
+            True,
+            False,
+        ]
+    finally:
+        assertions.shutdown()
+
+
+def test_unknown_foreign_key_is_rejected(sessions, handler, template):
+    assertions = AssertionEngine(sessions, handler.template_cache)
+    with pytest.raises(ValueError, match="foreign key"):
+        assertions.compile(template, [Assertion("a", "messages", {"body__name": 1})])
+    assertions.shutdown()
+
+
+def test_evaluate_across_many_environments(
+    engine, sessions, handler, template, environment_id
+):
+    other = f"state_{uuid4().hex}"
+    other_id = uuid4().hex
+    handler.clone_template(template, other)
+    handler.set_runtime_environment(
+        environment_id=other_id,
+        schema=other,
+        template_schema=template,
+        expires_at=None,
+        last_used_at=datetime.now(),
+    )
+    assertions = AssertionEngine(sessions, handler.template_cache, max_workers=2)
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f"UPDATE \"{other}\".users SET name = 'X' WHERE id = 1"))
+        across = assertions.evaluate_across([environment_id, other_id], ASSERTIONS)
+        assert across.queries == 1
+        assert [r.passed for r in across.results[environment_id]] == [
+            True,
+            False,
+            True,
+        ]
+        assert [r.passed for r in across.results[other_id]] == [False, True, False]
+    finally:
+        assertions.shutdown()
+        with engine.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA IF EXISTS "{other}" CASCADE'))
@@ -0,0 +1,69 @@
+import asyncio
+from uuid import uuid4
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+from backend.src.platform.api.auth import (
+    KeyHandler,
+    VerifiedKeyCache,
+    validate_api_key,
+    validate_api_key_async,
+)
+from backend.src.platform.db.schema import User
+from backend.src.platform.isolationEngine.async_session import (
+    AsyncSessionManager,
+    async_url,
+)
+
+
+@pytest.fixture
+def api_key(sessions):
+    with sessions.get_meta_session() as s:
+        name = uuid4().hex
+        user = User(email=f"{name}@x", username=name, password="-", name=name)
+        s.add(user)
+        s.commit()
+        user_id = user.id
+    return KeyHandler(sessions).create_api_key(user_id=user_id)
+
+
+def validate_async(engine, sessions, header, cache=None):
+    async def run():
+        manager = AsyncSessionManager(
+            create_async_engine(
+                async_url(engine.url.render_as_string(hide_password=False))
+            ),
+            sessions,
+        )
+        try:
+            async with manager.get_meta_session() as s:
+                return await validate_api_key_async(header, s, cache)
+        finally:
+            await manager.dispose()
+
+    return asyncio.run(run())
+
+
+def test_sync_and_async_validation_agree(engine, sessions, api_key):
+    header = f"ApiKey {api_key['token']}"
+    with sessions.get_meta_session() as s:
+        principal = validate_api_key(header, s)
+    assert principal["user_id"] == api_key["user_id"]
+    assert validate_async(engine, sessions, header) == principal
+
+    cache = VerifiedKeyCache()
+    assert validate_async(engine, sessions, header, cache) == principal
+    # the second call is answered from the cache
+    assert validate_async(engine, sessions, header, cache) == principal
+    assert cache.stats.hits == 1
+
+
+def test_wrong_and_revoked_keys_are_rejected(engine, sessions, api_key):
+    wrong = f"ApiKey ak_{api_key['key_id']}_not-the-secret"
+    with sessions.get_meta_session() as s:
+        with pytest.raises(PermissionError, match="invalid api key"):
+            validate_api_key(wrong, s)
+    with pytest.raises(PermissionError, match="invalid api key"):
+        validate_async(engine, sessions, wrong)
+    KeyHandler(sessions).revoke_api_key(api_key["key_id"])
+    with pytest.raises(PermissionError, match="invalid or expired"):
+        validate_async(engine, sessions, f"ApiKey {api_key['token']}")
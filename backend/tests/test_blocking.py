@@ -0,0 +1,32 @@
+import asyncio
+from threading import Event
+import pytest
+from backend.src.platform.api.blocking import BlockingExecutor
+
+
+def test_executor_bounds_its_queue_and_counts_waits():
+    executor = BlockingExecutor(max_workers=1, max_queue=1)
+    release = Event()
+
+    async def scenario():
+        busy = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.05)
+        queued = asyncio.ensure_future(executor.run(lambda: 42))
+        await asyncio.sleep(0.05)
+        with pytest.raises(RuntimeError, match="queue is full"):
+            await executor.run(lambda: 0)
+        # a caller cancelled while queued gives its slot back
+        queued.cancel()
+        await asyncio.sleep(0.05)
+        assert executor.stats.queued == 0
+        release.set()
+        await busy
+        return await executor.run(lambda: 7)
+
+    try:
+        assert asyncio.run(scenario()) == 7
+    finally:
+        executor.shutdown()
+    assert executor.stats.rejected == 1
+    assert executor.stats.completed == 2
+    assert executor.stats.max_queued == 1
@@ -0,0 +1,29 @@
+from sqlalchemy import create_engine, literal_column, select, text
+from backend.src.platform.isolationEngine.compiled_cache import CompiledCacheStats
+
+
+def test_counts_cached_statements():
+    engine = create_engine("sqlite://")
+    stats = CompiledCacheStats()
+    stats.attach(engine)
+    with engine.connect() as conn:
+        for n in range(3):
+            conn.execute(select(literal_column("1")).where(literal_column("1") > n))
+            conn.execute(text("SELECT 1"))
+            conn.exec_driver_sql("SELECT 1")
+    snapshot = stats.snapshot()
+    assert (snapshot.hits, snapshot.misses) == (4, 2)
+    assert snapshot.uncached == 3
+    assert snapshot.entries >= 2
+
+    stats.detach(engine)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    assert stats.snapshot().hits == 4
+
+
+def test_meta_session_executes_with_stats_attached(sessions):
+    with sessions.get_meta_session() as s:
+        assert s.execute(text("SELECT 1")).scalar() == 1
+        assert s.execute(text("SELECT 1")).scalar() == 1
+    assert sessions.compiled_cache.snapshot().hits >= 1
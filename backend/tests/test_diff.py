@@ -0,0 +1,70 @@
+from uuid import uuid4
+from sqlalchemy import text
+from backend.src.platform.evalutionEngine.diff import DiffEngine, DiffStats
+
+
+def test_diff_reports_row_changes_per_table(
+    engine, sessions, handler, template, schema
+):
+    handler.clone_template(template, schema)
+    with engine.begin() as conn:
+        conn.execute(text(f"UPDATE \"{schema}\".users SET name = 'X' WHERE id = 1"))
+        conn.execute(text(f'DELETE FROM "{schema}".messages WHERE id = 250'))
+        conn.execute(
+            text(f"INSERT INTO \"{schema}\".messages (user_id, body) VALUES (2, 'm')")
+        )
+    diff = DiffEngine(sessions, handler.template_cache, max_workers=2, bucket_rows=50)
+    stats = DiffStats()
+    try:
+        changes = sorted(
+            diff.diff(template, schema, stats=stats),
+            key=lambda c: (c.table, c.op),
+        )
+    finally:
+        diff.shutdown()
+
+    assert [(c.table, c.op, c.pk) for c in changes] == [
+        ("messages", "delete", {"id": 250}),
+        ("messages", "insert", {"id": 301}),
+        ("users", "update", {"id": 1}),
+    ]
+    update = changes[2]
+    assert update.before is not None and update.before["name"] == "user 1"
+    assert update.after is not None and update.after["name"] == "X"
+    # only the buckets holding the edited rows are fetched
+    assert stats.changed_buckets == 3
+    assert stats.changes["messages"] == {"insert": 1, "update": 0, "delete": 1}
+
+
+def test_diff_hashes_rows_without_a_hash_function(engine, sessions, handler, schema):
+    # json has no hash function and the key is not an integer, so this takes
+    # the text hash and hashed-bucket paths
+    template = f"tpl_{uuid4().hex[:12]}"
+    with engine.begin() as conn:
+        conn.execute(text(f'CREATE SCHEMA "{template}"'))
+        conn.execute(
+            text(f'CREATE TABLE "{template}".docs (key text PRIMARY KEY, body json)')
+        )
+        conn.execute(
+            text(
+                f'INSERT INTO "{template}".docs '
+                "SELECT 'k' || g, json_build_object('n', g) "
+                "FROM generate_series(1, 100) g"
+            )
+        )
+    diff = DiffEngine(sessions, handler.template_cache, bucket_rows=10)
+    try:
+        handler.clone_template(template, schema)
+        with engine.begin() as conn:
+            conn.execute(
+                text(
+                    f"UPDATE \"{schema}\".docs SET body = '{{\"n\": 0}}' "
+                    "WHERE key = 'k7'"
+                )
+            )
+        changes = list(diff.diff(template, schema))
+        assert [(c.op, c.pk) for c in changes] == [("update", {"key": "k7"})]
+    finally:
+        diff.shutdown()
+        with engine.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA "{template}" CASCADE'))
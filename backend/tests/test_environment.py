@@ -0,0 +1,265 @@
+from datetime import datetime
+from uuid import UUID, uuid4
+import pytest
+from sqlalchemy import select, text
+from backend.src.platform.db.schema import RunTimeEnvironment
+from backend.src.platform.isolationEngine.core import Core
+from backend.src.platform.isolationEngine.types import InitEnvRequest
+
+
+def count(engine, schema: str, table: str) -> int:
+    with engine.connect() as conn:
+        return conn.execute(text(f'SELECT count(*) FROM "{schema}"."{table}"')).scalar()
+
+
+def test_clone_template_copies_rows_by_fk_level(engine, handler, template, schema):
+    report = handler.clone_template(template, schema)
+    assert report.rows == {"users": 3, "messages": 300}
+    assert set(report.timings) == {"users", "messages"}
+    with engine.begin() as conn:
+        new_id = conn.execute(
+            text(
+                f'INSERT INTO "{schema}".messages (user_id, body) '
+                "VALUES (1, 'new') RETURNING id"
+            )
+        ).scalar()
+    assert new_id == 301
+    assert count(engine, template, "messages") == 300
+
+
+def test_fork_copies_parent_state_and_dirty_set(engine, handler, template, schema):
+    handler.clone_template(template, schema)
+    with engine.begin() as conn:
+        conn.execute(text(f"UPDATE \"{schema}\".users SET name = 'X' WHERE id = 1"))
+        conn.execute(
+            text(f"INSERT INTO \"{schema}\".messages (user_id, body) VALUES (1, 'm')")
+        )
+    children = [f"{schema}_fork{n}" for n in range(2)]
+    try:
+        reports = handler.fork_schema(schema, children)
+        assert [r.rows for r in reports] == [{"users": 3, "messages": 301}] * 2
+        for child in children:
+            with engine.begin() as conn:
+                assert conn.execute(
+                    text(f'SELECT name FROM "{child}".users WHERE id = 1')
+                ).scalar() == "X"
+                assert conn.execute(
+                    text(
+                        f'INSERT INTO "{child}".messages (user_id, body) '
+                        "VALUES (2, 'child') RETURNING id"
+                    )
+                ).scalar() == 302
+            assert handler.reset_schema(template, child) == ["users", "messages"]
+            assert count(engine, child, "messages") == 300
+        assert count(engine, schema, "messages") == 301
+    finally:
+        for child in children:
+            handler.drop_schema(child)
+
+
+def test_clone_keeps_generated_always_identity_values(engine, handler, schema):
+    template = f"tpl_{uuid4().hex[:12]}"
+    with engine.begin() as conn:
+        conn.execute(text(f'CREATE SCHEMA "{template}"'))
+        conn.execute(
+            text(
+                f'CREATE TABLE "{template}".items ('
+                "id integer GENERATED ALWAYS AS IDENTITY PRIMARY KEY, "
+                "name text NOT NULL)"
+            )
+        )
+        conn.execute(
+            text(
+                f'INSERT INTO "{template}".items (name) '
+                "SELECT 'item ' || g FROM generate_series(1, 5) g"
+            )
+        )
+        conn.execute(text(f'DELETE FROM "{template}".items WHERE id = 2'))
+    try:
+        assert handler.clone_template(template, schema).rows == {"items": 4}
+        with engine.begin() as conn:
+            ids = conn.execute(
+                text(f'SELECT id FROM "{schema}".items ORDER BY id')
+            ).scalars()
+            assert list(ids) == [1, 3, 4, 5]
+            assert conn.execute(
+                text(f"INSERT INTO \"{schema}\".items (name) VALUES ('n') RETURNING id")
+            ).scalar() == 6
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA "{template}" CASCADE'))
+
+
+def same_rows(engine, schema: str, template: str, table: str) -> bool:
+    with engine.connect() as conn:
+        return not conn.execute(
+            text(
+                f'(SELECT * FROM "{schema}"."{table}" '
+                f'EXCEPT ALL SELECT * FROM "{template}"."{table}") UNION ALL '
+                f'(SELECT * FROM "{template}"."{table}" '
+                f'EXCEPT ALL SELECT * FROM "{schema}"."{table}")'
+            )
+        ).first()
+
+
+EDITS = [
+    "UPDATE \"{s}\".users SET name = 'X' WHERE id = 1",
+    "INSERT INTO \"{s}\".users (name) VALUES ('new')",
+    "INSERT INTO \"{s}\".messages (user_id, body) VALUES (4, 'm')",
+    "UPDATE \"{s}\".messages SET user_id = 4 WHERE id = 7",
+    'DELETE FROM "{s}".messages WHERE id IN (3, 5)',
+]
+
+
+@pytest.mark.parametrize("journal", [True, False])
+def test_reset_restores_template_rows(engine, handler, template, schema, journal):
+    handler.clone_template(template, schema, journal=journal)
+    with engine.begin() as conn:
+        for edit in EDITS:
+            conn.execute(text(edit.format(s=schema)))
+    assert handler.reset_schema(template, schema) == ["users", "messages"]
+    for table in ("users", "messages"):
+        assert same_rows(engine, schema, template, table)
+    assert handler.reset_schema(template, schema) == []
+
+    # the dtu triggers are back on after the reset
+    with engine.begin() as conn:
+        conn.execute(text(f'DELETE FROM "{schema}".messages WHERE id = 1'))
+    assert handler.reset_schema(template, schema) == ["messages"]
+    assert count(engine, schema, "messages") == 300
+
+
+def test_reset_recopies_truncated_tables(engine, handler, template, schema):
+    handler.clone_template(template, schema)
+    with engine.begin() as conn:
+        conn.execute(text(f'TRUNCATE "{schema}".messages'))
+        conn.execute(
+            text(f"INSERT INTO \"{schema}\".messages (user_id, body) VALUES (1, 'm')")
+        )
+    assert handler.reset_schema(template, schema) == ["messages"]
+    assert same_rows(engine, schema, template, "messages")
+
+
+def test_fork_environment_registers_children_like_the_parent(
+    engine, sessions, handler, template, schema, monkeypatch
+):
+    handler.clone_template(template, schema)
+    parent_id, template_id = uuid4().hex, uuid4()
+    handler.set_runtime_environment(
+        environment_id=parent_id,
+        schema=schema,
+        template_id=template_id,
+        template_schema=template,
+        expires_at=None,
+        last_used_at=datetime.now(),
+        permanent=True,
+        max_idle_seconds=60,
+    )
+    core = Core(
+        token=sessions.token_handler, sessions=sessions, environment_handler=handler
+    )
+    result = core.fork_environment(parent_id, user_id="user", count=2)
+    ids = [UUID(child.environment_id) for child in result.environments]
+    with sessions.get_meta_session() as s:
+        children = s.scalars(
+            select(RunTimeEnvironment).where(RunTimeEnvironment.id.in_(ids))
+        ).all()
+    assert len(children) == 2
+    for child in children:
+        assert (child.templateId, child.permanent, child.maxIdleSeconds) == (
+            template_id,
+            True,
+            60,
+        )
+        handler.drop_schema(child.schema)
+
+    attempted = []
+
+    def fail(rows):
+        attempted.extend(row["schema"] for row in rows)
+        raise RuntimeError("registration failed")
+
+    monkeypatch.setattr(handler, "set_runtime_environments", fail)
+    with pytest.raises(RuntimeError):
+        core.fork_environment(parent_id, user_id="user", count=2)
+    assert len(attempted) == 2
+    with engine.connect() as conn:
+        assert not conn.execute(
+            text("SELECT count(*) FROM pg_namespace WHERE nspname = ANY(:names)"),
+            {"names": attempted},
+        ).scalar()
+
+
+def test_init_envs_batch_clones_and_registers_every_environment(
+    engine, sessions, handler, template, monkeypatch
+):
+    core = Core(
+        token=sessions.token_handler, sessions=sessions, environment_handler=handler
+    )
+    request = InitEnvRequest(environment_schema=template, user_id="user")
+    result = core.init_envs_batch(request, count=5, chunk_size=2)
+    ids = [UUID(env.environment_id) for env in result.environments]
+    with sessions.get_meta_session() as s:
+        schemas = s.scalars(
+            select(RunTimeEnvironment.schema).where(RunTimeEnvironment.id.in_(ids))
+        ).all()
+    try:
+        assert len(schemas) == 5
+        for name in schemas:
+            assert count(engine, name, "users") == 3
+            assert count(engine, name, "messages") == 300
+    finally:
+        for name in schemas:
+            handler.drop_schema(name)
+
+    attempted = []
+
+    def fail(rows):
+        attempted.extend(row["schema"] for row in rows)
+        raise RuntimeError("registration failed")
+
+    monkeypatch.setattr(handler, "set_runtime_environments", fail)
+    with pytest.raises(RuntimeError):
+        core.init_envs_batch(request, count=3, chunk_size=2)
+    assert len(attempted) == 3
+    with engine.connect() as conn:
+        assert not conn.execute(
+            text("SELECT count(*) FROM pg_namespace WHERE nspname = ANY(:names)"),
+            {"names": attempted},
+        ).scalar()
+
+
+def test_clone_template_with_shared_enum_and_percent_literals(engine, handler):
+    template = f"tpl_{uuid4().hex[:12]}"
+    enum = f"mood_{uuid4().hex[:8]}"
+    targets = [f"state_{uuid4().hex}" for _ in range(3)]
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE TYPE public.{enum} AS ENUM ('ok', 'sad')"))
+        conn.execute(text(f'CREATE SCHEMA "{template}"'))
+        conn.execute(
+            text(
+                f'CREATE TABLE "{template}".notes (id serial PRIMARY KEY, '
+                f"mood public.{enum} NOT NULL DEFAULT 'ok', "
+                "discount text NOT NULL DEFAULT '50%' "
+                "CHECK (discount LIKE '%\\%'))"
+            )
+        )
+        conn.execute(text(f'INSERT INTO "{template}".notes (mood) VALUES (\'sad\')'))
+    try:
+        handler.clone_template(template, targets[0])
+        handler.clone_template_many(template, targets[1:])
+        for target in targets:
+            assert count(engine, target, "notes") == 1
+            with engine.begin() as conn:
+                assert conn.execute(
+                    text(
+                        f'INSERT INTO "{target}".notes DEFAULT VALUES '
+                        "RETURNING discount"
+                    )
+                ).scalar() == "50%"
+    finally:
+        with engine.begin() as conn:
+            for target in targets:
+                conn.execute(text(f'DROP SCHEMA IF EXISTS "{target}" CASCADE'))
+            conn.execute(text(f'DROP SCHEMA "{template}" CASCADE'))
+            conn.execute(text(f"DROP TYPE public.{enum}"))
@@ -0,0 +1,66 @@
+from datetime import datetime
+from uuid import uuid4
+from sqlalchemy import text
+from backend.src.platform.isolationEngine.hibernation import HibernationManager
+
+
+def test_hibernate_skips_locked_schema_and_restores_its_own_ddl(
+    engine, sessions, handler, tmp_path
+):
+    template = f"tpl_{uuid4().hex[:12]}"
+    environment_id = uuid4().hex
+    schema = f"state_{environment_id}"
+    with engine.begin() as conn:
+        conn.execute(text(f'CREATE SCHEMA "{template}"'))
+        conn.execute(
+            text(
+                f'CREATE TABLE "{template}".items '
+                "(id serial PRIMARY KEY, name text NOT NULL)"
+            )
+        )
+        conn.execute(
+            text(f"INSERT INTO \"{template}\".items (name) VALUES ('a'), ('b')")
+        )
+    hibernation = HibernationManager(
+        sessions, handler, directory=str(tmp_path), lock_timeout_ms=100
+    )
+    try:
+        handler.clone_template(template, schema)
+        handler.set_runtime_environment(
+            environment_id=environment_id,
+            schema=schema,
+            template_schema=template,
+            expires_at=None,
+            last_used_at=datetime.now(),
+        )
+        with engine.connect() as holder:
+            holder.execute(text(f"UPDATE \"{schema}\".items SET name = 'x'"))
+            assert not hibernation.hibernate(environment_id)
+            holder.rollback()
+        assert hibernation.stats.skipped == 1
+
+        with engine.begin() as conn:
+            conn.execute(text(f"UPDATE \"{schema}\".items SET name = 'z' WHERE id = 2"))
+        assert hibernation.hibernate(environment_id)
+        with engine.begin() as conn:
+            conn.execute(
+                text(
+                    f'ALTER TABLE "{template}".items '
+                    "ADD COLUMN extra integer NOT NULL DEFAULT 0"
+                )
+            )
+
+        assert hibernation.restore(environment_id)
+        with engine.connect() as conn:
+            rows = conn.execute(
+                text(f'SELECT * FROM "{schema}".items ORDER BY id')
+            ).all()
+            dirty = conn.execute(
+                text(f'SELECT "table" FROM "{schema}".dtu_dirty_tables')
+            ).scalars()
+            assert list(dirty) == ["items"]
+        assert [tuple(row) for row in rows] == [(1, "a"), (2, "z")]
+    finally:
+        handler.drop_schema(schema)
+        with engine.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA "{template}" CASCADE'))
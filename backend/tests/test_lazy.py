@@ -0,0 +1,47 @@
+import pytest
+from sqlalchemy import exc, text
+
+
+def relkinds(engine, schema: str) -> dict[str, str]:
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                "SELECT c.relname, c.relkind FROM pg_class c "
+                "JOIN pg_namespace n ON n.oid = c.relnamespace "
+                "WHERE n.nspname = :schema AND c.relkind IN ('r', 'v')"
+            ),
+            {"schema": schema},
+        )
+        return dict(rows.tuples().all())
+
+
+def test_lazy_schema_materializes_on_first_write(
+    engine, handler, sessions, template, schema
+):
+    handler.create_lazy_schema(template, schema)
+    assert relkinds(engine, schema) == {"users": "v", "messages": "v"}
+
+    with pytest.raises(exc.InternalError, match="is not materialized"):
+        with engine.begin() as conn:
+            conn.execute(text(f'DELETE FROM "{schema}".messages'))
+
+    with engine.begin() as conn:
+        assert sessions.lazy.materialize(conn, template, schema, "messages")
+        conn.execute(text(f'DELETE FROM "{schema}".messages WHERE id > 100'))
+        new_id = conn.execute(
+            text(
+                f'INSERT INTO "{schema}".messages (user_id, body) '
+                "VALUES (1, 'new') RETURNING id"
+            )
+        ).scalar()
+    assert new_id == 301
+    assert relkinds(engine, schema) == {"users": "v", "messages": "r"}
+    with engine.connect() as conn:
+        counts = [
+            conn.execute(text(f'SELECT count(*) FROM "{s}".messages')).scalar()
+            for s in (schema, template)
+        ]
+    assert counts == [101, 300]
+
+    assert handler.reset_lazy_schema(template, schema) == ["messages"]
+    assert relkinds(engine, schema) == {"users": "v", "messages": "v"}
@@ -0,0 +1,33 @@
+from uuid import uuid4
+from backend.src.platform.db.schema import TemplateEnvironment
+from backend.src.platform.isolationEngine.pool import WarmPoolManager
+
+
+def add_template(sessions, kind: str) -> str:
+    location = f"tpl_{uuid4().hex[:12]}"
+    with sessions.get_meta_session() as s:
+        s.add(
+            TemplateEnvironment(
+                service="linear", name=location, kind=kind, location=location
+            )
+        )
+        s.commit()
+    return location
+
+
+def test_claim_ignores_templates_that_are_never_pooled(sessions, handler):
+    pool = WarmPoolManager(sessions, handler)
+    refills = []
+    pool.refill = refills.append
+    try:
+        database = add_template(sessions, "database")
+        assert pool.claim(database, expires_at=None) is None
+        assert database not in pool.stats
+
+        schema = add_template(sessions, "schema")
+        assert pool.claim(schema, expires_at=None) is None
+        pool.executor.shutdown(wait=True)
+        assert pool.stats[schema].misses == 1
+        assert refills == [schema]
+    finally:
+        pool.shutdown()
@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+from uuid import UUID, uuid4
+import pytest
+from sqlalchemy import select, text
+from backend.src.platform.db.schema import IDLE_DEADLINE, RunTimeEnvironment
+from backend.src.platform.isolationEngine.database import DatabaseHandler
+from backend.src.platform.isolationEngine.reaper import EnvironmentReaper
+
+
+@pytest.fixture
+def reaper(sessions):
+    return EnvironmentReaper(
+        sessions, DatabaseHandler(sessions), drops_per_second=1000, lock_timeout_ms=100
+    )
+
+
+def add_environment(sessions, **values) -> str:
+    env_id = uuid4()
+    with sessions.get_meta_session() as s:
+        s.add(
+            RunTimeEnvironment(
+                id=env_id, schema=f"state_{env_id.hex}", status="ready", **values
+            )
+        )
+        s.commit()
+    return env_id.hex
+
+
+def statuses(sessions, env_ids: list[str]) -> list[str]:
+    with sessions.get_meta_session() as s:
+        rows = s.execute(
+            select(RunTimeEnvironment.id, RunTimeEnvironment.status).where(
+                RunTimeEnvironment.id.in_([UUID(i) for i in env_ids])
+            )
+        ).all()
+    found = {env_id.hex: status for env_id, status in rows}
+    return [found[i] for i in env_ids]
+
+
+def test_expire_by_deadline_and_idle_time(sessions, reaper):
+    past = datetime.now() - timedelta(hours=1)
+    env_ids = [
+        add_environment(sessions, expiresAt=past),
+        add_environment(sessions, lastUsedAt=past, maxIdleSeconds=60),
+        add_environment(sessions, lastUsedAt=past, maxIdleSeconds=7200),
+        add_environment(sessions, lastUsedAt=past),
+        add_environment(sessions, expiresAt=past, permanent=True),
+    ]
+    assert reaper.expire() >= 2
+    assert statuses(sessions, env_ids) == [
+        "expired",
+        "expired",
+        "ready",
+        "ready",
+        "ready",
+    ]
+
+
+def test_idle_condition_uses_deadline_index(engine):
+    with engine.begin() as conn:
+        conn.execute(text("SET LOCAL enable_seqscan = off"))
+        plan = "\n".join(
+            conn.execute(
+                text(
+                    "EXPLAIN SELECT id FROM meta.run_time_environments "
+                    "WHERE status IN ('ready', 'hibernated') "
+                    f"AND {IDLE_DEADLINE} < now()::timestamp"
+                )
+            ).scalars()
+        )
+    assert "ix_run_time_environments_idle_deadline" in plan
+    assert "Index Cond" in plan and "make_interval" in plan.split("Index Cond")[1]
+
+
+def test_drop_skips_locked_schema_until_released(engine, sessions, reaper):
+    env_id = add_environment(sessions)
+    schema = f"state_{env_id}"
+    with engine.begin() as conn:
+        conn.execute(text(f'CREATE SCHEMA "{schema}"'))
+        conn.execute(text(f'CREATE TABLE "{schema}".t (id int)'))
+    with sessions.get_meta_session() as s:
+        s.execute(
+            text(
+                "UPDATE meta.run_time_environments SET status = 'expired' "
+                "WHERE id = :id"
+            ),
+            {"id": env_id},
+        )
+        s.commit()
+
+    with engine.connect() as holder:
+        holder.execute(text(f'LOCK TABLE "{schema}".t IN ACCESS SHARE MODE'))
+        reaper.drop_expired()
+        assert reaper.stats.skipped == 1
+        holder.rollback()
+
+    reaper.drop_expired()
+    assert statuses(sessions, [env_id]) == ["deleted"]
+    with engine.connect() as conn:
+        exists = conn.execute(text("SELECT to_regnamespace(:s)"), {"s": schema})
+        assert exists.scalar() is None
@@ -0,0 +1,20 @@
+from sqlalchemy import text
+from backend.src.platform.isolationEngine.routing import InvalidationListener
+
+
+def test_listener_delivers_notifications_and_reconnects(engine):
+    received, reconnects = [], []
+    listener = InvalidationListener(engine, poll_seconds=0.5)
+    listener.subscribe("dtu_test", received.append, lambda: reconnects.append(1))
+    try:
+        assert listener.listen_once() == 0
+        with engine.begin() as conn:
+            conn.execute(text("SELECT pg_notify('dtu_test', 'a')"))
+        assert listener.listen_once() == 1
+        assert received == ["a"]
+
+        listener.close()
+        listener.listen_once()
+        assert len(reconnects) == 2
+    finally:
+        listener.close()
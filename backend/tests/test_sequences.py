@@ -0,0 +1,27 @@
+from sqlalchemy import text
+from backend.src.platform.isolationEngine.sequences import reset_sequences_many
+
+
+def test_reset_sequences_advances_past_column_max(engine, schema):
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                f'CREATE SCHEMA "{schema}";'
+                f'CREATE TABLE "{schema}".serials (id serial PRIMARY KEY);'
+                f'CREATE TABLE "{schema}".idents '
+                "(id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY);"
+                f'CREATE TABLE "{schema}".empty (id serial PRIMARY KEY);'
+                f'INSERT INTO "{schema}".serials (id) VALUES (41);'
+                f'INSERT INTO "{schema}".idents (id) VALUES (7)'
+            )
+        )
+        reset_sequences_many(conn, [schema, "no_such_schema"])
+        next_ids = [
+            conn.execute(
+                text(f'INSERT INTO "{schema}"."{table}" DEFAULT VALUES RETURNING id')
+            ).scalar()
+            for table in ("serials", "idents", "empty")
+        ]
+    assert next_ids == [42, 8, 1]
+    with engine.begin() as conn:
+        reset_sequences_many(conn, ["no_such_schema"])
@@ -0,0 +1,72 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from uuid import uuid4
+from sqlalchemy import create_engine, text
+from backend.src.platform.db.schema import RunTimeEnvironment
+from backend.src.platform.isolationEngine.auth import TokenHandler
+from backend.src.platform.isolationEngine.routing import RouteCache
+from backend.src.platform.isolationEngine.session import SessionManager
+
+
+def test_search_path_routing_does_not_leak_between_environments(
+    engine, handler, template, schema
+):
+    schemas = [f"{schema}_{n}" for n in range(2)]
+    # two pooled connections shared by every environment and thread
+    pooled = create_engine(engine.url, pool_size=2, max_overflow=0)
+    sessions = SessionManager(
+        pooled, TokenHandler(secret="test"), routing="search_path"
+    )
+    try:
+        for n, name in enumerate(schemas):
+            handler.clone_template(template, name)
+            with engine.begin() as conn:
+                conn.execute(
+                    text(f"UPDATE \"{name}\".users SET name = :name WHERE id = 1"),
+                    {"name": name},
+                )
+
+        def read(n: int) -> tuple[str, str]:
+            name = schemas[n % 2]
+            with sessions.get_schema_factory(name)() as s:
+                return name, s.execute(
+                    text("SELECT name FROM users WHERE id = 1")
+                ).scalar_one()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(read, range(400)))
+        assert all(expected == seen for expected, seen in results)
+
+        with pooled.connect() as conn:
+            # the setting ends with each transaction
+            assert schema not in conn.execute(text("SHOW search_path")).scalar_one()
+        with sessions.get_schema_factory(schemas[0])() as s:
+            # extension functions and types in public stay reachable
+            assert s.execute(text("SHOW search_path")).scalar_one().endswith("public")
+    finally:
+        for name in schemas:
+            handler.drop_schema(name)
+        pooled.dispose()
+
+
+def test_cached_lookup_refreshes_last_used_without_a_flusher(engine, handler):
+    sessions = SessionManager(
+        engine, TokenHandler(secret="test"), routes=RouteCache(ttl_seconds=60)
+    )
+    environment_id = uuid4().hex
+    stale = datetime.now() - timedelta(hours=1)
+    handler.set_runtime_environment(
+        environment_id=environment_id,
+        schema=f"state_{environment_id}",
+        expires_at=None,
+        last_used_at=stale,
+    )
+    sessions.lookup_environment(environment_id)
+    with sessions.get_meta_session() as s:
+        s.get_one(RunTimeEnvironment, environment_id).lastUsedAt = stale
+        s.commit()
+
+    sessions.lookup_environment(environment_id)
+    assert sessions.routes is not None and sessions.routes.hits == 1
+    with sessions.get_meta_session() as s:
+        assert s.get_one(RunTimeEnvironment, environment_id).lastUsedAt > stale
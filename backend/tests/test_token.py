@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from backend.src.platform.db.schema import RevokedToken
+from backend.src.platform.isolationEngine.auth import TokenHandler
+from backend.src.platform.isolationEngine.core import Core
+from backend.src.platform.isolationEngine.environment import EnvironmentHandler
+from backend.src.platform.isolationEngine.session import SessionManager
+
+
+def build_core(engine) -> Core:
+    # a fresh worker: its own TokenHandler with nothing revoked in memory
+    token = TokenHandler(secret="test")
+    sessions = SessionManager(engine, token)
+    handler = EnvironmentHandler(token_handler=token, session_manager=sessions)
+    return Core(token=token, sessions=sessions, environment_handler=handler)
+
+
+def issue(core: Core) -> str:
+    return core.token.issue_token(
+        environment_id="env", user_id="user", impersonate_user_id=None
+    )
+
+
+def test_revoked_tokens_survive_a_restart(engine):
+    first = build_core(engine)
+    revoked, kept = issue(first), issue(first)
+    first.revoke_token(revoked)
+    with pytest.raises(PermissionError):
+        first.token.decode_token(revoked)
+
+    second = build_core(engine)
+    assert second.token.decode_token(revoked)["sub"] == "user"
+    second.load_revoked_tokens()
+    with pytest.raises(PermissionError):
+        second.token.decode_token(revoked)
+    assert second.token.decode_token(kept)["sub"] == "user"
+
+
+def test_expired_revocations_are_ignored_and_pruned(engine):
+    core = build_core(engine)
+    with core.sessions.get_meta_session() as s:
+        s.add(
+            RevokedToken(
+                jti="expired", expiresAt=datetime.now() - timedelta(minutes=1)
+            )
+        )
+        s.commit()
+
+    core.load_revoked_tokens()
+    assert "expired" not in core.token._revoked
+
+    core.revoke_token(issue(core))
+    with core.sessions.get_meta_session() as s:
+        assert s.get(RevokedToken, "expired") is None
+        assert s.scalars(select(RevokedToken.jti)).all()
+
+
+def test_revoke_is_idempotent_and_waits_for_commit(engine, monkeypatch):
+    core = build_core(engine)
+    token = issue(core)
+    core.revoke_token(token)
+    core.revoke_token(token)
+    with pytest.raises(PermissionError):
+        core.token.decode_token(token)
+
+    pending = issue(core)
+    jti = core.token.decode_token(pending)["jti"]
+
+    def fail(self):
+        raise RuntimeError("commit failed")
+
+    monkeypatch.setattr(Session, "commit", fail)
+    with pytest.raises(RuntimeError):
+        core.revoke_token(pending)
+    monkeypatch.undo()
+    assert jti not in core.token._revoked
+    assert core.token.decode_token(pending)["jti"] == jti
+    with core.sessions.get_meta_session() as s:
+        assert s.get(RevokedToken, jti) is None
@@ -0,0 +1,74 @@
+import json
+from datetime import datetime
+from uuid import uuid4
+from sqlalchemy import text
+from backend.src.platform.isolationEngine.core import Core
+
+
+def change(engine, schema: str) -> None:
+    with engine.begin() as conn:
+        conn.execute(
+            text(f"INSERT INTO \"{schema}\".users (name) VALUES ('new user')")
+        )
+        conn.execute(text(f"UPDATE \"{schema}\".users SET name = 'X' WHERE id = 1"))
+        conn.execute(text(f'DELETE FROM "{schema}".messages WHERE id = 7'))
+
+
+def test_journal_records_row_payloads(engine, handler, template, schema):
+    handler.clone_template(template, schema)
+    change(engine, schema)
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                f'SELECT "table", op, pk, old, new FROM "{schema}".dtu_journal '
+                "ORDER BY id"
+            )
+        ).all()
+    assert [(r.table, r.op, r.pk) for r in rows] == [
+        ("users", "INSERT", {"id": 4}),
+        ("users", "UPDATE", {"id": 1}),
+        ("messages", "DELETE", {"id": 7}),
+    ]
+    inserted, updated, deleted = rows
+    assert inserted.old is None
+    assert inserted.new == {"id": 4, "name": "new user"}
+    assert updated.old == {"id": 1, "name": "user 1"}
+    assert updated.new == {"id": 1, "name": "X"}
+    assert deleted.old == {"id": 7, "user_id": 2, "body": "message 7"}
+    assert deleted.new is None
+
+
+def test_stream_changes_resumes_after_cursor(engine, sessions, handler, template):
+    core = Core(
+        token=sessions.token_handler, sessions=sessions, environment_handler=handler
+    )
+    environment_id = uuid4().hex
+    schema = f"state_{environment_id}"
+    handler.clone_template(template, schema)
+    handler.set_runtime_environment(
+        environment_id=environment_id,
+        schema=schema,
+        template_id=None,
+        template_schema=template,
+        expires_at=None,
+        last_used_at=datetime.now(),
+    )
+    try:
+        change(engine, schema)
+        entries = [json.loads(line) for line in core.stream_changes(environment_id)]
+        assert [(e["table"], e["op"]) for e in entries] == [
+            ("users", "INSERT"),
+            ("users", "UPDATE"),
+            ("messages", "DELETE"),
+        ]
+        ids = [e["id"] for e in entries]
+        assert ids == sorted(ids)
+
+        rest = [
+            json.loads(line) for line in core.stream_changes(environment_id, ids[0])
+        ]
+        assert [e["id"] for e in rest] == ids[1:]
+        assert rest[0]["new"] == {"id": 1, "name": "X"}
+        assert not list(core.stream_changes(environment_id, ids[-1]))
+    finally:
+        handler.drop_schema(schema)